@@ -1,20 +1,141 @@
 from __future__ import annotations
 from dataclasses import dataclass, field
-from typing import Deque
+from typing import Callable, Deque, Optional
 from collections import deque
+import functools
+import os
+
+import yaml
+
+QUANT_CONFIG_PATH = os.path.join(os.path.dirname(__file__), "quantization_config.yaml")
+
+TokenCounter = Callable[[str], int]
+Summarizer = Callable[[str, list[tuple[str, str]]], str]
+
+
+@dataclass(frozen=True)
+class ContextBudget:
+    """Token budgets of a quantization profile (see quantization_config.yaml)."""
+    profile: str
+    context: int
+    history: int
+    evidence: int
+    output: int
+
+
+@functools.lru_cache(maxsize=8)
+def _read_budget(path: str, profile: Optional[str]) -> ContextBudget:
+    with open(path, "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f) or {}
+    name = profile or cfg.get("active_profile") or next(iter(cfg.get("profiles", {})), "default")
+    prof = (cfg.get("profiles") or {}).get(name, {})
+    context = int(prof.get("context", 8192))
+    budget = prof.get("budget") or {}
+    return ContextBudget(
+        profile=name,
+        context=context,
+        history=int(budget.get("history", context // 4)),
+        evidence=int(budget.get("evidence", context // 4)),
+        output=int(budget.get("output", context // 8)),
+    )
+
+
+def load_context_budget(profile: Optional[str] = None, path: Optional[str] = None) -> ContextBudget:
+    """Budget of `profile` (default SIA_QUANT_PROFILE, then the file's `active_profile`)."""
+    return _read_budget(path or QUANT_CONFIG_PATH, profile or os.getenv("SIA_QUANT_PROFILE"))
+
+
+def default_token_counter() -> TokenCounter:
+    from .model_loader import load_inference_client
+    return load_inference_client().count_tokens
+
+
+@dataclass
+class Turn:
+    role: str
+    content: str
+    rendered: str
+    tokens: int
+
 
 @dataclass
 class ContextManager:
+    """
+    Conversation history bounded by tokens (`max_tokens`, default the profile's
+    history budget) as well as by `max_turns`. Each turn is rendered and counted
+    with the model tokenizer once, when added; the transcript is kept as a
+    running string and token total, so adding or evicting a turn costs O(1)
+    tokenizer calls instead of re-rendering the whole session. Evicted turns are
+    dropped, or folded into a running summary when a `summarizer` is given.
+    """
     max_turns: int = 24
-    turns: Deque[tuple[str, str]] = field(default_factory=deque)
+    max_tokens: Optional[int] = None
+    summarizer: Optional[Summarizer] = None
+    token_counter: Optional[TokenCounter] = None
+    turns: Deque[Turn] = field(default_factory=deque)
+    summary: str = ""
+
+    def __post_init__(self):
+        if self.max_tokens is None:
+            self.max_tokens = load_context_budget().history
+        self._text = ""
+        self._tokens = 0
+        self._summary_turn: Optional[Turn] = None
+
+    def _count(self, text: str) -> int:
+        if self.token_counter is None:
+            self.token_counter = default_token_counter()
+        return self.token_counter(text)
+
+    def _make_turn(self, role: str, content: str) -> Turn:
+        rendered = f"[{role.upper()}]\n{content.strip()}\n"
+        return Turn(role, content, rendered, self._count(rendered))
+
+    @property
+    def tokens(self) -> int:
+        """Tokens of the rendered history, including the summary."""
+        return self._tokens + (self._summary_turn.tokens if self._summary_turn else 0)
 
     def add(self, role: str, content: str) -> None:
-        self.turns.append((role, content))
-        while len(self.turns) > self.max_turns:
-            self.turns.popleft()
+        turn = self._make_turn(role, content)
+        self.turns.append(turn)
+        self._text = turn.rendered if len(self.turns) == 1 else self._text + "\n" + turn.rendered
+        self._tokens += turn.tokens
+        evicted = []
+        while len(self.turns) > 1 and (len(self.turns) > self.max_turns or self.tokens > self.max_tokens):
+            evicted.append(self._evict())
+        if evicted and self.summarizer is not None:
+            self._summarize(evicted)
+
+    def _evict(self) -> Turn:
+        turn = self.turns.popleft()
+        self._text = self._text[len(turn.rendered) + 1:] if self.turns else ""
+        self._tokens -= turn.tokens
+        return turn
+
+    def _summarize(self, evicted: list[Turn]) -> None:
+        try:
+            self.summary = self.summarizer(self.summary, [(t.role, t.content) for t in evicted]).strip()
+        except Exception as e:
+            print(f"History summarization failed: {e}. Dropping evicted turns.")
+            return
+        self._summary_turn = self._make_turn("summary", self.summary) if self.summary else None
+        # The summary must fit as well: turns it displaces are dropped, never the newest one.
+        while len(self.turns) > 1 and self.tokens > self.max_tokens:
+            self._evict()
 
     def render(self) -> str:
-        out = []
-        for role, content in self.turns:
-            out.append(f"[{role.upper()}]\n{content.strip()}\n")
-        return "\n".join(out).strip()
+        if self._summary_turn is None:
+            return self._text.strip()
+        return (self._summary_turn.rendered + "\n" + self._text).strip()
+
+
+def llm_summarizer(summary: str, turns: list[tuple[str, str]]) -> str:
+    """Summarizer for ContextManager backed by the shared LLM client."""
+    from .model_loader import LLM_CLIENT
+    transcript = "\n".join(f"{role}: {content}" for role, content in turns)
+    prompt = (
+        "Summarize the conversation so far in a few sentences, keeping facts, decisions and open questions.\n"
+        f"Previous summary: {summary or '(none)'}\n\nNew turns:\n{transcript}\n\nSummary:"
+    )
+    return LLM_CLIENT.get_completion(prompt, max_tokens=200, temperature=0.2, stop=[])
@@ -0,0 +1,128 @@
+from __future__ import annotations
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Sequence
+
+import numpy as np
+import requests
+
+from sia.tracing import span
+from .model_loader import InferenceClient, load_inference_client
+
+EMBED_DIM = int(os.getenv("SIA_EMBED_DIM", "384"))
+
+
+def content_hash(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+def embed_deterministic(text: str, dim: int = EMBED_DIM) -> np.ndarray:
+    """Offline fallback: a unit vector seeded by the text hash (stable, not semantic)."""
+    h = content_hash(text)
+    rng = np.random.default_rng(int.from_bytes(h[:8], "little"))
+    v = rng.standard_normal(dim).astype(np.float32)
+    v /= max(float(np.linalg.norm(v)), 1e-6)
+    return v
+
+
+class EmbeddingClient:
+    """
+    Batched embeddings from llama.cpp's `/embedding` endpoint (server started with
+    `--embedding`). Results are L2-normalized, cached by content hash and returned
+    as C-contiguous float32 matrices of shape (n, dim). Offline (mock mode, no URL,
+    or SIA_EMBED_BACKEND=deterministic) the deterministic fallback is used.
+    """
+    def __init__(self, client: Optional[InferenceClient] = None, dim: int = EMBED_DIM,
+                 batch_size: Optional[int] = None, cache_size: Optional[int] = None):
+        self.client = client or load_inference_client()
+        self.dim = dim
+        self.batch_size = batch_size or int(os.getenv("SIA_EMBED_BATCH_SIZE", "32"))
+        self.cache_size = cache_size if cache_size is not None else int(os.getenv("SIA_EMBED_CACHE_SIZE", "8192"))
+        self.deterministic = self.client.offline or os.getenv("SIA_EMBED_BACKEND", "") == "deterministic"
+        self._cache: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        with span("embed", rows=len(texts)) as s:
+            out, misses = self._embed(texts)
+            s.set("cache.misses", misses)
+            s.set("cache.hits", len(texts) - misses)
+            return out
+
+    def _embed(self, texts: Sequence[str]) -> tuple[np.ndarray, int]:
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        keys = [content_hash(t) for t in texts]
+        missing: dict[bytes, list[int]] = {}
+        with self._lock:
+            for i, k in enumerate(keys):
+                row = self._cache.get(k)
+                if row is None:
+                    missing.setdefault(k, []).append(i)
+                else:
+                    self._cache.move_to_end(k)
+                    out[i] = row
+        misses = sum(len(idx) for idx in missing.values())
+        if not missing:
+            return out, misses
+
+        todo = [texts[idx[0]] for idx in missing.values()]
+        vecs, cacheable = self._compute(todo)
+        with self._lock:
+            for (k, idx), v in zip(missing.items(), vecs):
+                out[idx] = v
+                if cacheable and self.cache_size > 0:
+                    self._cache[k] = v
+                    while len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+        return out, misses
+
+    def embed_one(self, text: str) -> np.ndarray:
+        return self.embed([text])[0]
+
+    def _compute(self, texts: list[str]) -> tuple[np.ndarray, bool]:
+        if self.deterministic:
+            return np.stack([embed_deterministic(t, self.dim) for t in texts]), True
+        try:
+            parts = [self._fetch(texts[i:i + self.batch_size]) for i in range(0, len(texts), self.batch_size)]
+            return np.concatenate(parts), True
+        except requests.exceptions.RequestException as e:
+            print(f"Embedding server request failed: {e}. Falling back to deterministic embeddings.")
+            return np.stack([embed_deterministic(t, self.dim) for t in texts]), False
+
+    def _fetch(self, batch: list[str]) -> np.ndarray:
+        response = self.client.session.post(
+            self.client.endpoint("embedding"),
+            json={"content": batch},
+            timeout=(self.client.connect_timeout, self.client.default_deadline_s),
+        )
+        response.raise_for_status()
+        data = response.json()
+        items = data if isinstance(data, list) else data.get("data") or [data]
+        items = sorted(items, key=lambda it: it.get("index", 0))
+        mat = np.empty((len(batch), self.dim), dtype=np.float32)
+        for row, it in enumerate(items):
+            v = np.asarray(it["embedding"], dtype=np.float32)
+            if v.ndim == 2:
+                # Unpooled (per-token) output: mean-pool into one vector.
+                v = v.mean(axis=0)
+            if v.shape[0] != self.dim:
+                raise ValueError(f"Embedding server returned dim {v.shape[0]}, expected {self.dim} (set SIA_EMBED_DIM).")
+            mat[row] = v
+        mat /= np.maximum(np.linalg.norm(mat, axis=1, keepdims=True), 1e-6)
+        return mat
+
+
+_EMBEDDER: Optional[EmbeddingClient] = None
+_EMBEDDER_LOCK = threading.Lock()
+
+
+def load_embedder() -> EmbeddingClient:
+    """Returns the process-wide embedding client, creating it on first use."""
+    global _EMBEDDER
+    if _EMBEDDER is None:
+        with _EMBEDDER_LOCK:
+            if _EMBEDDER is None:
+                _EMBEDDER = EmbeddingClient()
+    return _EMBEDDER
@@ -1,7 +1,307 @@
 from __future__ import annotations
+import contextvars
+import json
 import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
 import requests
-from typing import Any, Dict, List, Optional
+from requests.adapters import HTTPAdapter
+
+from sia.tracing import record_llm_timings, span, traced
+from .prompt_cache import CompletionCache, SlotAffinity
+
+TokenCallback = Callable[[str], Any]
+
+# Consumer of streamed tokens for the current request context (CLI / UI renderer).
+_TOKEN_SINK: contextvars.ContextVar[Optional[TokenCallback]] = contextvars.ContextVar("sia_token_sink", default=None)
+
+
+@contextmanager
+def token_sink(callback: TokenCallback) -> Iterator[None]:
+    """Routes tokens of streaming completions issued inside the block to `callback`."""
+    tok = _TOKEN_SINK.set(callback)
+    try:
+        yield
+    finally:
+        _TOKEN_SINK.reset(tok)
+
+
+@dataclass
+class InferenceRequest:
+    prompt: str
+    max_tokens: int = 512
+    temperature: float = 0.7
+    stop: List[str] = field(default_factory=list)
+    stream: bool = False
+    deadline_s: Optional[float] = None
+    on_token: Optional[TokenCallback] = None
+    cancel: Optional[threading.Event] = None
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) used when no tokenizer is reachable."""
+    return (len(text) + 3) // 4
+
+
+def _mock_completion(prompt: str) -> str:
+    """Provides a deterministic mock response for testing."""
+    print("--- MOCK LLM INFERENCE ---")
+    if "plan the following" in prompt.lower():
+        return "Plan: 1. Retrieve data. 2. Analyze data. 3. Formulate response."
+    elif "summarize" in prompt.lower():
+        return "Summary: The user is testing the SIA system's mock LLM functionality."
+    elif "respond to the user" in prompt.lower():
+        return f"Hello! I am the Strategic Insider Assistant (SIA). Your query was: '{prompt[:50]}...'. I am currently running in mock mode."
+    else:
+        return f"Mock response for prompt: {prompt[:50]}..."
+
+
+class InferenceClient:
+    """
+    Keep-alive client for the llama.cpp server. A single pooled `requests.Session`
+    is shared by all callers, completions can be streamed token by token over the
+    server's SSE `/completion` stream, and every request carries a wall-clock deadline.
+    Finished completions are memoized in a CompletionCache, and prompts starting with
+    a registered shared prefix are pinned to a warm server slot.
+    """
+    def __init__(self, url: Optional[str] = None, pool_size: Optional[int] = None,
+                 connect_timeout: Optional[float] = None, default_deadline_s: Optional[float] = None):
+        self.url = url or os.getenv("LLAMA_CPP_URL")
+        self.is_mock = os.getenv("SIA_MOCK_LLM", "False").lower() in ('true', '1', 't')
+        self.connect_timeout = connect_timeout or float(os.getenv("SIA_LLM_CONNECT_TIMEOUT_S", "3.05"))
+        self.default_deadline_s = default_deadline_s or float(os.getenv("SIA_LLM_DEADLINE_S", "120"))
+        pool_size = pool_size or int(os.getenv("SIA_LLM_POOL_SIZE", "8"))
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+
+        self.model_id = os.getenv("SIA_MODEL_ID") or self.url or "mock"
+        self.cache = CompletionCache.from_env()
+        # Sized from the server's /props on first use (see _acquire_slot).
+        self.slots = SlotAffinity()
+        self._slots_probed = False
+        self._slots_lock = threading.Lock()
+
+    @property
+    def offline(self) -> bool:
+        return self.is_mock or not self.url
+
+    def endpoint(self, name: str) -> str:
+        # LLAMA_CPP_URL conventionally points at /completion; other endpoints share its base.
+        return self.url.replace("/completion", "").rstrip("/") + "/" + name.lstrip("/")
+
+    def register_prefix(self, prefix: str) -> None:
+        """Declares a prompt prefix shared by many requests (e.g. a system prompt)."""
+        self.slots.register_prefix(prefix)
+
+    def server_slots(self) -> int:
+        """
+        Slot count of the llama.cpp server: `total_slots` from `/props`, else
+        SIA_LLAMA_SLOTS, else 0 (unknown, so requests are never pinned).
+        """
+        try:
+            response = self.session.get(self.endpoint("props"), timeout=(self.connect_timeout, 5))
+            response.raise_for_status()
+            return int(response.json()["total_slots"])
+        except (requests.exceptions.RequestException, ValueError, KeyError, TypeError) as e:
+            fallback = os.getenv("SIA_LLAMA_SLOTS")
+            print(f"Could not read total_slots from the LLM server ({e}); "
+                  f"{'using SIA_LLAMA_SLOTS=' + fallback if fallback else 'slot pinning disabled'}.")
+            return int(fallback) if fallback else 0
+
+    def _acquire_slot(self, prompt: str) -> Optional[int]:
+        if not self._slots_probed:
+            with self._slots_lock:
+                if not self._slots_probed:
+                    self.slots.resize(self.server_slots())
+                    self._slots_probed = True
+        return self.slots.acquire(prompt)
+
+    def cache_stats(self) -> Dict[str, int]:
+        return self.cache.stats()
+
+    def count_tokens(self, text: str) -> int:
+        """Token count from the model's tokenizer (`/tokenize`); estimated when offline or on failure."""
+        if self.offline or not text:
+            return estimate_tokens(text)
+        try:
+            response = self.session.post(
+                self.endpoint("tokenize"),
+                json={"content": text},
+                timeout=(self.connect_timeout, 10),
+            )
+            response.raise_for_status()
+            return len(response.json().get("tokens", []))
+        except (requests.exceptions.RequestException, ValueError):
+            return estimate_tokens(text)
+
+    def _cache_key(self, req: InferenceRequest) -> str:
+        params = {"n_predict": req.max_tokens, "temperature": req.temperature, "stop": list(req.stop), **req.extra}
+        return self.cache.key(req.prompt, params, self.model_id)
+
+    def _payload(self, req: InferenceRequest, stream: bool, slot: Optional[int] = None) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {
+            "prompt": req.prompt,
+            "n_predict": req.max_tokens,
+            "temperature": req.temperature,
+            "stream": stream,
+            "cache_prompt": True,
+            **req.extra,
+        }
+        if req.stop:
+            payload["stop"] = list(req.stop)
+        if slot is not None:
+            payload["id_slot"] = slot
+        return payload
+
+    def _deadline(self, req: InferenceRequest) -> float:
+        return time.monotonic() + (req.deadline_s or self.default_deadline_s)
+
+    def complete(self, req: InferenceRequest) -> str:
+        """
+        Returns the full completion text. With `req.stream` set, tokens are forwarded
+        to `req.on_token` (or the active `token_sink`) as they arrive; the sink can
+        return False to stop the generation early.
+        """
+        if req.stream:
+            sink = req.on_token or _TOKEN_SINK.get()
+            out = []
+            for tok in self.stream(req):
+                out.append(tok)
+                # A sink returning False (e.g. an output policy guard) cuts generation off.
+                if sink is not None and sink(tok) is False:
+                    break
+            return "".join(out).strip()
+
+        with span("llm.complete", n_predict=req.max_tokens) as s:
+            if self.offline:
+                s.set("llm.mock", True)
+                return _mock_completion(req.prompt)
+
+            key = self._cache_key(req)
+            cached = self.cache.get(key)
+            s.set("cache.hits" if cached is not None else "cache.misses", 1)
+            if cached is not None:
+                return cached
+
+            deadline = self._deadline(req)
+            slot = self._acquire_slot(req.prompt)
+            s.set("llm.slot", -1 if slot is None else slot)
+            try:
+                response = self.session.post(
+                    self.endpoint("completion"),
+                    json=self._payload(req, stream=False, slot=slot),
+                    timeout=(self.connect_timeout, max(deadline - time.monotonic(), 0.1)),
+                )
+                response.raise_for_status()
+                data = response.json()
+                record_llm_timings(s, data)
+                text = data.get("content", "").strip()
+            except requests.exceptions.RequestException as e:
+                print(f"LLM server connection failed: {e}. Falling back to mock response.")
+                s.set("llm.mock", True)
+                return _mock_completion(req.prompt)
+            finally:
+                self.slots.release(slot)
+            self.cache.put(key, text)
+            return text
+
+    def stream(self, req: InferenceRequest) -> Iterator[str]:
+        """
+        Yields completion tokens as llama.cpp emits them. Stops early when the
+        deadline passes or `req.cancel` is set; the connection is then released.
+        """
+        # Not activated: a generator shares its context with the consumer.
+        with span("llm.stream", activate=False, n_predict=req.max_tokens) as s:
+            yield from self._stream(req, s)
+
+    def _stream(self, req: InferenceRequest, s: Any) -> Iterator[str]:
+        if self.offline:
+            s.set("llm.mock", True)
+            words = _mock_completion(req.prompt).split(" ")
+            for i, w in enumerate(words):
+                if req.cancel is not None and req.cancel.is_set():
+                    return
+                yield w if i == 0 else " " + w
+            return
+
+        key = self._cache_key(req)
+        cached = self.cache.get(key)
+        s.set("cache.hits" if cached is not None else "cache.misses", 1)
+        if cached is not None:
+            yield cached
+            return
+
+        deadline = self._deadline(req)
+        started = time.monotonic()
+        slot = self._acquire_slot(req.prompt)
+        out: List[str] = []
+        try:
+            with self.session.post(
+                self.endpoint("completion"),
+                json=self._payload(req, stream=True, slot=slot),
+                timeout=(self.connect_timeout, max(deadline - time.monotonic(), 0.1)),
+                stream=True,
+            ) as response:
+                response.raise_for_status()
+                for line in response.iter_lines(decode_unicode=True):
+                    if req.cancel is not None and req.cancel.is_set():
+                        return
+                    if time.monotonic() > deadline:
+                        print("LLM stream deadline exceeded; returning partial completion.")
+                        return
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    tok = chunk.get("content", "")
+                    if tok:
+                        if not out:
+                            s.set("llm.first_token_ms", round((time.monotonic() - started) * 1000.0, 1))
+                        out.append(tok)
+                        yield tok
+                    if chunk.get("stop"):
+                        # The final chunk carries llama.cpp's per-request timings.
+                        record_llm_timings(s, chunk)
+                        break
+            # Only completions that ran to their natural end are memoized.
+            self.cache.put(key, "".join(out).strip())
+        except (requests.exceptions.RequestException, ValueError) as e:
+            if out:
+                print(f"LLM stream interrupted: {e}. Returning partial completion.")
+                return
+            print(f"LLM server connection failed: {e}. Falling back to mock response.")
+            yield _mock_completion(req.prompt)
+        finally:
+            self.slots.release(slot)
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_CLIENT: Optional[InferenceClient] = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def load_inference_client() -> InferenceClient:
+    """Returns the process-wide pooled inference client, creating it on first use."""
+    global _CLIENT
+    if _CLIENT is None:
+        with _CLIENT_LOCK:
+            if _CLIENT is None:
+                _CLIENT = InferenceClient()
+    return _CLIENT
+
 
 class ModelLoader:
     """
@@ -10,69 +310,50 @@ class ModelLoader:
     a specific environment variable is set for testing.
     """
     def __init__(self, url: Optional[str] = None):
-        self.url = url or os.getenv("LLAMA_CPP_URL")
-        # Check for mock mode environment variable
-        self.is_mock = os.getenv("SIA_MOCK_LLM", "False").lower() in ('true', '1', 't')
+        self.client = InferenceClient(url) if url else load_inference_client()
+        self.url = self.client.url
+        self.is_mock = self.client.is_mock
 
     def _mock_completion(self, prompt: str, **kwargs) -> str:
         """Provides a deterministic mock response for testing."""
-        print("--- MOCK LLM INFERENCE ---")
-        if "plan the following" in prompt.lower():
-            return "Plan: 1. Retrieve data. 2. Analyze data. 3. Formulate response."
-        elif "summarize" in prompt.lower():
-            return "Summary: The user is testing the SIA system's mock LLM functionality."
-        elif "respond to the user" in prompt.lower():
-            return f"Hello! I am the Strategic Insider Assistant (SIA). Your query was: '{prompt[:50]}...'. I am currently running in mock mode."
-        else:
-            return f"Mock response for prompt: {prompt[:50]}..."
+        return _mock_completion(prompt)
 
+    @traced("llm.get_completion")
     def get_completion(self, prompt: str, **kwargs) -> str:
         """
-        Sends a request to the llama.cpp server for text completion.
+        Sends a request to the llama.cpp server for text completion over the
+        shared keep-alive session.
         """
-        if self.is_mock or not self.url:
-            return self._mock_completion(prompt, **kwargs)
-
-        headers = {"Content-Type": "application/json"}
-        payload = {
-            "prompt": prompt,
-            "n_predict": kwargs.get("max_tokens", 512),
-            "temperature": kwargs.get("temperature", 0.7),
-            "stop": kwargs.get("stop", ["\n", "User:", "Assistant:"]),
-            "stream": False,
-            **kwargs
-        }
-
-        try:
-            # The llama.cpp completion endpoint is typically /completion
-            completion_url = self.url.replace("/completion", "") + "/completion"
-            response = requests.post(completion_url, headers=headers, json=payload, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            return data.get("content", "").strip()
-        except requests.exceptions.RequestException as e:
-            print(f"LLM server connection failed: {e}. Falling back to mock response.")
-            return self._mock_completion(prompt, **kwargs)
+        req = InferenceRequest(
+            prompt=prompt,
+            max_tokens=kwargs.pop("max_tokens", 512),
+            temperature=kwargs.pop("temperature", 0.7),
+            stop=kwargs.pop("stop", ["\n", "User:", "Assistant:"]),
+            deadline_s=kwargs.pop("deadline_s", None),
+            cancel=kwargs.pop("cancel", None),
+            extra=kwargs,
+        )
+        return self.client.complete(req)
 
     def get_embedding(self, text: str) -> List[float]:
         """
-        Sends a request to the llama.cpp server for text embedding.
-        For this mock, we return a list of zeros, as the actual embedding logic
-        is handled by a deterministic function in orchestration/retrieval.py.
+        Embeds `text` through the shared batched embedding client (llama.cpp
+        `/embedding`, deterministic fallback when offline).
         """
-        # This is a placeholder for a real implementation that would query the /embedding endpoint.
-        print("--- WARNING: Real embedding not implemented. Using mock. ---")
-        return [0.0] * 384
+        from .embeddings import load_embedder
+        return load_embedder().embed_one(text).tolist()
 
     def get_model_info(self) -> Dict[str, Any]:
         """
         Retrieves information about the loaded model.
         """
+        from .context_manager import load_context_budget
+        context_size = load_context_budget().context
         if self.is_mock or not self.url:
-            return {"model": "mock-sia-llm", "context_size": 8192, "mock_mode": True}
+            return {"model": "mock-sia-llm", "context_size": context_size, "mock_mode": True}
 
         # NOTE: Real implementation would query the /model endpoint.
-        return {"model": "unknown-llama-cpp-model", "context_size": 8192, "mock_mode": False}
+        return {"model": "unknown-llama-cpp-model", "context_size": context_size, "mock_mode": False}
 
 # Global instance for easy access
 LLM_CLIENT = ModelLoader()
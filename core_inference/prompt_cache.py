@@ -0,0 +1,184 @@
+from __future__ import annotations
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class CompletionCache:
+    """
+    Bounded LRU + TTL cache of completions keyed on (prompt, sampling params, model id).
+    With `path` set, entries are written through to a SQLite file and survive restarts.
+    The table mirrors the in-memory LRU: evicted and expired keys are deleted too,
+    and writes are committed in batches of `commit_every` (or once a second).
+    """
+    def __init__(self, max_entries: int = 512, ttl_s: float = 3600.0, path: Optional[str] = None,
+                 commit_every: int = 32, commit_interval_s: float = 1.0):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.commit_every = commit_every
+        self.commit_interval_s = commit_interval_s
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._uncommitted = 0
+        self._last_commit = time.monotonic()
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, ts REAL, value TEXT)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS completions_ts ON completions (ts)")
+            # Drop what expired while we were down and anything beyond the LRU bound.
+            self._db.execute("DELETE FROM completions WHERE ts < ?", (time.time() - ttl_s,))
+            self._db.execute(
+                "DELETE FROM completions WHERE key NOT IN (SELECT key FROM completions ORDER BY ts DESC LIMIT ?)",
+                (max(max_entries, 0),),
+            )
+            self._db.commit()
+            atexit.register(self.flush)
+
+    @classmethod
+    def from_env(cls) -> "CompletionCache":
+        return cls(
+            max_entries=int(os.getenv("SIA_COMPLETION_CACHE_SIZE", "512")),
+            ttl_s=float(os.getenv("SIA_COMPLETION_CACHE_TTL_S", "3600")),
+            path=os.getenv("SIA_COMPLETION_CACHE_PATH") or None,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def key(prompt: str, params: Dict[str, Any], model_id: str) -> str:
+        blob = json.dumps({"p": prompt, "s": params, "m": model_id}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit is None and self._db is not None:
+                row = self._db.execute("SELECT ts, value FROM completions WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    hit = (row[0], row[1])
+                    self._insert(key, hit)
+            if hit is None or now - hit[0] > self.ttl_s:
+                if hit is not None:
+                    self._entries.pop(key, None)
+                    self._delete([key])
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return hit[1]
+
+    def put(self, key: str, value: str) -> None:
+        if not self.enabled:
+            return
+        entry = (time.time(), value)
+        with self._lock:
+            self._insert(key, entry)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO completions (key, ts, value) VALUES (?, ?, ?)", (key, *entry))
+                self._wrote(1)
+
+    def _insert(self, key: str, entry: tuple[float, str]) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        evicted = []
+        while len(self._entries) > self.max_entries:
+            evicted.append(self._entries.popitem(last=False)[0])
+            self.evictions += 1
+        self._delete(evicted)
+
+    def _delete(self, keys: list[str]) -> None:
+        if self._db is not None and keys:
+            self._db.executemany("DELETE FROM completions WHERE key = ?", [(k,) for k in keys])
+            self._wrote(len(keys))
+
+    def _wrote(self, n: int) -> None:
+        """Commits once enough writes are pending or the last commit is old enough. Caller holds `_lock`."""
+        self._uncommitted += n
+        if self._uncommitted >= self.commit_every or time.monotonic() - self._last_commit >= self.commit_interval_s:
+            self._db.commit()
+            self._uncommitted = 0
+            self._last_commit = time.monotonic()
+
+    def flush(self) -> None:
+        """Commits pending writes (also run at interpreter exit)."""
+        with self._lock:
+            if self._db is not None and self._uncommitted:
+                self._db.commit()
+                self._uncommitted = 0
+                self._last_commit = time.monotonic()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "size": len(self._entries)}
+
+
+class SlotAffinity:
+    """
+    Prefix-aware assignment of llama.cpp server slots. Prompts that start with a
+    registered shared prefix (system prompts, planner preambles) are routed to an
+    idle slot that last served the same prefix, so the server can reuse that slot's
+    KV cache (`cache_prompt`) instead of prefilling the prefix again. When every
+    slot is busy, or the slot count is unknown (0), no slot is pinned and the
+    server picks one.
+    """
+    def __init__(self, n_slots: int = 0):
+        self._prefixes: list[str] = []
+        self._lock = threading.Lock()
+        self.resize(n_slots)
+
+    def resize(self, n_slots: int) -> None:
+        """Sets the number of server slots; assignments made so far are forgotten."""
+        with self._lock:
+            self.n_slots = max(n_slots, 0)
+            self._busy = [False] * self.n_slots
+            self._last_prefix: list[Optional[str]] = [None] * self.n_slots
+            self._last_used = [0.0] * self.n_slots
+
+    def register_prefix(self, prefix: str) -> None:
+        with self._lock:
+            if prefix and prefix not in self._prefixes:
+                self._prefixes.append(prefix)
+                self._prefixes.sort(key=len, reverse=True)
+
+    def prefix_of(self, prompt: str) -> Optional[str]:
+        for p in self._prefixes:
+            if prompt.startswith(p):
+                return p
+        return None
+
+    def acquire(self, prompt: str) -> Optional[int]:
+        prefix = self.prefix_of(prompt)
+        if prefix is None or self.n_slots <= 0:
+            return None
+        with self._lock:
+            idle = [i for i in range(self.n_slots) if not self._busy[i]]
+            if not idle:
+                return None
+            warm = [i for i in idle if self._last_prefix[i] == prefix]
+            slot = warm[0] if warm else min(idle, key=lambda i: self._last_used[i])
+            self._busy[slot] = True
+            self._last_prefix[slot] = prefix
+            return slot
+
+    def release(self, slot: Optional[int]) -> None:
+        if slot is None:
+            return
+        with self._lock:
+            self._busy[slot] = False
+            self._last_used[slot] = time.monotonic()
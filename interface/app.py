@@ -1,21 +1,20 @@
 from __future__ import annotations
 import os
-import hashlib
-import numpy as np
 import streamlit as st
 from dotenv import load_dotenv
 
-from l0_alignment.policy import L0Policy
-from core_inference.context_manager import ContextManager
+from l0_alignment.rule_store import get_policy
+from core_inference.context_manager import ContextManager, llm_summarizer
+from core_inference.model_loader import token_sink
+from sia.tracing import span
+from core_inference.embeddings import content_hash, load_embedder
+from l0_alignment.drift_detection.monitor import get_drift_monitor
 
-from orchestration.state_graph import build_graph
-from orchestration.supervisor_agent import supervisor_node, plan_node
-from orchestration.retrieval import retrieve_node
-from orchestration.respond import respond_node
+from orchestration.service import get_graph
 
-from memory_store.memgpt_lite.memory_kernel import LanceMemory
+from memory_store.memgpt_lite.memory_kernel import get_memory
 from memory_store.graph_rag.entity_extractor import extract_triplets
-from memory_store.graph_rag.neo4j_connector import Neo4jConnector, Neo4jConfig
+from memory_store.graph_rag.neo4j_connector import entity_id, get_connector
 
 load_dotenv()
 
@@ -23,9 +22,9 @@ st.set_page_config(page_title="SIA", layout="wide")
 st.title("SIA — Strategic Insider Assistant")
 
 if "ctx" not in st.session_state:
-    st.session_state.ctx = ContextManager(max_turns=18)
+    st.session_state.ctx = ContextManager(max_turns=18, summarizer=llm_summarizer)
 
-policy = L0Policy()
+policy = get_policy()
 
 with st.sidebar:
     st.header("Runtime")
@@ -42,50 +41,47 @@ run_btn = col1.button("Run SIA", type="primary")
 ingest_btn = col2.button("Ingest note to memory")
 
 def ingest_note(text: str) -> str:
-    data_dir = os.getenv("SIA_DATA_DIR", "./data")
-    lancedb_path = os.getenv("LANCEDB_PATH", os.path.join(data_dir, "lancedb"))
-    mem = LanceMemory(lancedb_path)
+    mem = get_memory()
 
-    h = hashlib.sha256(text.encode("utf-8")).digest()
-    rng = np.random.default_rng(int.from_bytes(h[:8], "little"))
-    emb = rng.standard_normal(384).astype("float32")
-    emb /= max(float(np.linalg.norm(emb)), 1e-6)
+    h = content_hash(text)
+    emb = load_embedder().embed_one(text)
+    monitor = get_drift_monitor()
+    if monitor is not None:
+        monitor.observe("document", emb)
 
     doc_id = f"doc_{int.from_bytes(h[:6],'little')}"
     mem.upsert(doc_id=doc_id, text=text, embedding=emb, meta={"source":"manual_ingest"})
 
-    cfg = Neo4jConfig(
-        uri=os.getenv("NEO4J_URI", "bolt://localhost:7687"),
-        user=os.getenv("NEO4J_USER", "neo4j"),
-        password=os.getenv("NEO4J_PASSWORD", "please_change_me"),
-    )
     try:
-        conn = Neo4jConnector(cfg)
-        conn.ensure_schema()
+        conn = get_connector()
         trips = extract_triplets(text)
-        formatted = [(f"ent_{abs(hash(t.subject))%(10**12)}", t.subject, t.predicate, t.obj) for t in trips]
+        formatted = [(entity_id(t.subject), t.subject, t.predicate, t.obj) for t in trips]
         conn.upsert_triplets(formatted)
-        conn.close()
         return f"Ingested {doc_id} (vector) + {len(trips)} triplets (graph)."
     except Exception as e:
         return f"Ingested {doc_id} (vector). Graph ingest failed: {e}"
 
-def run_sia(query: str):
+def run_sia(query: str, placeholder=None):
     d = policy.check_input(query)
     if not d.allowed:
         return {"response": f"REJECTED by L0 Temple: {d.reason}", "trace": {"l0": d.reason}}
 
+    history = st.session_state.ctx.render()
     st.session_state.ctx.add("user", d.sanitized)
 
-    graph = build_graph(
-        supervisor_node=supervisor_node,
-        retrieve_node=retrieve_node,
-        plan_node=plan_node,
-        respond_node=respond_node,
-    )
-    out = graph.invoke({"user_query": d.sanitized, "trace": {}})
+    graph = get_graph()
+    guard = policy.output_stream()
+    shown: list[str] = []
 
-    out_dec = policy.check_output(out.get("response", ""))
+    def render(text: str) -> None:
+        shown.append(text)
+        if placeholder is not None:
+            placeholder.markdown("".join(shown))
+
+    with token_sink(guard.stream_to(render)), span("request"):
+        out = graph.invoke({"user_query": d.sanitized, "history": history, "trace": {}})
+
+    out_dec = guard.close() if guard.fed else policy.check_output(out.get("response", ""))
     if not out_dec.allowed:
         out["response"] = f"REJECTED by L0 Temple (output): {out_dec.reason}"
 
@@ -96,9 +92,10 @@ if ingest_btn and user_in.strip():
     st.success(ingest_note(user_in.strip()))
 
 if run_btn and user_in.strip():
-    out = run_sia(user_in.strip())
     st.markdown("### Response")
-    st.write(out.get("response", ""))
+    response_box = st.empty()
+    out = run_sia(user_in.strip(), placeholder=response_box)
+    response_box.write(out.get("response", ""))
 
     if show_trace:
         st.markdown("### Trace")
@@ -112,5 +109,5 @@ if run_btn and user_in.strip():
 
 st.markdown("---")
 st.subheader("Conversation")
-for role, content in st.session_state.ctx.turns:
-    st.markdown(f"**{role.upper()}**: {content}")
+for turn in st.session_state.ctx.turns:
+    st.markdown(f"**{turn.role.upper()}**: {turn.content}")
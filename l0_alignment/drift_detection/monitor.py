@@ -0,0 +1,238 @@
+from __future__ import annotations
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+import numpy as np
+
+from core_inference.embeddings import EMBED_DIM
+from .psi_calculator import binned_counts, kl_from_counts, psi_from_counts
+
+PACKAGED_FINGERPRINT = os.path.join(os.path.dirname(__file__), "fingerprint.json")
+
+
+class _Window:
+    """
+    Sliding window over one embedding stream: a ring of `n_windows` slots, each
+    holding per-dimension bin counts plus sum / sum of squares for up to
+    `window_size` vectors. Memory is fixed at construction time.
+    """
+    def __init__(self, dim: int, bins: int, window_size: int, n_windows: int):
+        self.window_size = window_size
+        self.counts = np.zeros((n_windows, dim, bins), dtype=np.int64)
+        self.sums = np.zeros((n_windows, dim), dtype=np.float64)
+        self.sumsq = np.zeros((n_windows, dim), dtype=np.float64)
+        self.sizes = np.zeros(n_windows, dtype=np.int64)
+        self.slot = 0
+        self.seen = 0
+
+    def add(self, x: np.ndarray, counts: np.ndarray) -> bool:
+        """Adds a batch to the current slot; returns True when the slot filled up and the ring advanced."""
+        s = self.slot
+        self.counts[s] += counts
+        self.sums[s] += x.sum(axis=0)
+        self.sumsq[s] += np.square(x).sum(axis=0)
+        self.sizes[s] += x.shape[0]
+        self.seen += x.shape[0]
+        if self.sizes[s] < self.window_size:
+            return False
+        self.slot = (s + 1) % len(self.sizes)
+        nxt = self.slot
+        self.counts[nxt] = 0
+        self.sums[nxt] = 0.0
+        self.sumsq[nxt] = 0.0
+        self.sizes[nxt] = 0
+        return True
+
+    @property
+    def n(self) -> int:
+        return int(self.sizes.sum())
+
+    def histogram(self) -> np.ndarray:
+        return self.counts.sum(axis=0)
+
+    def moments(self) -> tuple[np.ndarray, np.ndarray]:
+        n = max(self.n, 1)
+        mean = self.sums.sum(axis=0) / n
+        var = np.maximum(self.sumsq.sum(axis=0) / n - np.square(mean), 0.0)
+        return mean, var
+
+
+class DriftMonitor:
+    """
+    Online drift check for query and document embeddings. `observe()` only
+    enqueues, so it never blocks the request path: batches larger than a window
+    slot are evenly downsampled to `window_size` rows, and a batch is dropped
+    when the queue already holds `max_queued_rows` rows. A daemon thread bins
+    vectors into fixed per-dimension histograms, keeps a sliding window per
+    stream and, every `report_every_s` in which something was observed,
+    computes PSI and KL for all dimensions against the reference histogram and
+    rewrites the fingerprint. The reference comes from the fingerprint file when
+    its shape matches, otherwise from the first full window of each stream.
+    """
+    def __init__(self, path: Optional[str] = None, dim: int = EMBED_DIM, bins: int = 10,
+                 window_size: Optional[int] = None, n_windows: Optional[int] = None,
+                 report_every_s: Optional[float] = None, psi_alert: Optional[float] = None,
+                 max_queued_rows: Optional[int] = None):
+        data_dir = os.getenv("SIA_DATA_DIR", "./data")
+        self.path = path or os.getenv("SIA_DRIFT_FINGERPRINT", os.path.join(data_dir, "drift_fingerprint.json"))
+        self.dim = dim
+        self.bins = bins
+        self.window_size = window_size or int(os.getenv("SIA_DRIFT_WINDOW", "500"))
+        self.n_windows = n_windows or int(os.getenv("SIA_DRIFT_WINDOWS", "4"))
+        self.report_every_s = report_every_s or float(os.getenv("SIA_DRIFT_REPORT_S", "60"))
+        self.psi_alert = psi_alert or float(os.getenv("SIA_DRIFT_PSI_ALERT", "0.2"))
+        self.max_queued_rows = max_queued_rows or int(os.getenv("SIA_DRIFT_QUEUE_ROWS", "8192"))
+        self.dropped = 0
+        self._queued_rows = 0
+        self._new_rows = 0  # rows ingested since the last fingerprint write
+
+        fp = self._load_fingerprint()
+        mean = np.asarray(fp.get("baseline_mean", []), dtype=np.float64)
+        var = np.asarray(fp.get("baseline_var", []), dtype=np.float64)
+        if mean.shape != (dim,) or var.shape != (dim,):
+            # Unit-normalized embeddings: components are roughly N(0, 1/dim).
+            mean, var = np.zeros(dim), np.full(dim, 1.0 / dim)
+        std = np.sqrt(np.maximum(var, 1e-12))
+        self.lo = mean - 3.0 * std
+        self.hi = mean + 3.0 * std
+        self.baseline_mean, self.baseline_var = mean, var
+
+        self._windows: dict[str, _Window] = {}
+        self._reference: dict[str, np.ndarray] = {}
+        for name, ref in (fp.get("reference_hist") or {}).items():
+            ref = np.asarray(ref, dtype=np.int64)
+            if ref.shape == (dim, bins) and fp.get("bins") == bins:
+                self._reference[name] = ref
+        self._report: dict[str, Any] = {}
+        self._q: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._last_report = time.monotonic()
+        self._worker = threading.Thread(target=self._run, name="drift-monitor", daemon=True)
+        self._worker.start()
+
+    def _load_fingerprint(self) -> dict[str, Any]:
+        for p in (self.path, PACKAGED_FINGERPRINT):
+            try:
+                with open(p, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                continue
+        return {}
+
+    def observe(self, stream: str, vectors: np.ndarray) -> None:
+        """Queues embeddings (one vector or an (n, dim) batch) of `stream`; never blocks."""
+        x = np.asarray(vectors)
+        if x.ndim == 1:
+            x = x[None, :]
+        if x.shape[0] > self.window_size:
+            # A copy, so the queue never keeps the caller's full batch alive.
+            x = x[np.linspace(0, x.shape[0] - 1, self.window_size).astype(np.int64)]
+        with self._lock:
+            if self._queued_rows + x.shape[0] > self.max_queued_rows:
+                self.dropped += 1
+                return
+            self._queued_rows += x.shape[0]
+        self._q.put_nowait((stream, x))
+
+    def _run(self) -> None:
+        while True:
+            try:
+                stream, vectors = self._q.get(timeout=self.report_every_s)
+                with self._lock:
+                    self._queued_rows -= vectors.shape[0]
+                self._ingest(stream, vectors)
+            except queue.Empty:
+                pass
+            except Exception as e:
+                print(f"Drift monitor update failed: {e}")
+            if time.monotonic() - self._last_report >= self.report_every_s:
+                self._last_report = time.monotonic()
+                if not self._new_rows:
+                    continue
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"Drift report failed: {e}")
+
+    def _ingest(self, stream: str, vectors: np.ndarray) -> None:
+        x = np.asarray(vectors, dtype=np.float64)
+        if x.ndim == 1:
+            x = x[None, :]
+        if x.shape[1] != self.dim:
+            return
+        counts = binned_counts(x, self.lo, self.hi, self.bins)
+        with self._lock:
+            win = self._windows.get(stream)
+            if win is None:
+                win = self._windows[stream] = _Window(self.dim, self.bins, self.window_size, self.n_windows)
+            if win.add(x, counts) and stream not in self._reference:
+                self._reference[stream] = win.histogram()
+            self._new_rows += x.shape[0]
+
+    def report(self) -> dict[str, Any]:
+        """Latest per-stream drift summary (empty until the first report)."""
+        return self._report
+
+    def flush(self) -> dict[str, Any]:
+        """Computes drift for every stream; rewrites the fingerprint file only if new vectors arrived."""
+        streams: dict[str, Any] = {}
+        with self._lock:
+            snapshot = {name: (w.histogram(), w.moments(), w.n, w.seen) for name, w in self._windows.items()}
+            reference = dict(self._reference)
+            new_rows, self._new_rows = self._new_rows, 0
+        for name, (hist, (mean, var), n, seen) in snapshot.items():
+            entry: dict[str, Any] = {"window_n": n, "seen": seen, "mean": mean.tolist(), "var": var.tolist()}
+            ref = reference.get(name)
+            if ref is not None and n:
+                # Half-count smoothing keeps sparse tail bins from dominating small windows.
+                psi = psi_from_counts(ref + 0.5, hist + 0.5)
+                kl = kl_from_counts(hist + 0.5, ref + 0.5)
+                entry.update({
+                    "psi_mean": float(psi.mean()), "psi_max": float(psi.max()),
+                    "kl_mean": float(kl.mean()), "kl_max": float(kl.max()),
+                    "drifted_dims": np.flatnonzero(psi > self.psi_alert).tolist(),
+                })
+                if entry["drifted_dims"]:
+                    print(f"Embedding drift on '{name}': {len(entry['drifted_dims'])} dims over PSI {self.psi_alert}")
+            streams[name] = entry
+        self._report = streams
+        if new_rows:
+            self._write(streams, reference)
+        return streams
+
+    def _write(self, streams: dict[str, Any], reference: dict[str, np.ndarray]) -> None:
+        doc = {
+            "created_utc": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+            "embedding_dim": self.dim,
+            "baseline_mean": self.baseline_mean.tolist(),
+            "baseline_var": self.baseline_var.tolist(),
+            "bins": self.bins,
+            "reference_hist": {name: ref.tolist() for name, ref in reference.items()},
+            "streams": streams,
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(doc, f)
+        os.replace(tmp, self.path)
+
+
+_MONITOR: Optional[DriftMonitor] = None
+_MONITOR_LOCK = threading.Lock()
+
+
+def get_drift_monitor() -> Optional[DriftMonitor]:
+    """Process-wide drift monitor, or None when SIA_DRIFT_MONITOR=0."""
+    global _MONITOR
+    if os.getenv("SIA_DRIFT_MONITOR", "1") == "0":
+        return None
+    if _MONITOR is None:
+        with _MONITOR_LOCK:
+            if _MONITOR is None:
+                _MONITOR = DriftMonitor()
+    return _MONITOR
@@ -27,3 +27,109 @@ def kl_divergence(p: np.ndarray, q: np.ndarray, eps: float = 1e-8) -> float:
     p = np.clip(p, eps, 1.0)
     q = np.clip(q, eps, 1.0)
     return float(np.sum(p * np.log(p / q)))
+
+def uniform_edges(lo: np.ndarray, hi: np.ndarray, bins: int = 10) -> np.ndarray:
+    """Per-feature uniform bin edges, shape (features, bins + 1)."""
+    lo = np.asarray(lo, dtype=np.float64)
+    hi = np.asarray(hi, dtype=np.float64)
+    return np.linspace(lo, hi, bins + 1, axis=1)
+
+def binned_counts(x: np.ndarray, lo: np.ndarray, hi: np.ndarray, bins: int = 10) -> np.ndarray:
+    """
+    Histograms every column of `x` (n, features) over its own uniform [lo, hi)
+    range in one pass; out-of-range values land in the edge bins. Returns
+    (features, bins) int64 counts.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    if x.ndim == 1:
+        x = x[None, :]
+    n_features = x.shape[1]
+    width = (np.asarray(hi, dtype=np.float64) - lo) / bins
+    idx = np.floor((x - lo) / width).astype(np.int64)
+    np.clip(idx, 0, bins - 1, out=idx)
+    idx += np.arange(n_features, dtype=np.int64) * bins
+    return np.bincount(idx.ravel(), minlength=n_features * bins).reshape(n_features, bins)
+
+def _normalize_rows(counts: np.ndarray, eps: float) -> np.ndarray:
+    counts = np.asarray(counts, dtype=np.float64)
+    totals = np.maximum(counts.sum(axis=-1, keepdims=True), 1.0)
+    return np.clip(counts / totals, eps, 1.0)
+
+def psi_from_counts(expected: np.ndarray, actual: np.ndarray, eps: float = 1e-6) -> np.ndarray:
+    """PSI of each row (bins on the last axis) of two count arrays."""
+    e = _normalize_rows(expected, eps)
+    a = _normalize_rows(actual, eps)
+    return np.sum((a - e) * np.log(a / e), axis=-1)
+
+def kl_from_counts(p: np.ndarray, q: np.ndarray, eps: float = 1e-8) -> np.ndarray:
+    """KL(p || q) of each row (bins on the last axis) of two count arrays."""
+    p = _normalize_rows(p, eps)
+    q = _normalize_rows(q, eps)
+    return np.sum(p * np.log(p / q), axis=-1)
+
+# Batched API: many features (columns) and windows in one pass against shared baseline edges.
+
+def load_baseline(path: str, mmap: bool = True) -> np.ndarray:
+    """Loads an (n, features) baseline sample saved with np.save, memory-mapped by default."""
+    return np.load(path, mmap_mode="r" if mmap else None)
+
+def baseline_edges(baseline: np.ndarray, bins: int = 10, chunk_rows: int = 65536) -> np.ndarray:
+    """
+    Per-feature bin edges of an (n, features) baseline, the same edges
+    np.histogram(column, bins) would use; reads the sample in row chunks so a
+    memory-mapped baseline is never loaded whole. Returns (features, bins + 1).
+    """
+    lo = hi = None
+    for start in range(0, baseline.shape[0], chunk_rows):
+        block = np.asarray(baseline[start:start + chunk_rows], dtype=np.float64)
+        b_lo, b_hi = block.min(axis=0), block.max(axis=0)
+        lo = b_lo if lo is None else np.minimum(lo, b_lo)
+        hi = b_hi if hi is None else np.maximum(hi, b_hi)
+    if lo is None:
+        raise ValueError("baseline sample is empty")
+    # np.histogram widens a degenerate range to [v - 0.5, v + 0.5].
+    flat = lo == hi
+    lo = np.where(flat, lo - 0.5, lo)
+    hi = np.where(flat, hi + 0.5, hi)
+    return uniform_edges(lo, hi, bins)
+
+def batch_counts(x: np.ndarray, edges: np.ndarray, chunk_rows: int = 4096) -> np.ndarray:
+    """
+    Histograms every feature of `x` over its own edges in one vectorized pass.
+    `x` is (n, features) or (windows, n, features); returns (features, bins) or
+    (windows, features, bins). Values outside a feature's edges are ignored and
+    the last bin includes its right edge, as in np.histogram.
+    """
+    x3 = x[None] if x.ndim == 2 else x
+    n_windows, n_rows, n_features = x3.shape
+    bins = edges.shape[1] - 1
+    if edges.shape[0] != n_features:
+        raise ValueError(f"edges cover {edges.shape[0]} features, data has {n_features}")
+    inner = edges[:, 1:-1]
+    offsets = (np.arange(n_windows, dtype=np.int64)[:, None] * n_features
+               + np.arange(n_features, dtype=np.int64)[None, :]) * bins
+    flat = np.zeros(n_windows * n_features * bins, dtype=np.int64)
+    for start in range(0, n_rows, chunk_rows):
+        block = np.asarray(x3[:, start:start + chunk_rows], dtype=np.float64)
+        idx = (block[..., None] >= inner).sum(axis=-1)
+        idx += offsets[:, None, :]
+        valid = (block >= edges[:, 0]) & (block <= edges[:, -1])
+        flat += np.bincount(idx[valid], minlength=flat.size)
+    counts = flat.reshape(n_windows, n_features, bins)
+    return counts[0] if x.ndim == 2 else counts
+
+def batch_population_stability_index(baseline: np.ndarray, actual: np.ndarray, bins: int = 10,
+                                     edges: np.ndarray | None = None, eps: float = 1e-6) -> np.ndarray:
+    """
+    PSI of every feature (and window) of `actual` against `baseline` (n, features).
+    Pass precomputed `edges` (from baseline_edges) to reuse them across calls.
+    Returns (features,) for 2-D `actual` and (windows, features) for 3-D.
+    """
+    edges = baseline_edges(baseline, bins) if edges is None else edges
+    return psi_from_counts(batch_counts(baseline, edges), batch_counts(actual, edges), eps)
+
+def batch_kl_divergence(baseline: np.ndarray, actual: np.ndarray, bins: int = 10,
+                        edges: np.ndarray | None = None, eps: float = 1e-8) -> np.ndarray:
+    """KL(actual || baseline) per feature (and window), binned on the baseline edges."""
+    edges = baseline_edges(baseline, bins) if edges is None else edges
+    return kl_from_counts(batch_counts(actual, edges), batch_counts(baseline, edges), eps)
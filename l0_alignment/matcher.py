@@ -0,0 +1,122 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Sequence
+import re
+
+# Control characters are dropped and whitespace runs collapse to one space, in one pass.
+_SANITIZE_RE = re.compile(r"[\s\x00-\x08\x0b\x0c\x0e-\x1f]+")
+_NOT_CONTROL_RE = re.compile(r"[^\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+def _sanitize_run(m: re.Match) -> str:
+    # Any non-control character in the run is whitespace, so the run collapses to " ".
+    return " " if _NOT_CONTROL_RE.search(m.group()) else ""
+
+def sanitize(text: str) -> str:
+    """Removes control characters and normalizes whitespace."""
+    return _SANITIZE_RE.sub(_sanitize_run, text).strip()
+
+@dataclass(frozen=True)
+class Rule:
+    rule_id: str
+    pattern: str
+    scope: str = "input"  # "input" rules apply to input and output; "output" rules to output only
+
+@dataclass(frozen=True)
+class PolicyMatch:
+    rule_id: str
+    pattern: str
+    scope: str
+    start: int
+    end: int
+    text: str
+
+class CompiledRuleset:
+    """
+    All rules of a scope compiled into one alternation of named groups, so a text
+    is scanned once no matter how many rules there are. Rule patterns must not use
+    numbered backreferences (groups are renumbered by the wrapping).
+    """
+    def __init__(self, rules: Sequence[Rule], flags: int = re.IGNORECASE, version: str = "builtin"):
+        self.rules = list(rules)
+        self.version = version
+        self._by_group = {f"r{i}": r for i, r in enumerate(self.rules)}
+        self._input = self._compile([g for g, r in self._by_group.items() if r.scope == "input"], flags)
+        self._output = self._compile(list(self._by_group), flags)
+
+    def _compile(self, groups: list[str], flags: int) -> re.Pattern | None:
+        if not groups:
+            return None
+        return re.compile("|".join(f"(?P<{g}>{self._by_group[g].pattern})" for g in groups), flags)
+
+    def pattern_for(self, scope: str) -> re.Pattern | None:
+        return self._input if scope == "input" else self._output
+
+    def _match(self, m: re.Match, offset: int = 0) -> PolicyMatch:
+        rule = self._by_group[m.lastgroup]
+        return PolicyMatch(rule.rule_id, rule.pattern, rule.scope, m.start() + offset, m.end() + offset, m.group())
+
+    def scan(self, text: str, scope: str = "input") -> list[PolicyMatch]:
+        """Every (non-overlapping) match in `text` with its offsets and rule id."""
+        pat = self.pattern_for(scope)
+        return [self._match(m) for m in pat.finditer(text)] if pat is not None else []
+
+
+class StreamingScanner:
+    """
+    Incremental single-pass scan over text that arrives in chunks. Only a bounded
+    tail (`overlap` chars) is kept between chunks; a match that touches the end of
+    the data seen so far is held back until the next chunk (or `finish()`) shows
+    it cannot grow, so chunk boundaries never split or alter a match.
+    `confirmed` is the (sanitized) offset before which no further match can
+    start, assuming matches are at most `overlap` chars long.
+    """
+    def __init__(self, ruleset: CompiledRuleset, scope: str = "output", overlap: int = 256):
+        self.ruleset = ruleset
+        self.pattern = ruleset.pattern_for(scope)
+        self.overlap = overlap
+        self._buf = ""
+        self._base = 0         # global offset of self._buf[0]
+        self._reported = 0     # global offset before which matches were already reported
+        self.confirmed = 0
+
+    @property
+    def end(self) -> int:
+        """Global (sanitized) offset of the end of the data fed so far."""
+        return self._base + len(self._buf)
+
+    def feed(self, chunk: str) -> list[PolicyMatch]:
+        text = _SANITIZE_RE.sub(_sanitize_run, chunk)
+        if self._buf.endswith(" ") and text.startswith(" "):
+            text = text[1:]
+        if not self._buf:
+            text = text.lstrip()
+        self._buf += text
+        return self._scan(final=False)
+
+    def finish(self) -> list[PolicyMatch]:
+        return self._scan(final=True)
+
+    def _scan(self, final: bool) -> list[PolicyMatch]:
+        if self.pattern is None:
+            self.confirmed = self.end
+            return []
+        found = []
+        hold = len(self._buf)
+        # Once trimmed, the buffer keeps one character of context before `start`
+        # so word boundaries at the cut are evaluated correctly.
+        start = 1 if self._base > 0 else 0
+        for m in self.pattern.finditer(self._buf, start):
+            if self._base + m.start() < self._reported:
+                continue
+            if not final and m.end() >= len(self._buf):
+                hold = m.start()
+                break
+            found.append(self.ruleset._match(m, self._base))
+            self._reported = self._base + m.end()
+        self.confirmed = self.end if final else max(self.confirmed, self._base + min(hold, len(self._buf) - self.overlap))
+        # Keep the unconfirmed tail plus enough context for matches spanning chunks.
+        cut = max(0, min(hold, len(self._buf) - self.overlap) - 1)
+        if cut > 0:
+            self._buf = self._buf[cut:]
+            self._base += cut
+        return found
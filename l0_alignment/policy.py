@@ -1,6 +1,9 @@
 from __future__ import annotations
-from dataclasses import dataclass
-import re
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+from sia.tracing import traced
+from .matcher import CompiledRuleset, PolicyMatch, Rule, StreamingScanner, sanitize
 
 DEFAULT_BLOCKLIST = [
     r"\b(passwords?|api[-_ ]?keys?|private key|seed phrase)\b",
@@ -8,12 +11,27 @@ DEFAULT_BLOCKLIST = [
     r"\b(delete|rm -rf|format disk)\b",
     r"\b(insider trading|market manipulation|fraud)\b", # Added financial/legal risks
 ]
+DEFAULT_BLOCKLIST_IDS = ["credentials", "exfiltration", "destructive", "financial_crime"]
+
+# A separate, stricter blocklist for system output
+DEFAULT_OUTPUT_RULES = [
+    Rule("command_execution", r"\b(execute|run|shell|command|system call)\b", scope="output"),
+    Rule("harm", r"\b(harm|damage|destroy|attack)\b", scope="output"),
+]
+
+def default_rules(block_patterns: list[str] | None = None) -> list[Rule]:
+    if block_patterns is None:
+        rules = [Rule(rid, p) for rid, p in zip(DEFAULT_BLOCKLIST_IDS, DEFAULT_BLOCKLIST)]
+    else:
+        rules = [Rule(f"block_{i}", p) for i, p in enumerate(block_patterns)]
+    return rules + DEFAULT_OUTPUT_RULES
 
 @dataclass
 class L0Decision:
     allowed: bool
     reason: str = ""
     sanitized: str = ""
+    matches: list[PolicyMatch] = field(default_factory=list)
 
 class L0Policy:
     """
@@ -21,40 +39,110 @@ class L0Policy:
     both user input and system output adhere to safety and ethical guidelines.
     It is designed to be deterministic and "fail closed."
     """
-    def __init__(self, block_patterns: list[str] | None = None):
-        self.block_patterns = [re.compile(p, re.IGNORECASE) for p in (block_patterns or DEFAULT_BLOCKLIST)]
-        # A separate, stricter blocklist for system output
-        self.output_block_patterns = [
-            re.compile(r"\b(execute|run|shell|command|system call)\b", re.IGNORECASE),
-            re.compile(r"\b(harm|damage|destroy|attack)\b", re.IGNORECASE),
-        ]
+    def __init__(self, block_patterns: list[str] | None = None, ruleset: CompiledRuleset | None = None):
+        # Every rule is compiled into a single alternation per scope: one pass per check.
+        self.ruleset = ruleset or CompiledRuleset(default_rules(block_patterns))
+        self._order = {r.rule_id: i for i, r in enumerate(self.ruleset.rules)}
 
     def sanitize_input(self, text: str) -> str:
         """Removes control characters and normalizes whitespace."""
-        text = re.sub(r"[\x00-\x08\x0b\x0c\x0e-\x1f]", "", text)
-        text = re.sub(r"\s+", " ", text).strip()
-        return text
+        return sanitize(text)
+
+    def _first_rule(self, matches: list[PolicyMatch]) -> PolicyMatch:
+        # Rule order, not text position, decides which rule is reported (input rules first).
+        return min(matches, key=lambda m: (m.scope != "input", self._order[m.rule_id], m.start))
 
+    @traced("l0.check_input")
     def check_input(self, text: str) -> L0Decision:
         """Checks user input against the blocklist."""
         s = self.sanitize_input(text)
-        for pat in self.block_patterns:
-            if pat.search(s):
-                return L0Decision(False, reason=f"Blocked by L0 policy pattern: {pat.pattern}", sanitized=s)
+        matches = self.ruleset.scan(s, scope="input")
+        if matches:
+            m = self._first_rule(matches)
+            return L0Decision(False, reason=f"Blocked by L0 policy pattern: {m.pattern}", sanitized=s, matches=matches)
         return L0Decision(True, reason="Allowed", sanitized=s)
 
+    @traced("l0.check_output")
     def check_output(self, text: str) -> L0Decision:
-        """Checks system output against a stricter blocklist."""
+        """Checks system output against the general and the stricter output blocklist in one pass."""
         s = self.sanitize_input(text)
-        
-        # Check against the general blocklist
-        for pat in self.block_patterns:
-            if pat.search(s):
-                return L0Decision(False, reason=f"Blocked by L0 policy (output) pattern: {pat.pattern}", sanitized=s)
-
-        # Check against the stricter output blocklist
-        for pat in self.output_block_patterns:
-            if pat.search(s):
-                return L0Decision(False, reason=f"Blocked by L0 policy (output command) pattern: {pat.pattern}", sanitized=s)
-
-        return L0Decision(True, reason="Output allowed", sanitized=s)
+        matches = self.ruleset.scan(s, scope="output")
+        return self._output_decision(matches, s)
+
+    def _output_decision(self, matches: list[PolicyMatch], sanitized: str = "") -> L0Decision:
+        if not matches:
+            return L0Decision(True, reason="Output allowed", sanitized=sanitized)
+        m = self._first_rule(matches)
+        kind = "(output)" if m.scope == "input" else "(output command)"
+        return L0Decision(False, reason=f"Blocked by L0 policy {kind} pattern: {m.pattern}", sanitized=sanitized, matches=matches)
+
+    def output_stream(self) -> "OutputStreamGuard":
+        """Returns a guard that checks LLM output chunk by chunk as tokens arrive."""
+        return OutputStreamGuard(self)
+
+
+class OutputStreamGuard:
+    """
+    Streaming output check. `feed()` each token; as soon as a blocked pattern is
+    confirmed the returned decision is a rejection and generation can be cut off.
+    Only a bounded tail of the stream is buffered. Show users only what
+    `release()` returns: text that can no longer be part of a match. Front ends
+    use `stream_to()` / `close()`, which do exactly that.
+    """
+    def __init__(self, policy: L0Policy):
+        self.policy = policy
+        self.scanner = StreamingScanner(policy.ruleset, scope="output")
+        self.matches: list[PolicyMatch] = []
+        self.fed = 0  # chunks fed so far
+        self._held: deque[tuple[str, int]] = deque()  # raw chunks with their sanitized end offsets
+        self._sink: Optional[Callable[[str], Any]] = None
+
+    def stream_to(self, sink: Callable[[str], Any]) -> Callable[[str], bool]:
+        """
+        Token callback (for `token_sink`) that feeds the guard and passes only
+        released text to `sink`; it returns False once the output is blocked,
+        which stops generation. Call `close()` when generation ends.
+        """
+        self._sink = sink
+
+        def on_token(tok: str) -> bool:
+            allowed = self.feed(tok).allowed
+            released = self.release()
+            if released:
+                sink(released)
+            return allowed
+        return on_token
+
+    def close(self) -> L0Decision:
+        """`finish()`, then hands the held-back tail to the sink if the output is allowed."""
+        decision = self.finish()
+        tail = self.release()
+        if tail and self._sink is not None:
+            self._sink(tail)
+        return decision
+
+    def feed(self, chunk: str) -> L0Decision:
+        self.fed += 1
+        if not self.matches:
+            self.matches.extend(self.scanner.feed(chunk))
+            self._held.append((chunk, self.scanner.end))
+        return self.policy._output_decision(self.matches)
+
+    def release(self) -> str:
+        """
+        Raw text confirmed clean since the last call. Nothing once a block is
+        confirmed; after `finish()` the rest of the held-back tail if allowed.
+        """
+        if self.matches:
+            self._held.clear()
+            return ""
+        out = []
+        while self._held and self._held[0][1] <= self.scanner.confirmed:
+            out.append(self._held.popleft()[0])
+        return "".join(out)
+
+    @traced("l0.check_output_stream")
+    def finish(self) -> L0Decision:
+        if not self.matches:
+            self.matches.extend(self.scanner.finish())
+        return self.policy._output_decision(self.matches)
@@ -0,0 +1,164 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any
+
+import yaml
+
+from .matcher import CompiledRuleset, Rule
+from .policy import L0Policy, default_rules
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(__file__), "rules.yml")
+RULE_SCOPES = ("input", "output")
+
+
+def _rule_files(path: str) -> list[str]:
+    if os.path.isdir(path):
+        return sorted(
+            os.path.join(path, n) for n in os.listdir(path) if n.endswith((".yml", ".yaml"))
+        )
+    return [path] if os.path.exists(path) else []
+
+
+def load_rules(path: str) -> list[Rule]:
+    """
+    Reads `rules:` lists (id, pattern, optional scope) from a YAML file, or from
+    every YAML file in a directory such as `nemo_config/`; files without a
+    `rules:` key are ignored.
+    """
+    rules: list[Rule] = []
+    for f in _rule_files(path):
+        with open(f, "r", encoding="utf-8") as fh:
+            doc: dict[str, Any] = yaml.safe_load(fh) or {}
+        for i, r in enumerate(doc.get("rules") or []):
+            scope = r.get("scope", "input")
+            if scope not in RULE_SCOPES:
+                raise ValueError(f"{f}: rule {r.get('id', i)} has unknown scope {scope!r}")
+            rules.append(Rule(str(r.get("id") or f"{os.path.basename(f)}:{i}"), str(r["pattern"]), scope))
+    return rules
+
+
+def ruleset_version(rules: list[Rule]) -> str:
+    blob = json.dumps([[r.rule_id, r.pattern, r.scope] for r in rules], ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:12]
+
+
+class RuleStore:
+    """
+    Versioned, hot-reloadable source of the active L0Policy. Rules are read from
+    YAML (SIA_L0_RULES, default `l0_alignment/rules.yml`); compiled rulesets are
+    cached per content version, and a reload swaps the active policy atomically,
+    so in-flight checks keep the policy they started with. A reload that fails to
+    parse or compile keeps the previous rules (fail closed), and so does a rules
+    path that disappears (e.g. mid atomic save); both are logged.
+    """
+    def __init__(self, path: str | None = None, cache_size: int = 8):
+        self.path = path or os.getenv("SIA_L0_RULES", DEFAULT_RULES_PATH)
+        self.cache_size = cache_size
+        self._compiled: "OrderedDict[str, CompiledRuleset]" = OrderedDict()
+        self._signature: tuple | None = None
+        self._lock = threading.Lock()
+        self._watcher: threading.Thread | None = None
+        self._stop = threading.Event()
+        if not os.path.exists(self.path):
+            print(f"L0 rules path {self.path} does not exist; using the built-in default rules.")
+        self._policy = self._build(load_rules(self.path) or default_rules())
+        self._signature = self._files_signature() if os.path.exists(self.path) else None
+
+    @property
+    def version(self) -> str:
+        return self._policy.ruleset.version
+
+    def policy(self) -> L0Policy:
+        """The active policy; cheap to call per request."""
+        return self._policy
+
+    def _files_signature(self) -> tuple:
+        sig = []
+        for f in _rule_files(self.path):
+            try:
+                st = os.stat(f)
+            except FileNotFoundError:
+                continue  # removed between listing and stat; the next poll sees the new state
+            sig.append((f, st.st_mtime_ns, st.st_size))
+        return tuple(sig)
+
+    def _build(self, rules: list[Rule]) -> L0Policy:
+        version = ruleset_version(rules)
+        ruleset = self._compiled.get(version)
+        if ruleset is None:
+            ruleset = CompiledRuleset(rules, version=version)
+            self._compiled[version] = ruleset
+            while len(self._compiled) > self.cache_size:
+                self._compiled.popitem(last=False)
+        else:
+            self._compiled.move_to_end(version)
+        return L0Policy(ruleset=ruleset)
+
+    def reload(self, force: bool = False) -> bool:
+        """Re-reads the rule files if they changed; returns True when the active version changed."""
+        with self._lock:
+            try:
+                if not os.path.exists(self.path):
+                    if self._signature is not None:
+                        print(f"L0 rules path {self.path} disappeared; keeping version {self.version}.")
+                    # None until the path is back, so the warning is printed once.
+                    self._signature = None
+                    return False
+                sig = self._files_signature()
+                if not force and sig == self._signature:
+                    return False
+                # Recorded before the attempt so a broken file is reported once, not on every poll.
+                self._signature = sig
+                policy = self._build(load_rules(self.path) or default_rules())
+            except Exception as e:
+                print(f"L0 rule reload failed, keeping version {self.version}: {e}")
+                return False
+            changed = policy.ruleset.version != self.version
+            self._policy = policy
+            return changed
+
+    def start_watching(self, interval_s: float = 5.0) -> None:
+        """Polls the rule files in a daemon thread and hot-reloads on change."""
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(interval_s):
+                try:
+                    self.reload()
+                except Exception as e:
+                    # Never let one bad poll end hot reloading.
+                    print(f"L0 rule watcher error: {e}")
+
+        self._watcher = threading.Thread(target=loop, name="l0-rule-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self) -> None:
+        self._stop.set()
+
+
+_STORE: RuleStore | None = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_rule_store() -> RuleStore:
+    """Process-wide rule store; starts the file watcher (SIA_L0_RELOAD_S, 0 disables) on first use."""
+    global _STORE
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                store = RuleStore()
+                interval = float(os.getenv("SIA_L0_RELOAD_S", "5"))
+                if interval > 0:
+                    store.start_watching(interval)
+                _STORE = store
+    return _STORE
+
+
+def get_policy() -> L0Policy:
+    return get_rule_store().policy()
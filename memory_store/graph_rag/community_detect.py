@@ -14,3 +14,18 @@ def build_graph_from_triplets(triplets: list[dict]) -> nx.DiGraph:
 def louvain_communities_undirected(g: nx.Graph):
     from networkx.algorithms.community import louvain_communities
     return louvain_communities(g, seed=42)
+
+def louvain_labels(adj, seed: int = 42, resolution: float = 1.0):
+    """
+    Louvain over a symmetric weighted SciPy sparse adjacency; returns one int
+    label per node. networkx needs a Graph, so the adjacency is copied into one
+    for the pass (memory proportional to the edge count while it runs); the
+    index itself only ever holds the sparse matrices.
+    """
+    import numpy as np
+    from networkx.algorithms.community import louvain_communities
+    g = nx.from_scipy_sparse_array(adj)
+    labels = np.empty(adj.shape[0], dtype=np.int64)
+    for c, members in enumerate(louvain_communities(g, weight="weight", resolution=resolution, seed=seed)):
+        labels[list(members)] = c
+    return labels
@@ -0,0 +1,424 @@
+from __future__ import annotations
+import json
+import os
+import threading
+import time
+from array import array
+from typing import Any, Iterable, Optional
+
+import numpy as np
+import scipy.sparse as sp
+
+from sia.tracing import current_span, traced
+from .community_detect import louvain_labels
+from .entity_extractor import extract_entities, normalize_entity
+
+FORMAT_VERSION = 1
+
+
+class CommunityIndex:
+    """
+    Entity graph held as SciPy sparse matrices, with a community label per
+    entity and a cached summary per community.
+
+    Triplets are added incrementally: an entity seen for the first time joins
+    the community of the entity it is related to (two new entities start a new
+    community), and every touched community is marked dirty. Once the edges
+    added since the last full pass exceed `rebuild_ratio` of the graph, Louvain
+    is re-run over the CSR adjacency; community ids are carried over by overlap
+    so unchanged communities keep their cached summaries. Only dirty summaries
+    are recomputed. Query-time lookups are dict and array reads.
+    """
+    def __init__(self, path: Optional[str] = None, rebuild_ratio: Optional[float] = None,
+                 min_rebuild_edges: Optional[int] = None, summary_entities: int = 8,
+                 summary_relations: int = 8, top_communities: int = 5):
+        data_dir = os.getenv("SIA_DATA_DIR", "./data")
+        self.path = path or os.getenv("SIA_COMMUNITY_INDEX", os.path.join(data_dir, "community_index"))
+        self.rebuild_ratio = rebuild_ratio or float(os.getenv("SIA_COMMUNITY_REBUILD_RATIO", "0.2"))
+        self.min_rebuild_edges = min_rebuild_edges or int(os.getenv("SIA_COMMUNITY_MIN_REBUILD", "1000"))
+        self.summary_entities = summary_entities
+        self.summary_relations = summary_relations
+        self.top_communities = top_communities
+        self._lock = threading.Lock()         # guards state read by queries
+        self._write_lock = threading.RLock()  # serializes writers (adds, rebuilds, saves)
+        self._reset()
+
+    def _reset(self) -> None:
+        self.names: list[str] = []              # display name per node
+        self.node_ids: dict[str, int] = {}      # normalized name -> node
+        self.predicates: list[str] = []
+        self._predicate_ids: dict[str, int] = {}
+        self._labels = array("q")               # community per node
+        # Distinct (src, dst, predicate) edges with multiplicities; new edges are
+        # buffered in the pending arrays until the next compaction.
+        self._src = np.empty(0, dtype=np.int32)
+        self._dst = np.empty(0, dtype=np.int32)
+        self._pred = np.empty(0, dtype=np.int32)
+        self._weight = np.empty(0, dtype=np.float32)
+        self._pending = (array("i"), array("i"), array("i"))
+        self._adj: Optional[sp.csr_matrix] = None
+        self._next_community = 0
+        self._since_rebuild = 0
+        self._dirty: set[int] = set()
+        self.summaries: dict[int, dict[str, Any]] = {}
+        self._top: list[int] = []
+        self._signature: Optional[tuple] = None
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.names)
+
+    @property
+    def n_edges(self) -> int:
+        return len(self._src) + len(self._pending[0])
+
+    @property
+    def n_communities(self) -> int:
+        return len(self.summaries)
+
+    # -- building ---------------------------------------------------------
+
+    def _node(self, name: str) -> tuple[int, bool]:
+        key = normalize_entity(name)
+        i = self.node_ids.get(key)
+        if i is not None:
+            return i, False
+        i = len(self.names)
+        self.node_ids[key] = i
+        self.names.append(name)
+        self._labels.append(-1)
+        return i, True
+
+    def _new_community(self) -> int:
+        c = self._next_community
+        self._next_community += 1
+        return c
+
+    @traced("communities.add")
+    def add_triplets(self, triplets: Iterable[tuple[str, str, str]]) -> int:
+        """
+        Adds (subject, predicate, object) triplets, assigning communities to new
+        entities on the fly; runs a full Louvain pass when enough edges have
+        accumulated. Returns the number of triplets added.
+        """
+        added = 0
+        with self._write_lock:
+            with self._lock:
+                src, dst, pred = self._pending
+                for s, p, o in triplets:
+                    if not s or not o:
+                        continue
+                    si, s_new = self._node(s)
+                    oi, o_new = self._node(o)
+                    if s_new and o_new:
+                        self._labels[si] = self._labels[oi] = self._new_community()
+                    elif s_new:
+                        self._labels[si] = self._labels[oi]
+                    elif o_new:
+                        self._labels[oi] = self._labels[si]
+                    pi = self._predicate_ids.get(p)
+                    if pi is None:
+                        pi = self._predicate_ids[p] = len(self.predicates)
+                        self.predicates.append(p)
+                    src.append(si)
+                    dst.append(oi)
+                    pred.append(pi)
+                    self._dirty.add(self._labels[si])
+                    self._dirty.add(self._labels[oi])
+                    added += 1
+                if added:
+                    self._adj = None
+                    self._since_rebuild += added
+                rebuild = self._since_rebuild >= max(self.min_rebuild_edges, self.rebuild_ratio * self.n_edges)
+            if rebuild:
+                self.rebuild()
+        current_span().set("rows", added)
+        return added
+
+    def _compact(self) -> None:
+        """Folds pending edges into the deduplicated edge arrays. Caller holds `_lock`."""
+        src, dst, pred = self._pending
+        if not src:
+            return
+        edges = np.concatenate([
+            np.stack([self._src, self._dst, self._pred], axis=1),
+            np.stack([np.frombuffer(a, dtype=np.int32) for a in (src, dst, pred)], axis=1),
+        ])
+        weights = np.concatenate([self._weight, np.ones(len(src), dtype=np.float32)])
+        uniq, inverse = np.unique(edges, axis=0, return_inverse=True)
+        self._weight = np.bincount(inverse.ravel(), weights=weights, minlength=len(uniq)).astype(np.float32)
+        self._src, self._dst, self._pred = (np.ascontiguousarray(uniq[:, k]) for k in range(3))
+        self._pending = (array("i"), array("i"), array("i"))
+
+    def adjacency(self) -> sp.csr_matrix:
+        """Symmetric CSR adjacency; entry (i, j) counts the relations between i and j."""
+        with self._lock:
+            return self._adjacency()
+
+    def _adjacency(self) -> sp.csr_matrix:
+        if self._adj is None:
+            self._compact()
+            n = self.n_nodes
+            a = sp.coo_matrix((self._weight, (self._src, self._dst)), shape=(n, n))
+            self._adj = (a + a.T).tocsr()
+        return self._adj
+
+    def _carry_over(self, old: np.ndarray, new: np.ndarray) -> np.ndarray:
+        """Renames Louvain communities to the previous id they overlap most, largest overlaps first."""
+        pairs, counts = np.unique(np.stack([new, old]), axis=1, return_counts=True)
+        mapping: dict[int, int] = {}
+        taken: set[int] = set()
+        for k in np.argsort(-counts, kind="stable"):
+            n_c, o_c = int(pairs[0, k]), int(pairs[1, k])
+            if n_c not in mapping and o_c not in taken and o_c >= 0:
+                mapping[n_c] = o_c
+                taken.add(o_c)
+        for n_c in np.unique(new):
+            if int(n_c) not in mapping:
+                mapping[int(n_c)] = self._new_community()
+        lookup = np.empty(int(new.max()) + 1, dtype=np.int64)
+        for n_c, c in mapping.items():
+            lookup[n_c] = c
+        return lookup[new]
+
+    @traced("communities.rebuild")
+    def rebuild(self) -> None:
+        """Full Louvain pass over the current graph, then a refresh of the changed summaries."""
+        with self._write_lock:
+            with self._lock:
+                adj = self._adjacency()
+                old = np.frombuffer(self._labels, dtype=np.int64).copy()
+            if adj.shape[0] == 0:
+                return
+            # Queries keep reading the previous labels while Louvain runs.
+            labels = self._carry_over(old, louvain_labels(adj))
+            changed = old != labels
+            with self._lock:
+                self._dirty.update(np.unique(old[changed]).tolist())
+                self._dirty.update(np.unique(labels[changed]).tolist())
+                self._labels = array("q", labels.tobytes())
+                self._since_rebuild = 0
+            current_span().set("communities.changed_nodes", int(changed.sum()))
+            self.refresh_summaries()
+
+    # -- summaries --------------------------------------------------------
+
+    @traced("communities.summarize")
+    def refresh_summaries(self) -> int:
+        """Recomputes the summaries of dirty communities; returns how many were refreshed."""
+        with self._write_lock:
+            with self._lock:
+                if not self._dirty:
+                    return 0
+                dirty = np.fromiter(self._dirty, dtype=np.int64)
+                self._dirty = set()
+                adj = self._adjacency()
+                labels = np.frombuffer(self._labels, dtype=np.int64).copy()
+                src, dst, pred, weight = self._src, self._dst, self._pred, self._weight
+            fresh = self._summarize(dirty, labels, adj, src, dst, pred, weight)
+            sizes = np.bincount(labels[labels >= 0]) if len(labels) else np.zeros(0, dtype=np.int64)
+            top = [int(c) for c in np.argsort(-sizes, kind="stable")[:self.top_communities] if sizes[c]]
+            with self._lock:
+                for c in dirty.tolist():
+                    self.summaries.pop(c, None)
+                self.summaries.update(fresh)
+                self._top = top
+            return len(fresh)
+
+    def _summarize(self, dirty: np.ndarray, labels: np.ndarray, adj: sp.csr_matrix, src: np.ndarray,
+                   dst: np.ndarray, pred: np.ndarray, weight: np.ndarray) -> dict[int, dict[str, Any]]:
+        degree = np.asarray(adj.sum(axis=1)).ravel()
+        out: dict[int, dict[str, Any]] = {}
+
+        # Members of every dirty community, ordered by label then by weighted degree.
+        idx = np.flatnonzero(np.isin(labels, dirty))
+        idx = idx[np.lexsort((-degree[idx], labels[idx]))]
+        bounds = np.flatnonzero(np.diff(labels[idx])) + 1
+        for group in np.split(idx, bounds) if len(idx) else []:
+            c = int(labels[group[0]])
+            out[c] = {
+                "size": int(len(group)),
+                "entities": [self.names[i] for i in group[:self.summary_entities]],
+                "relations": [],
+            }
+
+        # Heaviest relations inside each dirty community.
+        e = np.flatnonzero((labels[src] == labels[dst]) & np.isin(labels[src], dirty))
+        e = e[np.lexsort((-weight[e], labels[src[e]]))]
+        bounds = np.flatnonzero(np.diff(labels[src[e]])) + 1
+        for group in np.split(e, bounds) if len(e) else []:
+            c = int(labels[src[group[0]]])
+            out[c]["relations"] = [
+                f"{self.names[src[k]]} -[{self.predicates[pred[k]]}]-> {self.names[dst[k]]}"
+                for k in group[:self.summary_relations]
+            ]
+
+        for info in out.values():
+            text = f"{info['size']} entities, led by {', '.join(info['entities'])}."
+            if info["relations"]:
+                text += " Key relations: " + "; ".join(info["relations"]) + "."
+            info["summary"] = text
+        return out
+
+    # -- queries ----------------------------------------------------------
+
+    def community_of(self, name: str) -> Optional[int]:
+        i = self.node_ids.get(normalize_entity(name))
+        return None if i is None else self._labels[i]
+
+    @traced("communities.context")
+    def context(self, query: str, limit: int = 3) -> list[dict[str, Any]]:
+        """
+        Cached summaries of the communities of the entities mentioned in
+        `query`; when none are known (global questions), the largest
+        communities instead. Each entry carries "community", "matched", "size",
+        "entities", "relations" and "summary".
+        """
+        keys = [normalize_entity(e) for e in extract_entities(query)]
+        with self._lock:
+            found = [self.node_ids[k] for k in keys if k in self.node_ids]
+            cids = list(dict.fromkeys(self._labels[i] for i in found))
+            matched = bool(cids)
+            if not matched:
+                cids = self._top
+            out = [{"community": c, "matched": matched, **self.summaries[c]}
+                   for c in cids[:limit] if c in self.summaries]
+        current_span().set("rows", len(out))
+        return out
+
+    # -- persistence ------------------------------------------------------
+
+    def _files(self) -> tuple[str, str]:
+        return self.path + ".npz", self.path + ".json"
+
+    def _file_signature(self) -> Optional[tuple]:
+        try:
+            return tuple((st.st_mtime_ns, st.st_size) for st in map(os.stat, self._files()))
+        except OSError:
+            return None
+
+    @traced("communities.save")
+    def save(self) -> None:
+        """Refreshes dirty summaries and writes the graph (npz) and assignments + summaries (json) atomically."""
+        with self._write_lock:
+            self.refresh_summaries()
+            with self._lock:
+                self._compact()
+                arrays = {
+                    "src": self._src, "dst": self._dst, "pred": self._pred, "weight": self._weight,
+                    "labels": np.frombuffer(self._labels, dtype=np.int64),
+                }
+                meta = {
+                    "version": FORMAT_VERSION,
+                    "names": self.names,
+                    "predicates": self.predicates,
+                    "next_community": self._next_community,
+                    "since_rebuild": self._since_rebuild,
+                    "top": self._top,
+                    "summaries": {str(c): s for c, s in self.summaries.items()},
+                }
+            npz_path, json_path = self._files()
+            os.makedirs(os.path.dirname(os.path.abspath(npz_path)), exist_ok=True)
+            with open(npz_path + ".tmp", "wb") as f:
+                np.savez(f, **arrays)
+            with open(json_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(npz_path + ".tmp", npz_path)
+            os.replace(json_path + ".tmp", json_path)
+            self._signature = self._file_signature()
+
+    def reload(self, force: bool = False) -> bool:
+        """Loads the persisted index if the files changed since this instance last read or wrote them."""
+        sig = self._file_signature()
+        if sig is None or (not force and sig == self._signature):
+            return False
+        npz_path, json_path = self._files()
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("version") != FORMAT_VERSION:
+                raise ValueError(f"unsupported format version {meta.get('version')}")
+            with np.load(npz_path) as z:
+                arrays = {k: z[k] for k in z.files}
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Community index load failed: {e}")
+            self._signature = sig
+            return False
+        with self._write_lock, self._lock:
+            self._reset()
+            self.names = meta["names"]
+            self.node_ids = {normalize_entity(n): i for i, n in enumerate(self.names)}
+            self.predicates = meta["predicates"]
+            self._predicate_ids = {p: i for i, p in enumerate(self.predicates)}
+            self._src = arrays["src"].astype(np.int32)
+            self._dst = arrays["dst"].astype(np.int32)
+            self._pred = arrays["pred"].astype(np.int32)
+            self._weight = arrays["weight"].astype(np.float32)
+            self._labels = array("q", arrays["labels"].astype(np.int64).tobytes())
+            self._next_community = int(meta["next_community"])
+            self._since_rebuild = int(meta.get("since_rebuild", 0))
+            self._top = [int(c) for c in meta.get("top", [])]
+            self.summaries = {int(c): s for c, s in meta.get("summaries", {}).items()}
+            self._signature = sig
+        return True
+
+    @classmethod
+    def load(cls, path: Optional[str] = None, **kwargs) -> "CommunityIndex":
+        """The index persisted at `path`, or an empty one if nothing was saved yet."""
+        index = cls(path, **kwargs)
+        index.reload(force=True)
+        return index
+
+
+_INDEX: Optional[CommunityIndex] = None
+_INDEX_LOCK = threading.Lock()
+_LAST_RELOAD_CHECK = 0.0
+_RELOADING = False
+
+
+def _reload_in_background(current: CommunityIndex) -> None:
+    """Loads a fresh copy of the index if its files changed and swaps it in, off the query path."""
+    global _INDEX, _RELOADING
+    try:
+        seen = current._signature
+        if current._file_signature() in (None, seen):
+            return
+        fresh = CommunityIndex.load(current.path)
+        with _INDEX_LOCK:
+            # Skip the swap if `current` saved (or was replaced) while we were loading.
+            if _INDEX is current and current._signature == seen:
+                _INDEX = fresh
+    except Exception as e:
+        print(f"Community index reload failed: {e}")
+    finally:
+        _RELOADING = False
+
+
+def get_community_index() -> Optional[CommunityIndex]:
+    """
+    Process-wide community index, loaded from SIA_COMMUNITY_INDEX on first use
+    and re-read when another process (e.g. an ingestion run) rewrites it, checked
+    at most every SIA_COMMUNITY_RELOAD_S. The re-read runs on a background
+    thread and replaces the index in one swap; callers meanwhile keep the
+    instance they have. None when SIA_COMMUNITIES=0.
+    """
+    global _INDEX, _LAST_RELOAD_CHECK, _RELOADING
+    if os.getenv("SIA_COMMUNITIES", "1") == "0":
+        return None
+    if _INDEX is None:
+        with _INDEX_LOCK:
+            if _INDEX is None:
+                _INDEX = CommunityIndex.load()
+                _LAST_RELOAD_CHECK = time.monotonic()
+    now = time.monotonic()
+    interval = float(os.getenv("SIA_COMMUNITY_RELOAD_S", "30"))
+    if now - _LAST_RELOAD_CHECK >= interval and not _RELOADING:
+        with _INDEX_LOCK:
+            start = not _RELOADING and now - _LAST_RELOAD_CHECK >= interval
+            if start:
+                _LAST_RELOAD_CHECK = now
+                _RELOADING = True
+        if start:
+            threading.Thread(target=_reload_in_background, args=(_INDEX,),
+                             name="community-reload", daemon=True).start()
+    return _INDEX
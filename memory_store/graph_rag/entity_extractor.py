@@ -1,6 +1,12 @@
 from __future__ import annotations
+import bisect
+import multiprocessing
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
+from itertools import islice
+from typing import Iterable, Iterator
 
 ENTITY_RE = re.compile(r"\b([A-Z][a-z]+(?:\s+[A-Z][a-z]+){0,3})\b")
 PREDICATES = [
@@ -11,32 +17,126 @@ PREDICATES = [
     ("partners with", "PARTNERS_WITH"),
 ]
 
+def _phrase_pattern(phrase: str) -> str:
+    return r"\s+".join(re.escape(w) for w in phrase.split())
+
+# Every predicate phrase in one alternation (longest first), so a sentence is scanned once.
+_PREDICATE_RE = re.compile(
+    r"\b(?:" + "|".join(
+        f"(?P<p{i}>{_phrase_pattern(phrase)})"
+        for i, (phrase, _) in sorted(enumerate(PREDICATES), key=lambda ip: -len(ip[1][0]))
+    ) + r")\b",
+    re.IGNORECASE,
+)
+_PREDICATE_BY_GROUP = {f"p{i}": pred for i, (_, pred) in enumerate(PREDICATES)}
+
+# Sentence ends: terminal punctuation followed by whitespace, or a blank line.
+_SENTENCE_END_RE = re.compile(r"[.!?]+[\"')\]]*\s+|\n\s*\n")
+_ABBREVIATION_RE = re.compile(r"\b(?:inc|corp|ltd|co|llc|plc|mr|mrs|ms|dr|st|no|vs|jr|sr)$", re.IGNORECASE)
+
+
 @dataclass
 class Triplet:
     subject: str
     predicate: str
     obj: str
+    start: int = -1  # offset of the subject in the source text
+    end: int = -1    # offset just past the object
+
+
+def normalize_entity(name: str) -> str:
+    """Lookup key stored on Entity nodes: lowercased, whitespace collapsed."""
+    return " ".join(name.lower().split())
+
+
+def extract_entities(text: str, limit: int | None = 50) -> list[str]:
+    """Distinct capitalized entity mentions in order of appearance, capped at `limit` (None: no cap)."""
+    out = list(dict.fromkeys(ENTITY_RE.findall(text)))
+    return out if limit is None else out[:limit]
+
+
+def iter_sentences(text: str) -> Iterator[tuple[int, int]]:
+    """Yields (start, end) offsets of the sentences of `text`; common abbreviations don't end one."""
+    start = 0
+    for m in _SENTENCE_END_RE.finditer(text):
+        if m.group()[0] == "." and _ABBREVIATION_RE.search(text, start, m.start()):
+            continue
+        if m.start() > start:
+            yield start, m.start() + (1 if text[m.start()] in ".!?" else 0)
+        start = m.end()
+    if start < len(text) and text[start:].strip():
+        yield start, len(text)
+
+
+def iter_triplets(text: str) -> Iterator[Triplet]:
+    """
+    Yields every (subject, predicate, object) triplet with its offsets, one
+    sentence at a time: entities and predicates are each found with a single
+    regex pass per sentence. The subject is the nearest entity before the
+    predicate and the object the nearest entity after it, without crossing
+    another predicate.
+    """
+    for s_start, s_end in iter_sentences(text):
+        sentence = text[s_start:s_end]
+        preds = list(_PREDICATE_RE.finditer(sentence))
+        if not preds:
+            continue
+        ents = [(m.start(), m.end(), m.group(1)) for m in ENTITY_RE.finditer(sentence)]
+        if len(ents) < 2:
+            continue
+        ent_starts = [e[0] for e in ents]
+        ent_ends = [e[1] for e in ents]
+        for k, p in enumerate(preds):
+            lo = preds[k - 1].end() if k else 0
+            hi = preds[k + 1].start() if k + 1 < len(preds) else len(sentence)
+            i = bisect.bisect_right(ent_ends, p.start()) - 1
+            j = bisect.bisect_left(ent_starts, p.end())
+            if i < 0 or j >= len(ents) or ents[i][0] < lo or ents[j][1] > hi:
+                continue
+            yield Triplet(
+                ents[i][2], _PREDICATE_BY_GROUP[p.lastgroup], ents[j][2],
+                s_start + ents[i][0], s_start + ents[j][1],
+            )
 
-def extract_entities(text: str) -> list[str]:
-    ents = ENTITY_RE.findall(text)
-    seen = set()
-    out = []
-    for e in ents:
-        if e not in seen:
-            seen.add(e)
-            out.append(e)
-    return out[:50]
 
 def extract_triplets(text: str) -> list[Triplet]:
-    t = text.strip()
-    triplets: list[Triplet] = []
-    low = t.lower()
-    for phrase, pred in PREDICATES:
-        if phrase in low:
-            parts = re.split(re.escape(phrase), t, flags=re.IGNORECASE)
-            if len(parts) >= 2:
-                left_ents = extract_entities(parts[0])
-                right_ents = extract_entities(parts[1])
-                if left_ents and right_ents:
-                    triplets.append(Triplet(left_ents[-1], pred, right_ents[0]))
-    return triplets
+    """All triplets of `text`; offsets index into `text` as given."""
+    return list(iter_triplets(text))
+
+
+def extract_many(texts: list[str]) -> list[list[Triplet]]:
+    """Triplets of each text; the unit of work shipped to pool processes."""
+    return [extract_triplets(t) for t in texts]
+
+
+def extraction_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Process pool for extraction. Workers are spawned rather than forked: the
+    parent usually holds LanceDB / Neo4j runtimes that are not fork-safe.
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def extract_triplets_batch(texts: Iterable[str], workers: int | None = None,
+                           chunk_docs: int = 256) -> Iterator[list[Triplet]]:
+    """
+    Triplets for each text of a (possibly huge) corpus, in input order. Chunks
+    of `chunk_docs` texts are spread across a process pool of `workers`
+    (default: CPU count); with one worker everything runs in-process.
+    """
+    workers = workers or os.cpu_count() or 1
+    it = iter(texts)
+    chunks = iter(lambda: list(islice(it, chunk_docs)), [])
+    if workers <= 1:
+        for chunk in chunks:
+            yield from extract_many(chunk)
+        return
+    with extraction_pool(workers) as pool:
+        # Bounded look-ahead keeps memory flat regardless of corpus size.
+        pending = []
+        for chunk in chunks:
+            pending.append(pool.submit(extract_many, chunk))
+            if len(pending) >= workers * 2:
+                yield from pending.pop(0).result()
+        for fut in pending:
+            yield from fut.result()
@@ -1,49 +1,309 @@
 from __future__ import annotations
+import atexit
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dataclasses import dataclass
+from itertools import islice
 from neo4j import GraphDatabase
-from typing import Iterable
+from typing import Iterable, Iterator
+from sia.tracing import current_span, traced
+from .entity_extractor import extract_entities, normalize_entity
 
-@dataclass
+UPSERT_TRIPLETS_UNWIND = """
+UNWIND $rows AS row
+MERGE (s:Entity {id: row.sid})
+  ON CREATE SET s.name = row.sname, s.norm = row.snorm
+  ON MATCH SET s.name = coalesce(s.name, row.sname), s.norm = coalesce(s.norm, row.snorm)
+MERGE (o:Entity {id: row.oid})
+  ON CREATE SET o.name = row.oname, o.norm = row.onorm
+  ON MATCH SET o.name = coalesce(o.name, row.oname), o.norm = coalesce(o.norm, row.onorm)
+MERGE (s)-[r:REL {type: row.pred}]->(o)
+"""
+
+SCHEMA_STATEMENTS = [
+    "CREATE CONSTRAINT entity_id IF NOT EXISTS FOR (e:Entity) REQUIRE e.id IS UNIQUE",
+    "CREATE INDEX entity_norm IF NOT EXISTS FOR (e:Entity) ON (e.norm)",
+    "CREATE FULLTEXT INDEX entity_name_ft IF NOT EXISTS FOR (e:Entity) ON EACH [e.name]",
+]
+
+# Nodes whose lookup key is missing or was not produced by normalize_entity (an
+# earlier Cypher backfill only trimmed and lowercased, leaving whitespace runs).
+# The keys are computed in Python so they match query-time normalization exactly.
+BACKFILL_READ = r"""
+MATCH (e:Entity)
+WHERE e.name IS NOT NULL AND (e.norm IS NULL OR e.norm =~ '(?sU).*(\\s\\s|[^\\S ]).*|\\s.*|.*\\s')
+RETURN elementId(e) AS eid, e.name AS name
+LIMIT $batch
+"""
+
+BACKFILL_WRITE = """
+UNWIND $rows AS row
+MATCH (e:Entity) WHERE elementId(e) = row.eid
+SET e.norm = row.norm
+"""
+
+LOOKUP_BY_NORM = """
+MATCH (e:Entity) WHERE e.norm IN $norms
+RETURN e.id AS id
+LIMIT $limit
+"""
+
+# One full-text query per extracted candidate, best matches of each first.
+LOOKUP_FULLTEXT = """
+UNWIND $queries AS q
+CALL {
+  WITH q
+  CALL db.index.fulltext.queryNodes('entity_name_ft', q) YIELD node, score
+  RETURN node ORDER BY score DESC LIMIT $per_query
+}
+RETURN DISTINCT node.id AS id
+LIMIT $limit
+"""
+
+# One hop for a whole frontier; the subquery caps fan-out per entity.
+EXPAND_HOP = """
+UNWIND $frontier AS fid
+MATCH (e:Entity {id: fid})
+CALL {
+  WITH e
+  MATCH (e)-[r:REL]-(o:Entity)
+  RETURN r, o LIMIT $fanout
+}
+RETURN startNode(r).name AS subject, r.type AS predicate, endNode(r).name AS object, o.id AS oid
+"""
+
+_LUCENE_SPECIAL = set('+-&|!(){}[]^"~*?:\\/')
+
+def _fulltext_query(candidate: str) -> str:
+    """Lucene query requiring every term of `candidate`, with query syntax escaped."""
+    # Lowercased so terms such as AND / OR / NOT are never read as operators.
+    escaped = "".join("\\" + c if c in _LUCENE_SPECIAL else c for c in candidate.lower())
+    return " ".join("+" + t for t in escaped.split())
+
+def entity_id(name: str) -> str:
+    """Stable node id for an entity name (identical across processes and runs)."""
+    digest = hashlib.sha1(name.encode("utf-8")).digest()
+    return f"ent_{int.from_bytes(digest[:8], 'little') % (10**12)}"
+
+def _batches(rows: Iterable[dict], size: int) -> Iterator[list[dict]]:
+    it = iter(rows)
+    while batch := list(islice(it, size)):
+        yield batch
+
+@dataclass(frozen=True)
 class Neo4jConfig:
     uri: str
     user: str
     password: str
+    max_connection_pool_size: int = 16
+    connection_acquisition_timeout: float = 10.0
+    max_connection_lifetime: float = 3600.0
+    # execute_write retries transient errors with backoff for up to this long.
+    max_transaction_retry_time: float = 15.0
+
+    @classmethod
+    def from_env(cls) -> "Neo4jConfig":
+        return cls(
+            uri=os.getenv("NEO4J_URI", "bolt://localhost:7687"),
+            user=os.getenv("NEO4J_USER", "neo4j"),
+            password=os.getenv("NEO4J_PASSWORD", "please_change_me"),
+            max_connection_pool_size=int(os.getenv("NEO4J_POOL_SIZE", "16")),
+            max_transaction_retry_time=float(os.getenv("NEO4J_TX_RETRY_S", "15")),
+        )
 
 class Neo4jConnector:
     def __init__(self, cfg: Neo4jConfig):
-        self._driver = GraphDatabase.driver(cfg.uri, auth=(cfg.user, cfg.password))
+        self.cfg = cfg
+        self._driver = GraphDatabase.driver(
+            cfg.uri,
+            auth=(cfg.user, cfg.password),
+            max_connection_pool_size=cfg.max_connection_pool_size,
+            connection_acquisition_timeout=cfg.connection_acquisition_timeout,
+            max_connection_lifetime=cfg.max_connection_lifetime,
+            max_transaction_retry_time=cfg.max_transaction_retry_time,
+        )
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+        self.closed = False
 
     def close(self):
+        self.closed = True
         self._driver.close()
 
+    def healthy(self) -> bool:
+        if self.closed:
+            return False
+        try:
+            self._driver.verify_connectivity()
+            return True
+        except Exception:
+            return False
+
+    @traced("neo4j.ensure_schema")
     def ensure_schema(self) -> None:
-        q = "CREATE CONSTRAINT entity_id IF NOT EXISTS FOR (e:Entity) REQUIRE e.id IS UNIQUE"
-        with self._driver.session() as s:
-            s.run(q)
+        if self._schema_ready:
+            return
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            with self._driver.session() as s:
+                for q in SCHEMA_STATEMENTS:
+                    s.run(q).consume()
+                fixed: set[str] = set()
+                while True:
+                    rows = [{"eid": r["eid"], "norm": normalize_entity(r["name"])}
+                            for r in s.run(BACKFILL_READ, batch=10000)]
+                    # A node coming back after its fix means the two normalizations disagree; stop.
+                    if not rows or any(r["eid"] in fixed for r in rows):
+                        break
+                    s.run(BACKFILL_WRITE, rows=rows).consume()
+                    fixed.update(r["eid"] for r in rows)
+            self._schema_ready = True
 
     def upsert_triplets(self, triplets: Iterable[tuple[str, str, str, str]]) -> None:
-        q = """
-        MERGE (s:Entity {id: $sid})
-          ON CREATE SET s.name = $sname
-          ON MATCH SET s.name = coalesce(s.name, $sname)
-        MERGE (o:Entity {id: $oid})
-          ON CREATE SET o.name = $oname
-          ON MATCH SET o.name = coalesce(o.name, $oname)
-        MERGE (s)-[r:REL {type: $pred}]->(o)
+        self.upsert_triplets_bulk(triplets)
+
+    @traced("neo4j.upsert")
+    def upsert_triplets_bulk(self, triplets: Iterable[tuple[str, str, str, str]], batch_size: int = 1000,
+                             workers: int = 1) -> int:
         """
+        Writes (sid, sname, predicate, oname) triplets with one `UNWIND $rows` query per
+        batch, each batch in its own write transaction. Transient failures are retried
+        by the driver (up to `max_transaction_retry_time`); `workers > 1` writes that many batches concurrently.
+        Returns the number of triplets written.
+        """
+        rows = (
+            {"sid": sid, "sname": sname, "snorm": normalize_entity(sname), "pred": pred,
+             "oid": entity_id(oname), "oname": oname, "onorm": normalize_entity(oname)}
+            for sid, sname, pred, oname in triplets
+        )
+        if workers <= 1:
+            written = sum(self._write_batch(b) for b in _batches(rows, batch_size))
+            current_span().set("rows", written)
+            return written
+
+        written = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = set()
+            for batch in _batches(rows, batch_size):
+                # Bound in-flight batches so a huge iterable is never materialized.
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    written += sum(f.result() for f in done)
+                pending.add(pool.submit(self._write_batch, batch))
+            written += sum(f.result() for f in pending)
+        current_span().set("rows", written)
+        return written
+
+    def _write_batch(self, rows: list[dict]) -> int:
         with self._driver.session() as s:
-            for sid, sname, pred, oname in triplets:
-                oid = f"ent_{abs(hash(oname)) % (10**12)}"
-                s.run(q, sid=sid, sname=sname, pred=pred, oid=oid, oname=oname)
-
-    def neighborhood(self, entity_name: str, limit: int = 25) -> list[dict]:
-        q = """
-        MATCH (e:Entity)
-        WHERE toLower(e.name) CONTAINS toLower($name)
-        MATCH (e)-[r:REL]->(o:Entity)
-        RETURN e.name as subject, r.type as predicate, o.name as object
-        LIMIT $limit
+            s.execute_write(lambda tx: tx.run(UPSERT_TRIPLETS_UNWIND, rows=rows).consume())
+        return len(rows)
+
+    @traced("neo4j.link_entities")
+    def link_entities(self, query: str, limit: int = 10) -> list[str]:
         """
+        Resolves entity mentions in `query` to node ids: exact match on the indexed
+        normalized name first, then a full-text lookup of each extracted
+        candidate. The rest of the question is never sent to the full-text
+        index, so common words cannot link unrelated entities.
+        """
+        norms = list(dict.fromkeys(normalize_entity(e) for e in extract_entities(query)))
+        if not norms:
+            return []
         with self._driver.session() as s:
-            rows = s.run(q, name=entity_name, limit=limit)
-            return [dict(r) for r in rows]
+            ids = [r["id"] for r in s.run(LOOKUP_BY_NORM, norms=norms, limit=limit)]
+            if not ids:
+                queries = [q for q in map(_fulltext_query, norms) if q]
+                if queries:
+                    ids = [r["id"] for r in s.run(LOOKUP_FULLTEXT, queries=queries,
+                                                  per_query=max(1, limit // len(queries)), limit=limit)]
+        return ids
+
+    @traced("neo4j.neighborhood")
+    def neighborhood(self, query: str, limit: int = 25, hops: int = 1, fanout: int = 10) -> list[dict]:
+        """
+        Returns relations around the entities mentioned in `query`, expanding up to
+        `hops` hops from the linked entities with at most `fanout` edges per entity.
+        """
+        frontier = self.link_entities(query)
+        seen = set(frontier)
+        out: list[dict] = []
+        with self._driver.session() as s:
+            for hop in range(1, hops + 1):
+                if not frontier or len(out) >= limit:
+                    break
+                nxt = []
+                for r in s.run(EXPAND_HOP, frontier=frontier, fanout=fanout):
+                    if len(out) < limit:
+                        out.append({"subject": r["subject"], "predicate": r["predicate"], "object": r["object"], "hop": hop})
+                    if r["oid"] not in seen:
+                        seen.add(r["oid"])
+                        nxt.append(r["oid"])
+                frontier = nxt
+        current_span().set("rows", len(out))
+        return out
+
+
+# Process-wide connectors, one pooled driver per config. Drivers are thread-safe,
+# so every request shares the same Bolt connection pool instead of opening its own.
+_CONNECTORS: dict[Neo4jConfig, Neo4jConnector] = {}
+_LAST_CHECK: dict[Neo4jConfig, float] = {}
+_REGISTRY_LOCK = threading.Lock()
+HEALTH_CHECK_INTERVAL_S = float(os.getenv("NEO4J_HEALTH_CHECK_INTERVAL_S", "30"))
+
+def get_connector(cfg: Neo4jConfig | None = None) -> Neo4jConnector:
+    """
+    Returns the shared connector for `cfg` (default: from environment), creating it
+    and bootstrapping the schema on first use. A connector that fails its periodic
+    health check is replaced. The check runs outside the registry lock, so a
+    black-holed server only delays the one caller that probes it. Callers must
+    not close the returned connector.
+    """
+    cfg = cfg or Neo4jConfig.from_env()
+    probe = None
+    with _REGISTRY_LOCK:
+        conn = _CONNECTORS.get(cfg)
+        now = time.monotonic()
+        if conn is not None and now - _LAST_CHECK.get(cfg, 0.0) > HEALTH_CHECK_INTERVAL_S:
+            # Claim this check interval so concurrent callers keep using `conn` meanwhile.
+            _LAST_CHECK[cfg] = now
+            probe = conn
+        if conn is None:
+            conn = Neo4jConnector(cfg)
+            _CONNECTORS[cfg] = conn
+            _LAST_CHECK[cfg] = now
+    if probe is not None and not probe.healthy():
+        replacement = Neo4jConnector(cfg)
+        with _REGISTRY_LOCK:
+            current = _CONNECTORS.get(cfg)
+            if current is probe or current is None:
+                _CONNECTORS[cfg] = replacement
+                _LAST_CHECK[cfg] = time.monotonic()
+                current = replacement
+        if current is not replacement:
+            _close_quietly(replacement)
+        _close_quietly(probe)
+        conn = current
+    conn.ensure_schema()
+    return conn
+
+def close_all() -> None:
+    """Closes every shared driver; the next get_connector() call reconnects."""
+    with _REGISTRY_LOCK:
+        conns = list(_CONNECTORS.values())
+        _CONNECTORS.clear()
+        _LAST_CHECK.clear()
+    for conn in conns:
+        _close_quietly(conn)
+
+def _close_quietly(conn: Neo4jConnector) -> None:
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+atexit.register(close_all)
@@ -0,0 +1,494 @@
+from __future__ import annotations
+import bisect
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from dataclasses import dataclass, field
+from typing import Any, Iterator
+
+from core_inference.embeddings import load_embedder
+from l0_alignment.drift_detection.monitor import get_drift_monitor
+from memory_store.graph_rag.community_index import get_community_index
+from memory_store.graph_rag.entity_extractor import extract_many, extraction_pool
+from memory_store.graph_rag.neo4j_connector import entity_id, get_connector
+from memory_store.memgpt_lite.memory_kernel import get_memory
+
+TEXT_SUFFIXES = (".txt", ".md", ".rst")
+_DONE = object()
+
+@dataclass
+class Document:
+    source: str
+    position: int  # resume point within `source` once this document is committed
+    text: str
+    meta: dict[str, Any] = field(default_factory=dict)
+    graph_only: bool = False  # retry of a document whose vectors are committed but whose graph write failed
+
+@dataclass
+class IngestConfig:
+    chunk_size: int = 1200
+    chunk_overlap: int = 200
+    write_batch: int = 4096
+    graph: bool = True
+    extract_workers: int = 2  # extraction processes; 1 extracts in-process
+    extract_batch: int = 64   # documents per extraction task
+    graph_batch: int = 2000
+    graph_workers: int = 2
+    queue_size: int = 1024
+    jsonl_text_field: str = "text"
+    checkpoint_path: str | None = None
+    save_interval_s: float = 60.0  # how often the checkpoint and community index are persisted
+
+@dataclass
+class IngestStats:
+    documents: int = 0
+    chunks: int = 0
+    duplicates: int = 0
+    triplets: int = 0
+    graph_errors: int = 0
+    graph_failed: int = 0  # documents recorded in the checkpoint for a graph retry
+    started: float = field(default_factory=time.monotonic)
+
+    def as_dict(self) -> dict[str, Any]:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return {
+            "documents": self.documents, "chunks": self.chunks, "duplicates": self.duplicates,
+            "triplets": self.triplets, "graph_errors": self.graph_errors,
+            "graph_failed": self.graph_failed,
+            "elapsed_s": round(elapsed, 2), "chunks_per_s": round(self.chunks / elapsed, 1),
+        }
+
+
+def chunk_text(text: str, size: int = 1200, overlap: int = 200) -> list[str]:
+    """Splits text into ~`size`-char chunks, preferring paragraph then whitespace boundaries."""
+    text = text.strip()
+    if len(text) <= size:
+        return [text] if text else []
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            cut = text.rfind("\n\n", start + size // 2, end)
+            if cut == -1:
+                cut = text.rfind(" ", start + size // 2, end)
+            if cut != -1:
+                end = cut
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+def chunk_id(text: str) -> str:
+    return "chk_" + hashlib.sha256(text.encode("utf-8")).hexdigest()[:24]
+
+
+def _range_index(ranges: list[list[int]], x: int) -> int:
+    """Index of the last [lo, hi] range with lo <= x, or -1."""
+    return bisect.bisect_right(ranges, x, key=lambda r: r[0]) - 1
+
+
+def _range_contains(ranges: list[list[int]], x: int) -> bool:
+    i = _range_index(ranges, x)
+    return i >= 0 and x <= ranges[i][1]
+
+
+def _range_add(ranges: list[list[int]], x: int) -> None:
+    """Adds `x` to sorted, disjoint inclusive ranges, merging with its neighbours."""
+    i = _range_index(ranges, x)
+    if i >= 0 and x <= ranges[i][1]:
+        return
+    joins_prev = i >= 0 and ranges[i][1] == x - 1
+    joins_next = i + 1 < len(ranges) and ranges[i + 1][0] == x + 1
+    if joins_prev and joins_next:
+        ranges[i][1] = ranges.pop(i + 1)[1]
+    elif joins_prev:
+        ranges[i][1] = x
+    elif joins_next:
+        ranges[i + 1][0] = x
+    else:
+        ranges.insert(i + 1, [x, x])
+
+
+def _range_remove(ranges: list[list[int]], x: int) -> None:
+    i = _range_index(ranges, x)
+    if i < 0 or x > ranges[i][1]:
+        return
+    lo, hi = ranges[i]
+    if lo == hi:
+        del ranges[i]
+    elif x == lo:
+        ranges[i][0] = x + 1
+    elif x == hi:
+        ranges[i][1] = x - 1
+    else:
+        ranges[i][1] = x - 1
+        ranges.insert(i + 1, [x + 1, hi])
+
+
+class Checkpoint:
+    """
+    Resume state per source file: its signature (size + mtime), the committed
+    position (JSONL line count), whether it is complete, and the positions of
+    documents whose graph write failed (as [lo, hi] ranges) so a later run
+    retries just their triplets. Written atomically.
+    """
+    def __init__(self, path: str | None):
+        self.path = path
+        self.sources: dict[str, dict[str, Any]] = {}
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.sources = json.load(f).get("sources", {})
+
+    @staticmethod
+    def signature(path: str) -> str:
+        st = os.stat(path)
+        return f"{st.st_size}:{int(st.st_mtime)}"
+
+    def resume_position(self, source: str) -> int | None:
+        """None: ingest from scratch; -1: already complete; n: skip the first n records."""
+        rec = self.sources.get(source)
+        if rec is None or rec.get("sig") != self.signature(source):
+            return None
+        return -1 if rec.get("done") else int(rec.get("position", 0))
+
+    def graph_failed(self, source: str) -> list[list[int]]:
+        """Ranges of document positions awaiting a graph retry (empty if the file changed)."""
+        rec = self.sources.get(source)
+        if rec is None or rec.get("sig") != self.signature(source):
+            return []
+        return rec.get("graph_failed", [])
+
+    def commit(self, source: str, position: int, done: bool) -> None:
+        rec = self.sources.get(source)
+        sig = self.signature(source)
+        failed = rec.get("graph_failed", []) if rec and rec.get("sig") == sig else []
+        self.sources[source] = {"sig": sig, "position": position, "done": done, "graph_failed": failed}
+
+    def mark_graph(self, source: str, position: int, ok: bool) -> None:
+        """Records (or, on `ok`, clears) a pending graph retry for one document."""
+        rec = self.sources.get(source)
+        if rec is None:
+            return
+        failed = rec.setdefault("graph_failed", [])
+        if ok:
+            _range_remove(failed, position)
+        else:
+            _range_add(failed, position)
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"sources": self.sources}, f)
+        os.replace(tmp, self.path)
+
+
+def iter_sources(paths: list[str]) -> Iterator[str]:
+    for p in paths:
+        if os.path.isdir(p):
+            for root, _, files in os.walk(p):
+                for name in sorted(files):
+                    if name.endswith(TEXT_SUFFIXES + (".jsonl",)):
+                        yield os.path.abspath(os.path.join(root, name))
+        elif os.path.isfile(p):
+            yield os.path.abspath(p)
+
+
+def iter_documents(paths: list[str], checkpoint: Checkpoint, text_field: str = "text",
+                   graph_retries: bool = True) -> Iterator[Document]:
+    """
+    Yields the documents still to ingest. Committed documents are skipped, except
+    those the checkpoint lists for a graph retry, which come back as `graph_only`
+    (unless `graph_retries` is off, e.g. for a run without the graph stage).
+    """
+    for source in iter_sources(paths):
+        resume = checkpoint.resume_position(source)
+        failed = checkpoint.graph_failed(source) if graph_retries else []
+        if resume == -1 and not failed:
+            continue
+        skip = resume or 0
+        if source.endswith(".jsonl"):
+            with open(source, "r", encoding="utf-8") as f:
+                for lineno, line in enumerate(f):
+                    committed = resume == -1 or lineno < skip
+                    retry = committed and bool(failed) and _range_contains(failed, lineno + 1)
+                    if (committed and not retry) or not line.strip():
+                        continue
+                    try:
+                        rec = json.loads(line)
+                    except ValueError as e:
+                        print(f"Skipping malformed line {lineno + 1} of {source}: {e}")
+                        continue
+                    if not isinstance(rec, dict):
+                        print(f"Skipping line {lineno + 1} of {source}: not a JSON object")
+                        continue
+                    text = rec.get(text_field) or ""
+                    meta = {k: v for k, v in rec.items() if k != text_field}
+                    yield Document(source, lineno + 1, text, {"source": source, **meta}, graph_only=retry)
+            if resume != -1:
+                # Sentinel marking the file as complete once everything before it is committed.
+                yield Document(source, -1, "")
+        else:
+            with open(source, "r", encoding="utf-8", errors="replace") as f:
+                yield Document(source, -1, f.read(), {"source": source}, graph_only=resume == -1)
+
+
+class _Watermark:
+    """Tracks the highest sequence number below which every document is finished."""
+    def __init__(self):
+        self.next = 0
+        self._done: set[int] = set()
+        self._lock = threading.Lock()
+
+    def mark(self, seqs: list[int]) -> None:
+        with self._lock:
+            self._done.update(seqs)
+            while self.next in self._done:
+                self._done.discard(self.next)
+                self.next += 1
+
+    def value(self) -> int:
+        with self._lock:
+            return self.next
+
+
+class IngestPipeline:
+    """
+    Streaming ingestion: read -> chunk -> dedupe -> batch embed -> large LanceDB
+    appends on the calling thread, while triplet extraction and Neo4j writes run
+    in worker threads fed through bounded queues (a full queue blocks the reader,
+    which is the backpressure). Extraction itself is CPU-bound, so batches of
+    documents are farmed out to a process pool. A document is checkpointed only
+    once both its vectors and its triplets are written, so an interrupted run
+    resumes safely. A failed extraction or graph write does not hold the
+    checkpoint back: the document is recorded for a graph-only retry on the next
+    run instead. Written triplets also update the community index, which is
+    saved together with the checkpoint every `save_interval_s` and at the end.
+    """
+    def __init__(self, cfg: IngestConfig | None = None):
+        self.cfg = cfg or IngestConfig()
+        self.stats = IngestStats()
+        self.mem = get_memory()
+        self.embedder = load_embedder()
+        self.drift = get_drift_monitor()
+        self.checkpoint = Checkpoint(self.cfg.checkpoint_path)
+        self._seen: set[str] = set()  # chunk ids of the current source (merge_insert dedupes across sources)
+        self._seen_source: str | None = None
+        # seq -> (source, position, graph_only, has_text) until the document is committed.
+        self._positions: dict[int, tuple[str, int, bool, bool]] = {}
+        self._graph_failed: set[int] = set()
+        self._vector_mark = _Watermark()
+        self._graph_mark = _Watermark()
+        self._committed = 0
+        self._unsaved = False
+        self._last_save = time.monotonic()
+        self._extract_q: queue.Queue = queue.Queue(maxsize=self.cfg.queue_size)
+        self._graph_q: queue.Queue = queue.Queue(maxsize=self.cfg.queue_size)
+        self._graph_enabled = self.cfg.graph
+        self.communities = get_community_index() if self.cfg.graph else None
+        self._lock = threading.Lock()
+
+    def run(self, paths: list[str]) -> IngestStats:
+        workers = self._start_graph_stage() if self._graph_enabled else []
+        ids: list[str] = []
+        texts: list[str] = []
+        metas: list[dict[str, Any]] = []
+        pending_seqs: list[int] = []
+        try:
+            docs = iter_documents(paths, self.checkpoint, self.cfg.jsonl_text_field, graph_retries=self._graph_enabled)
+            for seq, doc in enumerate(docs):
+                self._positions[seq] = (doc.source, doc.position, doc.graph_only, bool(doc.text))
+                if doc.source != self._seen_source:
+                    # Bounded per source so a long run (or a nightly reindex) doesn't keep every chunk id.
+                    self._seen.clear()
+                    self._seen_source = doc.source
+                if doc.text and not doc.graph_only:
+                    self.stats.documents += 1
+                chunks = [] if doc.graph_only else chunk_text(doc.text, self.cfg.chunk_size, self.cfg.chunk_overlap)
+                for i, chunk in enumerate(chunks):
+                    cid = chunk_id(chunk)
+                    if cid in self._seen:
+                        self.stats.duplicates += 1
+                        continue
+                    self._seen.add(cid)
+                    ids.append(cid)
+                    texts.append(chunk)
+                    metas.append({**doc.meta, "chunk": i})
+                pending_seqs.append(seq)
+                if self._graph_enabled:
+                    self._extract_q.put((seq, doc.text))
+                else:
+                    self._graph_mark.mark([seq])
+                # Flush only between documents so a flush always covers whole documents.
+                if len(ids) >= self.cfg.write_batch:
+                    self._flush(ids, texts, metas, pending_seqs)
+            self._flush(ids, texts, metas, pending_seqs)
+        finally:
+            if workers:
+                self._extract_q.put(_DONE)
+                for w in workers:
+                    w.join()
+            self._commit(final=True)
+        return self.stats
+
+    def _flush(self, ids: list[str], texts: list[str], metas: list[dict[str, Any]], seqs: list[int]) -> None:
+        if ids:
+            # The embedder batches requests to the server (SIA_EMBED_BATCH_SIZE);
+            # LanceDB gets the whole flush as one large append.
+            emb = self.embedder.embed(texts)
+            if self.drift is not None:
+                self.drift.observe("document", emb)
+            self.mem.upsert_many(list(ids), list(texts), emb, list(metas))
+            self.stats.chunks += len(ids)
+        self._vector_mark.mark(list(seqs))
+        for buf in (ids, texts, metas, seqs):
+            buf.clear()
+        self._commit()
+
+    def _commit(self, final: bool = False) -> None:
+        with self._lock:
+            upto = min(self._vector_mark.value(), self._graph_mark.value())
+            for seq in range(self._committed, upto):
+                source, position, graph_only, has_text = self._positions.pop(seq)
+                failed = seq in self._graph_failed
+                self._graph_failed.discard(seq)
+                if not graph_only:
+                    self.checkpoint.commit(source, position, done=position == -1)
+                if self._graph_enabled and has_text and (graph_only or failed):
+                    self.checkpoint.mark_graph(source, position, ok=not failed)
+                    self.stats.graph_failed += failed
+            if upto > self._committed:
+                self._committed = upto
+                self._unsaved = True
+            if not self._unsaved or (not final and time.monotonic() - self._last_save < self.cfg.save_interval_s):
+                return
+            if self.communities is not None:
+                # Saved with the checkpoint so a resumed run doesn't miss committed triplets.
+                try:
+                    self.communities.save()
+                except Exception as e:
+                    print(f"Community index save failed: {e}")
+            self.checkpoint.save()
+            self._unsaved = False
+            self._last_save = time.monotonic()
+
+    def _start_graph_stage(self) -> list[threading.Thread]:
+        extractor = threading.Thread(target=self._extract_dispatcher, name="ingest-extract", daemon=True)
+        writer = threading.Thread(target=self._graph_writer, name="ingest-graph", daemon=True)
+        extractor.start()
+        writer.start()
+
+        def close_writer():
+            extractor.join()
+            self._graph_q.put(_DONE)
+            writer.join()
+
+        closer = threading.Thread(target=close_writer, name="ingest-graph-close", daemon=True)
+        closer.start()
+        return [closer]
+
+    def _extract_dispatcher(self) -> None:
+        """Batches queued documents and runs extraction in-process or on a process pool."""
+        workers = self.cfg.extract_workers
+        pool = extraction_pool(workers) if workers > 1 else None
+        pending: dict[Future, list[int]] = {}
+        done = False
+        try:
+            while not done:
+                batch = [self._extract_q.get()]
+                while len(batch) < self.cfg.extract_batch and batch[-1] is not _DONE:
+                    try:
+                        batch.append(self._extract_q.get_nowait())
+                    except queue.Empty:
+                        break
+                if batch[-1] is _DONE:
+                    batch.pop()
+                    done = True
+                if not batch:
+                    continue
+                seqs = [seq for seq, _ in batch]
+                texts = [text for _, text in batch]
+                if pool is None:
+                    try:
+                        self._forward(seqs, extract_many(texts))
+                    except Exception as e:
+                        self._fail_graph(seqs, f"Triplet extraction failed: {e}")
+                    continue
+                # Bound in-flight batches so memory stays flat while the pool is busy.
+                if len(pending) >= workers * 2:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in finished:
+                        self._collect(pending.pop(fut), fut)
+                try:
+                    pending[pool.submit(extract_many, texts)] = seqs
+                except Exception as e:
+                    self._fail_graph(seqs, f"Triplet extraction failed: {e}")
+            for fut, seqs in pending.items():
+                self._collect(seqs, fut)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+    def _collect(self, seqs: list[int], fut: Future) -> None:
+        try:
+            triplets = fut.result()
+        except Exception as e:
+            self._fail_graph(seqs, f"Triplet extraction failed: {e}")
+            return
+        self._forward(seqs, triplets)
+
+    def _fail_graph(self, seqs: list[int], message: str) -> None:
+        """Finishes `seqs` on the graph side anyway; `_commit` records them for a retry."""
+        self.stats.graph_errors += 1
+        print(message)
+        with self._lock:
+            self._graph_failed.update(seqs)
+        self._graph_mark.mark(seqs)
+
+    def _forward(self, seqs: list[int], triplets: list[list]) -> None:
+        for seq, doc_triplets in zip(seqs, triplets):
+            rows = [(entity_id(t.subject), t.subject, t.predicate, t.obj) for t in doc_triplets]
+            self._graph_q.put((seq, rows))
+
+    def _graph_writer(self) -> None:
+        rows: list[tuple[str, str, str, str]] = []
+        seqs: list[int] = []
+        while True:
+            item = self._graph_q.get()
+            done = item is _DONE
+            if not done:
+                seq, doc_rows = item
+                rows.extend(doc_rows)
+                seqs.append(seq)
+            if seqs and (done or len(rows) >= self.cfg.graph_batch or len(seqs) >= self.cfg.graph_batch):
+                self._write_graph(rows, seqs)
+                rows, seqs = [], []
+            if done:
+                return
+
+    def _write_graph(self, rows: list[tuple[str, str, str, str]], seqs: list[int]) -> None:
+        if rows:
+            try:
+                self.stats.triplets += get_connector().upsert_triplets_bulk(
+                    rows, batch_size=self.cfg.graph_batch, workers=self.cfg.graph_workers
+                )
+            except Exception as e:
+                self._fail_graph(seqs, f"Graph ingest failed: {e}")
+                return
+            if self.communities is not None:
+                try:
+                    self.communities.add_triplets((sname, pred, oname) for _, sname, pred, oname in rows)
+                except Exception as e:
+                    print(f"Community index update failed: {e}")
+        self._graph_mark.mark(seqs)
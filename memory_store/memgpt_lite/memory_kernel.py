@@ -1,9 +1,26 @@
 from __future__ import annotations
 from dataclasses import dataclass
+from datetime import timedelta
 from typing import Any
 import numpy as np
+import pyarrow as pa
 import lancedb
 import json
+import math
+import os
+import threading
+
+from sia.tracing import current_span, traced
+
+EMBED_DIM = int(os.getenv("SIA_EMBED_DIM", "384"))
+
+def documents_schema(dim: int = EMBED_DIM) -> pa.Schema:
+    return pa.schema([
+        pa.field("id", pa.string()),
+        pa.field("text", pa.string()),
+        pa.field("embedding", pa.list_(pa.float32(), dim)),
+        pa.field("meta", pa.string()),
+    ])
 
 @dataclass
 class MemoryHit:
@@ -12,33 +29,160 @@ class MemoryHit:
     meta: dict[str, Any]
 
 class LanceMemory:
-    def __init__(self, path: str):
+    """
+    Long-lived handle on the `documents` table. Writes are true upserts on `id`
+    (LanceDB `merge_insert`), so re-ingesting a document replaces its row. Once
+    the table passes `index_threshold` rows an ANN index (IVF_PQ by default) is
+    built on the embedding column, and after `optimize_every` written rows a
+    background optimize step compacts fragments, folds new rows into the index
+    and drops versions older than `keep_versions`. Use `get_memory()` to share
+    one handle per path.
+    """
+    def __init__(self, path: str, dim: int = EMBED_DIM, index_threshold: int | None = None,
+                 index_type: str | None = None, nprobes: int | None = None,
+                 refine_factor: int | None = None, optimize_every: int | None = None,
+                 keep_versions: timedelta | None = None):
+        self.dim = dim
+        self.index_threshold = index_threshold or int(os.getenv("SIA_LANCE_INDEX_THRESHOLD", "100000"))
+        self.index_type = index_type or os.getenv("SIA_LANCE_INDEX_TYPE", "IVF_PQ")
+        self.nprobes = nprobes or int(os.getenv("SIA_LANCE_NPROBES", "20"))
+        self.refine_factor = refine_factor or int(os.getenv("SIA_LANCE_REFINE_FACTOR", "10"))
+        self.optimize_every = optimize_every or int(os.getenv("SIA_LANCE_OPTIMIZE_EVERY", "1000"))
+        self.keep_versions = keep_versions or timedelta(seconds=float(os.getenv("SIA_LANCE_KEEP_VERSIONS_S", "3600")))
+
         self.db = lancedb.connect(path)
         if "documents" not in self.db.table_names():
-            self.table = self.db.create_table(
-                "documents",
-                schema={
-                    "id": "string",
-                    "text": "string",
-                    "embedding": "vector<float32>",
-                    "meta": "string",
-                },
-                mode="create",
-            )
+            self.table = self.db.create_table("documents", schema=documents_schema(dim), mode="create")
         else:
             self.table = self.db.open_table("documents")
 
+        self._lock = threading.Lock()
+        self._maintenance: threading.Thread | None = None
+        self._rows = self.table.count_rows()
+        self._unoptimized = 0
+        self.indexed = self._has_vector_index()
+
+    def _has_vector_index(self) -> bool:
+        try:
+            return any("embedding" in idx.columns for idx in self.table.list_indices())
+        except Exception:
+            return False
+
     def upsert(self, doc_id: str, text: str, embedding: np.ndarray, meta: dict[str, Any] | None = None) -> None:
-        meta_s = json.dumps(meta or {}, ensure_ascii=False)
-        self.table.add([{
-            "id": doc_id,
-            "text": text,
-            "embedding": embedding.astype(np.float32).tolist(),
-            "meta": meta_s,
-        }], mode="append")
+        self.upsert_many([doc_id], [text], embedding.reshape(1, -1), [meta or {}])
+
+    @traced("lancedb.upsert")
+    def upsert_many(self, ids: list[str], texts: list[str], embeddings: np.ndarray,
+                    metas: list[dict[str, Any]] | None = None) -> None:
+        """
+        Inserts or replaces rows by `id` in one merge; `embeddings` is an (n, dim)
+        matrix handed to Arrow without copying rows. For repeated ids within the
+        batch the last occurrence wins.
+        """
+        data = self.to_arrow(ids, texts, embeddings, metas)
+        current_span().set("rows", data.num_rows)
+        last = {doc_id: i for i, doc_id in enumerate(ids)}
+        if len(last) != len(ids):
+            data = data.take(sorted(last.values()))
+        res = (
+            self.table.merge_insert("id")
+            .when_matched_update_all()
+            .when_not_matched_insert_all()
+            .execute(data)
+        )
+        inserted = getattr(res, "num_inserted_rows", None)
+        self._after_write(data.num_rows, inserted if inserted is not None else data.num_rows)
+
+    @traced("lancedb.delete")
+    def delete(self, ids: list[str], batch_size: int = 1000) -> None:
+        """Deletes rows by id, one predicate per `batch_size` ids."""
+        for i in range(0, len(ids), batch_size):
+            chunk = ids[i:i + batch_size]
+            quoted = ", ".join("'" + doc_id.replace("'", "''") + "'" for doc_id in chunk)
+            res = self.table.delete(f"id IN ({quoted})")
+            deleted = getattr(res, "num_deleted_rows", None)
+            self._after_write(len(chunk), -(deleted if deleted is not None else len(chunk)))
+
+    def to_arrow(self, ids: list[str], texts: list[str], embeddings: np.ndarray,
+                 metas: list[dict[str, Any]] | None = None) -> pa.Table:
+        emb = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if emb.ndim != 2 or emb.shape[1] != self.dim:
+            raise ValueError(f"expected embeddings of shape (n, {self.dim}), got {emb.shape}")
+        vectors = pa.FixedSizeListArray.from_arrays(pa.array(emb.reshape(-1), type=pa.float32()), self.dim)
+        metas = metas or [{}] * len(ids)
+        return pa.Table.from_arrays(
+            [
+                pa.array(ids, type=pa.string()),
+                pa.array(texts, type=pa.string()),
+                vectors,
+                pa.array([json.dumps(m or {}, ensure_ascii=False) for m in metas], type=pa.string()),
+            ],
+            schema=documents_schema(self.dim),
+        )
 
+    def _after_write(self, touched: int, added: int) -> None:
+        with self._lock:
+            self._rows = max(self._rows + added, 0)
+            self._unoptimized += touched
+            due = (not self.indexed and self._rows >= self.index_threshold) or (
+                self.indexed and self._unoptimized >= self.optimize_every
+            )
+        if due:
+            self.schedule_maintenance()
+
+    def schedule_maintenance(self) -> None:
+        """Runs `maintain()` on a background thread unless a run is already in flight."""
+        with self._lock:
+            if self._maintenance is not None and self._maintenance.is_alive():
+                return
+            self._maintenance = threading.Thread(target=self.maintain, name="lance-maintenance", daemon=True)
+            self._maintenance.start()
+
+    def maintain(self) -> None:
+        """Builds the ANN index when due, otherwise compacts, reindexes and cleans up."""
+        try:
+            if not self.indexed and self._rows >= self.index_threshold:
+                self.create_index()
+            elif self.indexed:
+                self.compact()
+            with self._lock:
+                self._unoptimized = 0
+        except Exception as e:
+            print(f"LanceDB maintenance failed: {e}")
+
+    @traced("lancedb.compact")
+    def compact(self, keep_versions: timedelta | None = None) -> None:
+        """
+        Rewrites small and deletion-heavy fragments, updates indices with new rows
+        and removes table versions older than `keep_versions`, so disk usage tracks
+        the live (unique) rows.
+        """
+        self.table.optimize(cleanup_older_than=keep_versions or self.keep_versions)
+        self._rows = self.table.count_rows()
+
+    @traced("lancedb.create_index")
+    def create_index(self) -> None:
+        n = max(self._rows, 1)
+        kwargs: dict[str, Any] = {
+            "metric": "l2",
+            "vector_column_name": "embedding",
+            "index_type": self.index_type,
+            "num_partitions": max(1, int(math.sqrt(n))),
+        }
+        if "PQ" in self.index_type:
+            kwargs["num_sub_vectors"] = max(1, self.dim // 16)
+        self.table.create_index(**kwargs)
+        # Scalar index on the merge key keeps merge_insert / delete lookups off full scans.
+        self.table.create_scalar_index("id", replace=True)
+        self.indexed = True
+
+    @traced("lancedb.search")
     def search(self, embedding: np.ndarray, k: int = 5) -> list[MemoryHit]:
-        res = self.table.search(embedding.astype(np.float32).tolist()).limit(k).to_list()
+        q = self.table.search(embedding.astype(np.float32), vector_column_name="embedding").limit(k)
+        if self.indexed:
+            q = q.nprobes(self.nprobes).refine_factor(self.refine_factor)
+        res = q.to_list()
+        current_span().set("rows", len(res))
         hits = []
         for r in res:
             meta = {}
@@ -48,3 +192,23 @@ class LanceMemory:
                 meta = {}
             hits.append(MemoryHit(text=r["text"], score=float(r.get("_distance", 0.0)), meta=meta))
         return hits
+
+
+_MEMORIES: dict[str, LanceMemory] = {}
+_MEMORIES_LOCK = threading.Lock()
+
+def default_path() -> str:
+    data_dir = os.getenv("SIA_DATA_DIR", "./data")
+    return os.getenv("LANCEDB_PATH", os.path.join(data_dir, "lancedb"))
+
+def get_memory(path: str | None = None) -> LanceMemory:
+    """Returns the process-wide LanceMemory for `path`, opening it on first use."""
+    path = os.path.abspath(path or default_path())
+    mem = _MEMORIES.get(path)
+    if mem is None:
+        with _MEMORIES_LOCK:
+            mem = _MEMORIES.get(path)
+            if mem is None:
+                mem = LanceMemory(path)
+                _MEMORIES[path] = mem
+    return mem
@@ -1,14 +1,11 @@
 from __future__ import annotations
-from dataclasses import dataclass, field
-from typing import Any
-import uuid
-import time
+from dataclasses import dataclass
 
-@dataclass
+@dataclass(slots=True)
 class ThoughtNode:
+    """A thought being worked on; ThoughtStore holds the explored graph."""
     content: str
-    parent_id: str | None = None
-    node_id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    parent_id: int | None = None
+    node_id: int = 0  # assigned by ThoughtStore.add_node
     score: float = 0.0
-    meta: dict[str, Any] = field(default_factory=dict)
-    created_ts: float = field(default_factory=time.time)
+    level: int = 0
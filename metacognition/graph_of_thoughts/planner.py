@@ -1,103 +1,219 @@
 from __future__ import annotations
-from typing import Any, Dict, List
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence
 from .node import ThoughtNode
 from .scoring import HeuristicScorer
-from .transformations import generator, aggregator
-from core_inference.model_loader import LLM_CLIENT
+from .search import BeamSearch, BudgetTracker, SearchBudget
+from .store import ThoughtStore
+from .transformations import Aggregate, AggregateOperator, ExpandOperator, Generate
+from core_inference.model_loader import LLM_CLIENT, InferenceRequest
+
+BRANCH_STOP = ["\n", "User:", "Assistant:"]
+BRANCH_MAX_TOKENS = 256
+SYNTHESIS_MAX_TOKENS = 128
+JUDGE_MAX_TOKENS = 128
+
+@dataclass
+class PlanResult:
+    final: ThoughtNode
+    store: ThoughtStore
+    trace: Dict[str, Any]
+
+    @property
+    def explored(self) -> List[ThoughtNode]:
+        """Every explored thought, materialized from the store."""
+        return [self.store.node(i) for i in self.store]
 
 class GoTPlanner:
     """
-    A simplified Graph-of-Thoughts (GoT) Planner that uses a fixed, two-step
-    thought process: Generate multiple initial thoughts, then aggregate the best ones.
-    It integrates with the LLM_CLIENT for thought generation.
+    A Graph-of-Thoughts (GoT) Planner. A beam search expands the query for `depth`
+    levels of `width` thoughts per frontier node, keeps the best `beam` thoughts per
+    level, aggregates the survivors and asks the LLM for a final recommendation.
+    Every LLM call is charged against a SearchBudget (calls, tokens, wall time).
+    With `judge` (SIA_GOT_JUDGE=1) each level is also rated by the LLM in one
+    batched prompt.
     """
-    def __init__(self, scorer: HeuristicScorer | None = None):
+    def __init__(self, scorer: HeuristicScorer | None = None, max_concurrency: int | None = None,
+                 enough: int | None = None, min_score: float = 1.0,
+                 expand: ExpandOperator | None = None, aggregate: AggregateOperator | None = None,
+                 budget: SearchBudget | None = None, judge: bool | None = None):
         self.scorer = scorer or HeuristicScorer()
-        self.graph: Dict[str, ThoughtNode] = {}
+        # Should match the llama.cpp server's `--parallel` slot count.
+        self.max_concurrency = max_concurrency or int(os.getenv("SIA_GOT_CONCURRENCY", "4"))
+        # Once `enough` branches of a batch score >= `min_score`, the remaining branches are dropped.
+        self.enough = enough
+        self.min_score = min_score
+        self.expand = expand or Generate()
+        self.aggregate = aggregate or Aggregate()
+        self.budget = budget
+        self.judge = judge if judge is not None else os.getenv("SIA_GOT_JUDGE", "0") == "1"
+        preamble = getattr(self.expand, "preamble", "")
+        if preamble:
+            LLM_CLIENT.client.register_prefix(preamble)
+        self.graph = ThoughtStore()
         self.trace: Dict[str, Any] = {}
+        self._evidence_source: Optional[Callable[[], Optional[str]]] = None
+        self._evidence = ""
+        self._levels_run = 0
+
+    def _current_evidence(self) -> str:
+        """Evidence text once the source has it; polled (never waited on) before each LLM batch."""
+        if not self._evidence and self._evidence_source is not None:
+            text = self._evidence_source()
+            if text:
+                self._evidence = text
+                self.trace["evidence_level"] = self._levels_run + 1
+        return self._evidence
+
+    def _with_evidence(self, prompt: str) -> str:
+        evidence = self._current_evidence()
+        if not evidence:
+            return prompt
+        block = f"Known evidence:\n{evidence}\n\n"
+        # Keep the registered preamble as the prompt prefix so its KV cache is still reused.
+        preamble = getattr(self.expand, "preamble", "")
+        if preamble and prompt.startswith(preamble):
+            return preamble + block + prompt[len(preamble):]
+        return block + prompt
+
+    def _run_branch(self, prompt: str, cancel: threading.Event, tracker: BudgetTracker, seed: int) -> str:
+        req = InferenceRequest(
+            prompt=prompt,
+            max_tokens=BRANCH_MAX_TOKENS,
+            temperature=0.8,
+            stop=BRANCH_STOP,
+            deadline_s=max(tracker.remaining_seconds(), 0.1),
+            cancel=cancel,
+            # A fixed per-branch seed keeps repeated prompts within a batch distinct
+            # and makes each branch's completion cacheable.
+            extra={"seed": seed},
+        )
+        # Stream so a cancelled branch releases its server slot mid-generation.
+        return "".join(LLM_CLIENT.client.stream(req)).strip()
+
+    def _judge(self, prompt: str, tracker: BudgetTracker) -> str | None:
+        if not tracker.reserve(JUDGE_MAX_TOKENS):
+            return None
+        return LLM_CLIENT.get_completion(
+            prompt=prompt,
+            max_tokens=JUDGE_MAX_TOKENS,
+            temperature=0.0,
+            stop=["\n\n"],
+            deadline_s=max(tracker.remaining_seconds(), 0.1),
+        )
 
-    def _generate_thoughts(self, seed_node: ThoughtNode, num_thoughts: int = 3) -> List[ThoughtNode]:
+    def _run_prompts(self, prompts: Sequence[str], tracker: BudgetTracker) -> List[str | None]:
         """
-        Uses the LLM to generate multiple distinct thoughts based on the seed.
+        Runs a batch of branch prompts concurrently (bounded by `max_concurrency`).
+        Prompts that do not fit the remaining budget, and branches still running
+        once enough good candidates exist, come back as None.
         """
-        prompts = [
-            f"Critically analyze the following statement and propose a counter-argument: {seed_node.content}",
-            f"Expand on the implications of the following statement, focusing on risk: {seed_node.content}",
-            f"Propose a concrete action plan based on the following statement: {seed_node.content}",
-        ]
-        
-        generated_contents = []
-        for prompt in prompts[:num_thoughts]:
-            # Use the LLM client to generate the thought content
-            content = LLM_CLIENT.get_completion(
-                prompt=f"You are a strategic planner. {prompt}",
-                max_tokens=256,
-                temperature=0.8
-            )
-            generated_contents.append(content)
-
-        # Create ThoughtNodes from the generated content
-        new_nodes = [
-            ThoughtNode(content=c, parent_id=seed_node.node_id)
-            for c in generated_contents
-        ]
-        
-        return new_nodes
-
-    def _score_and_select(self, nodes: List[ThoughtNode], k: int = 1) -> List[ThoughtNode]:
-        """Scores all nodes and selects the top k."""
-        for node in nodes:
-            node.score = self.scorer.score(node.content)
-        
-        # Sort by score in descending order
-        sorted_nodes = sorted(nodes, key=lambda n: n.score, reverse=True)
-        return sorted_nodes[:k]
-
-    def plan(self, initial_query: str) -> str:
+        prompts = [self._with_evidence(p) for p in prompts]
+        self._levels_run += 1
+        admitted = [i for i in range(len(prompts)) if tracker.reserve(BRANCH_MAX_TOKENS)]
+        results: List[str | None] = [None] * len(prompts)
+        if not admitted:
+            return results
+
+        cancels = {i: threading.Event() for i in admitted}
+        good = 0
+        pool = ThreadPoolExecutor(max_workers=max(1, min(self.max_concurrency, len(admitted))))
+        try:
+            # Each branch runs in a copy of the caller's context so its spans nest under the plan node.
+            futures = {
+                pool.submit(contextvars.copy_context().run, self._run_branch, prompts[i], cancels[i], tracker, i): i
+                for i in admitted
+            }
+            for fut in as_completed(futures):
+                i = futures[fut]
+                if cancels[i].is_set():
+                    continue
+                results[i] = fut.result()
+                if self.scorer.score(results[i]) >= self.min_score:
+                    good += 1
+                if self.enough is not None and good >= self.enough:
+                    for f, j in futures.items():
+                        if results[j] is None:
+                            cancels[j].set()
+                            f.cancel()
+                    break
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        completed = sum(1 for r in results if r is not None)
+        self.trace.setdefault("branches", []).append(
+            {"submitted": len(prompts), "admitted": len(admitted), "completed": completed,
+             "cancelled": len(admitted) - completed}
+        )
+        return results
+
+    def plan(self, initial_query: str, depth: int = 1, width: int = 3, beam: int = 2,
+             budget: SearchBudget | None = None,
+             evidence: Optional[Callable[[], Optional[str]]] = None) -> PlanResult:
         """
-        Executes the simplified GoT planning process.
+        Executes the GoT search. The defaults reproduce the original pipeline:
+        one level of three thoughts, the best two aggregated, one synthesis call.
+        `evidence` is polled before every level and the synthesis; once it
+        returns text (e.g. retrieval running in parallel has finished), that
+        text is included in all later prompts.
         """
-        self.graph = {}
+        self.graph = ThoughtStore()
         self.trace = {"steps": []}
-        
+        self._evidence_source = evidence
+        self._evidence = ""
+        self._levels_run = 0
+        budget = budget or self.budget or SearchBudget()
+        # The synthesis call is reserved up front so the search can never starve it.
+        search_budget = SearchBudget(
+            max_llm_calls=max(budget.max_llm_calls - 1, 0),
+            max_tokens=max(budget.max_tokens - SYNTHESIS_MAX_TOKENS, 0),
+            max_seconds=budget.max_seconds,
+        )
+        tracker = BudgetTracker(search_budget)
+
         # 1. Initial Seed Node
         seed_node = ThoughtNode(content=initial_query, parent_id=None)
-        self.graph[seed_node.node_id] = seed_node
         self.trace["steps"].append({"step": "Seed", "content": seed_node.content})
 
-        # 2. Generation Step
-        generated_nodes = self._generate_thoughts(seed_node, num_thoughts=3)
-        for node in generated_nodes:
-            self.graph[node.node_id] = node
-        self.trace["steps"].append({"step": "Generate", "count": len(generated_nodes)})
-
-        # 3. Scoring and Selection
-        best_nodes = self._score_and_select(generated_nodes, k=2)
-        self.trace["steps"].append({"step": "Score & Select", "best_scores": [n.score for n in best_nodes]})
-
-        # 4. Aggregation Step
-        final_thought = aggregator(best_nodes)
-        self.graph[final_thought.node_id] = final_thought
-        self.trace["steps"].append({"step": "Aggregate", "content": final_thought.content})
-
-        # 5. Final LLM Synthesis (Optional, but good for a clean output)
-        synthesis_prompt = f"Based on the following aggregated strategic thought, provide a final, concise action recommendation:\n\n{final_thought.content}"
-        final_recommendation = LLM_CLIENT.get_completion(
-            prompt=synthesis_prompt,
-            max_tokens=128,
-            temperature=0.5
-        )
-        
+        # 2. Beam search: generate, score and prune level by level
+        engine = BeamSearch(self.expand, self.aggregate, self.scorer)
+        res = engine.run(seed_node, lambda ps: self._run_prompts(ps, tracker), tracker,
+                         depth=depth, width=width, beam=beam, store=self.graph,
+                         judge=(lambda p: self._judge(p, tracker)) if self.judge else None)
+        for lvl in res.levels:
+            self.trace["steps"].append({"step": "Generate & Prune", **lvl})
+        self.trace["steps"].append({"step": "Aggregate", "content": res.aggregate.content})
+        self.trace["search"] = {
+            "depth": depth, "width": width, "beam": beam, "judge": self.judge, "stop_reason": res.stop_reason,
+            "llm_calls": tracker.llm_calls, "reserved_tokens": tracker.tokens,
+            "elapsed_s": round(tracker.elapsed(), 3),
+        }
+
+        # 3. Final LLM Synthesis (skipped when the wall-time budget is already spent)
+        final_recommendation = res.aggregate.content
+        remaining = budget.max_seconds - tracker.elapsed()
+        if budget.max_llm_calls > 0 and remaining > 0:
+            synthesis_prompt = self._with_evidence(f"Based on the following aggregated strategic thought, provide a final, concise action recommendation:\n\n{res.aggregate.content}")
+            final_recommendation = LLM_CLIENT.get_completion(
+                prompt=synthesis_prompt,
+                max_tokens=SYNTHESIS_MAX_TOKENS,
+                temperature=0.5,
+                deadline_s=remaining,
+            )
+
+        final = self.graph.add_node(ThoughtNode(content=final_recommendation, parent_id=res.aggregate.node_id))
         self.trace["final_recommendation"] = final_recommendation
-        
-        return final_recommendation
+
+        return PlanResult(final=final, store=self.graph, trace=self.trace)
 
     def get_trace(self) -> Dict[str, Any]:
         """Returns the execution trace for visualization/debugging."""
-        # For a full trace, we can include the graph structure
-        graph_export = {
-            "nodes": [{"id": n.node_id, "content": n.content, "score": n.score, "parent": n.parent_id} for n in self.graph.values()],
-            "edges": [{"source": n.parent_id, "target": n.node_id} for n in self.graph.values() if n.parent_id]
-        }
-        self.trace["got_graph"] = graph_export
+        self.trace["got_graph"] = self.graph.export(edges=True)
         return self.trace
+
+# Name used by the orchestration layer.
+GraphOfThoughtsPlanner = GoTPlanner
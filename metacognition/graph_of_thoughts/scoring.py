@@ -1,14 +1,104 @@
 from __future__ import annotations
-from dataclasses import dataclass
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Optional, Sequence
+
+import numpy as np
+
+# Takes a prompt and returns the completion, or None when the call was not made (e.g. no budget).
+JudgeRunner = Callable[[str], Optional[str]]
+
+JUDGE_PROMPT = """Rate how well each candidate thought advances the task, from 0 (useless) to 10 (excellent).
+Task: {query}
+
+{candidates}
+
+Answer with one line per candidate in the form "<number>: <rating>" and nothing else.
+"""
+_JUDGE_LINE_RE = re.compile(r"^\s*\[?(\d+)\]?\s*[:.)-]\s*(\d+(?:\.\d+)?)", re.MULTILINE)
+_SEPARATOR = "\x00"
+
 
 @dataclass
 class HeuristicScorer:
+    """
+    Scores GoT thoughts: +0.5 per clarity keyword, -1.5 per risk keyword, up to
+    +1 for length, plus `relevance_weight` x cosine similarity to the query and,
+    with a judge, `judge_weight` x the LLM rating scaled to [0, 1].
+    `score_batch` scores a whole level at once: one keyword scan over all
+    candidates, one embedding batch and at most one judge prompt.
+    """
     risk_words: tuple[str, ...] = ("illegal", "bribe", "insider trading", "exfiltrate", "fraud")
     clarity_words: tuple[str, ...] = ("because", "therefore", "tradeoff", "risk", "mitigation", "assumption")
+    relevance_weight: float = field(default_factory=lambda: float(os.getenv("SIA_GOT_RELEVANCE_WEIGHT", "1.0")))
+    judge_weight: float = field(default_factory=lambda: float(os.getenv("SIA_GOT_JUDGE_WEIGHT", "1.0")))
+
+    def __post_init__(self):
+        self._words = list(dict.fromkeys(w.lower() for w in self.risk_words + self.clarity_words))
+        risk = {w.lower() for w in self.risk_words}
+        self._weights = np.array([-1.5 if w in risk else 0.5 for w in self._words])
+        # One alternation of named groups (k<i> = self._words[i]), longest first so a
+        # keyword is not shadowed by a shorter one starting at the same position.
+        order = sorted(range(len(self._words)), key=lambda i: -len(self._words[i]))
+        self._keyword_re = re.compile("|".join(f"(?P<k{i}>{re.escape(self._words[i])})" for i in order))
 
     def score(self, text: str) -> float:
-        t = text.lower()
-        risk_pen = sum(1 for w in self.risk_words if w in t) * 1.5
-        clarity = sum(1 for w in self.clarity_words if w in t) * 0.5
-        length = min(len(text) / 800.0, 1.0)
-        return float(0.5 + clarity + length - risk_pen)
+        return float(self.score_batch([text])[0])
+
+    def keyword_scores(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Keyword and length terms for every text. The lowercased texts are joined
+        into one string and scanned once by the compiled keyword alternation;
+        match offsets are mapped back to their texts in one searchsorted call.
+        """
+        n = len(texts)
+        if not n:
+            return np.zeros(0)
+        lengths = np.fromiter((len(t) for t in texts), dtype=np.float64, count=n)
+        lowered = [t.lower() for t in texts]
+        starts = np.cumsum([0] + [len(t) + 1 for t in lowered])
+        hits = np.zeros((n, len(self._words)), dtype=bool)
+        found = [(m.start(), int(m.lastgroup[1:])) for m in self._keyword_re.finditer(_SEPARATOR.join(lowered))]
+        if found:
+            pos, k = np.array(found).T
+            hits[np.searchsorted(starts, pos, side="right") - 1, k] = True
+        return 0.5 + hits @ self._weights + np.minimum(lengths / 800.0, 1.0)
+
+    def relevance(self, texts: Sequence[str], query: str) -> np.ndarray:
+        """Cosine similarity of each text to `query`; zeros when only deterministic embeddings are available."""
+        from core_inference.embeddings import load_embedder
+        embedder = load_embedder()
+        if embedder.deterministic:
+            return np.zeros(len(texts))
+        emb = embedder.embed([query, *texts]).astype(np.float64)
+        emb /= np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12)
+        return emb[1:] @ emb[0]
+
+    def judge_scores(self, texts: Sequence[str], query: str, judge: JudgeRunner) -> np.ndarray:
+        """LLM ratings of all texts from one prompt, scaled to [0, 1]; unrated texts get 0."""
+        candidates = "\n\n".join(f"[{i + 1}] {' '.join(t.split())}" for i, t in enumerate(texts))
+        out = np.zeros(len(texts))
+        reply = judge(JUDGE_PROMPT.format(query=query, candidates=candidates))
+        for m in _JUDGE_LINE_RE.finditer(reply or ""):
+            i = int(m.group(1)) - 1
+            if 0 <= i < len(texts):
+                out[i] = min(float(m.group(2)), 10.0) / 10.0
+        return out
+
+    def score_batch(self, texts: Sequence[str], query: str | None = None,
+                    judge: JudgeRunner | None = None) -> np.ndarray:
+        """Scores for all `texts`; relevance and the judge are only applied when `query` is given."""
+        scores = self.keyword_scores(texts)
+        if query and len(texts):
+            if self.relevance_weight:
+                try:
+                    scores += self.relevance_weight * self.relevance(texts, query)
+                except Exception as e:
+                    print(f"Relevance scoring failed: {e}")
+            if judge is not None and self.judge_weight:
+                try:
+                    scores += self.judge_weight * self.judge_scores(texts, query, judge)
+                except Exception as e:
+                    print(f"LLM judge failed: {e}")
+        return scores
@@ -0,0 +1,121 @@
+from __future__ import annotations
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+import numpy as np
+
+from .node import ThoughtNode
+from .scoring import HeuristicScorer, JudgeRunner
+from .store import ThoughtStore
+from .transformations import AggregateOperator, ExpandOperator, PromptRunner
+
+
+@dataclass
+class SearchBudget:
+    """Hard limits for one search; an exhausted budget ends expansion early."""
+    max_llm_calls: int = field(default_factory=lambda: int(os.getenv("SIA_GOT_MAX_CALLS", "16")))
+    max_tokens: int = field(default_factory=lambda: int(os.getenv("SIA_GOT_MAX_TOKENS", "4096")))
+    max_seconds: float = field(default_factory=lambda: float(os.getenv("SIA_GOT_MAX_SECONDS", "30")))
+
+
+class BudgetTracker:
+    """
+    Thread-safe accounting against a SearchBudget. Generated tokens are reserved
+    at `n_predict` before a call is issued, so the token limit holds even while
+    calls are in flight.
+    """
+    def __init__(self, budget: SearchBudget):
+        self.budget = budget
+        self.started = time.monotonic()
+        self.llm_calls = 0
+        self.tokens = 0
+        self._lock = threading.Lock()
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def remaining_seconds(self) -> float:
+        return max(self.budget.max_seconds - self.elapsed(), 0.0)
+
+    def reserve(self, n_predict: int) -> bool:
+        with self._lock:
+            if self.exhausted_reason() is not None:
+                return False
+            if self.llm_calls + 1 > self.budget.max_llm_calls or self.tokens + n_predict > self.budget.max_tokens:
+                return False
+            self.llm_calls += 1
+            self.tokens += n_predict
+            return True
+
+    def exhausted_reason(self) -> str | None:
+        if self.llm_calls >= self.budget.max_llm_calls:
+            return "llm_calls"
+        if self.tokens >= self.budget.max_tokens:
+            return "tokens"
+        if self.elapsed() >= self.budget.max_seconds:
+            return "wall_time"
+        return None
+
+
+@dataclass
+class SearchResult:
+    best: List[ThoughtNode]
+    aggregate: ThoughtNode
+    store: ThoughtStore
+    levels: List[Dict[str, Any]]
+    stop_reason: str
+
+
+class BeamSearch:
+    """
+    Level-synchronous beam search over ThoughtNode graphs. Each level expands the
+    whole frontier with the expand operator, scores all children in one
+    `score_batch` call (relevance is measured against the root thought, and an
+    optional `judge` rates the whole level in one prompt) and keeps the top
+    `beam` as the next frontier. Every explored thought is
+    appended to a ThoughtStore; only the frontier is kept as ThoughtNode objects.
+    """
+    def __init__(self, expand: ExpandOperator, aggregate: AggregateOperator, scorer: HeuristicScorer | None = None):
+        self.expand = expand
+        self.aggregate = aggregate
+        self.scorer = scorer or HeuristicScorer()
+
+    def run(self, root: ThoughtNode, run: PromptRunner, tracker: BudgetTracker,
+            depth: int = 1, width: int = 3, beam: int = 2, store: ThoughtStore | None = None,
+            judge: JudgeRunner | None = None) -> SearchResult:
+        store = store if store is not None else ThoughtStore()
+        if not root.node_id:
+            store.add_node(root)
+        frontier = [root]
+        best: List[ThoughtNode] = []
+        levels: List[Dict[str, Any]] = []
+        stop_reason = "depth"
+
+        for level in range(depth):
+            reason = tracker.exhausted_reason()
+            if reason is not None:
+                stop_reason = reason
+                break
+            children = self.expand(frontier, width, run)
+            if not children:
+                stop_reason = tracker.exhausted_reason() or "no_children"
+                break
+            scores = self.scorer.score_batch([n.content for n in children], query=root.content, judge=judge)
+            for node, score in zip(children, scores.tolist()):
+                node.score = score
+                node.level = level + 1
+                store.add_node(node)
+            frontier = [children[i] for i in np.argsort(-scores, kind="stable")[:beam]]
+            best = frontier
+            levels.append({
+                "level": level + 1,
+                "expanded": len(children),
+                "kept": [n.node_id for n in frontier],
+                "best_scores": [n.score for n in frontier],
+            })
+
+        merged = store.add_node(self.aggregate(best) if best else self.aggregate([root]))
+        return SearchResult(best=best, aggregate=merged, store=store, levels=levels, stop_reason=stop_reason)
@@ -0,0 +1,136 @@
+from __future__ import annotations
+from typing import Any, Iterator
+
+import numpy as np
+
+from .node import ThoughtNode
+
+LABEL_CHARS = 80
+
+
+class ThoughtStore:
+    """
+    Thought graph as struct-of-arrays columns. Nodes are integer row ids; the
+    parent, score and level of each node live in NumPy columns, children are
+    threaded through first-child / next-sibling index columns, and content is
+    interned, so repeated thoughts (e.g. cached completions) are stored once.
+    Row 0 is a sentinel: a parent of 0 means "no parent", which keeps root
+    links falsy for JSON consumers.
+    """
+    def __init__(self, capacity: int = 64):
+        self._n = 1
+        self._content = np.zeros(capacity, dtype=np.int32)
+        self._parent = np.zeros(capacity, dtype=np.int32)
+        self._first_child = np.zeros(capacity, dtype=np.int32)
+        self._last_child = np.zeros(capacity, dtype=np.int32)
+        self._next_sibling = np.zeros(capacity, dtype=np.int32)
+        self._score = np.zeros(capacity, dtype=np.float64)
+        self._level = np.zeros(capacity, dtype=np.int16)
+        self._texts: list[str] = [""]
+        self._labels: list[str] = [""]
+        self._text_ids: dict[str, int] = {"": 0}
+
+    def __len__(self) -> int:
+        return self._n - 1
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(1, self._n))
+
+    def _grow(self) -> None:
+        size = len(self._parent) * 2
+        for name in ("_content", "_parent", "_first_child", "_last_child", "_next_sibling", "_score", "_level"):
+            col = getattr(self, name)
+            grown = np.zeros(size, dtype=col.dtype)
+            grown[:self._n] = col[:self._n]
+            setattr(self, name, grown)
+
+    def intern(self, text: str) -> int:
+        """Id of `text` in the content table, adding it (and its label) on first sight."""
+        i = self._text_ids.get(text)
+        if i is None:
+            i = self._text_ids[text] = len(self._texts)
+            self._texts.append(text)
+            self._labels.append(text[:LABEL_CHARS] + ("..." if len(text) > LABEL_CHARS else ""))
+        return i
+
+    def add(self, content: str, parent: int | None = None, score: float = 0.0, level: int = 0) -> int:
+        """Appends a node and returns its id."""
+        if self._n == len(self._parent):
+            self._grow()
+        i = self._n
+        self._n += 1
+        p = parent or 0
+        self._content[i] = self.intern(content)
+        self._parent[i] = p
+        self._score[i] = score
+        self._level[i] = level
+        if p:
+            if self._last_child[p]:
+                self._next_sibling[self._last_child[p]] = i
+            else:
+                self._first_child[p] = i
+            self._last_child[p] = i
+        return i
+
+    def add_node(self, node: ThoughtNode) -> ThoughtNode:
+        """Stores `node` and sets its `node_id`; returns the node."""
+        node.node_id = self.add(node.content, node.parent_id, node.score, node.level)
+        return node
+
+    def content(self, i: int) -> str:
+        return self._texts[self._content[i]]
+
+    def parent(self, i: int) -> int | None:
+        return int(self._parent[i]) or None
+
+    def score(self, i: int) -> float:
+        return float(self._score[i])
+
+    def set_score(self, i: int, score: float) -> None:
+        self._score[i] = score
+
+    def children(self, i: int) -> list[int]:
+        out = []
+        c = int(self._first_child[i])
+        while c:
+            out.append(c)
+            c = int(self._next_sibling[c])
+        return out
+
+    def node(self, i: int) -> ThoughtNode:
+        """Materializes row `i` as a ThoughtNode (content is shared, not copied)."""
+        return ThoughtNode(self.content(i), self.parent(i), i, self.score(i), int(self._level[i]))
+
+    def columns(self) -> dict[str, Any]:
+        """
+        Zero-copy views of the live rows: "id", "parent", "score", "level" and
+        "content" (ids into "texts"). They cover the rows present now and see
+        later score updates until the store next grows.
+        """
+        n = self._n
+        return {
+            "id": np.arange(1, n, dtype=np.int32),
+            "parent": self._parent[1:n],
+            "score": self._score[1:n],
+            "level": self._level[1:n],
+            "content": self._content[1:n],
+            "texts": self._texts,
+        }
+
+    def export(self, edges: bool = False) -> dict[str, Any]:
+        """
+        JSON-ready {"nodes": [{"id", "parent", "label", "score", "content"}]}
+        (plus "edges" on request). Columns are converted in bulk and every node
+        references the interned content and label strings instead of copying them.
+        """
+        n = self._n
+        texts, labels = self._texts, self._labels
+        parents = self._parent[1:n].tolist()
+        nodes = [
+            {"id": i, "parent": p or None, "label": labels[c], "score": s, "content": texts[c]}
+            for i, p, c, s in zip(range(1, n), parents, self._content[1:n].tolist(), self._score[1:n].tolist())
+        ]
+        out: dict[str, Any] = {"nodes": nodes}
+        if edges:
+            out["edges"] = [{"source": p, "target": i} for i, p in zip(range(1, n), parents) if p]
+        return out
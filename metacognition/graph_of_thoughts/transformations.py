@@ -1,6 +1,16 @@
 from __future__ import annotations
 from .node import ThoughtNode
-from typing import Sequence
+from typing import Callable, Protocol, Sequence
+
+BRANCH_PROMPTS = (
+    "Critically analyze the following statement and propose a counter-argument: {seed}",
+    "Expand on the implications of the following statement, focusing on risk: {seed}",
+    "Propose a concrete action plan based on the following statement: {seed}",
+)
+
+# Runs a batch of prompts concurrently; a None entry means the branch was
+# dropped (budget exhausted or cancelled).
+PromptRunner = Callable[[Sequence[str]], "list[str | None]"]
 
 def generator(seed: ThoughtNode, prompts: Sequence[str]) -> list[ThoughtNode]:
     return [ThoughtNode(content=p.format(seed=seed.content), parent_id=seed.node_id) for p in prompts]
@@ -8,3 +18,35 @@ def generator(seed: ThoughtNode, prompts: Sequence[str]) -> list[ThoughtNode]:
 def aggregator(best: Sequence[ThoughtNode]) -> ThoughtNode:
     merged = "\n\n".join([f"- ({n.score:.2f}) {n.content}" for n in best])
     return ThoughtNode(content=f"SYNTHESIS:\n{merged}", parent_id=best[0].parent_id if best else None)
+
+
+class ExpandOperator(Protocol):
+    def __call__(self, frontier: Sequence[ThoughtNode], width: int, run: PromptRunner) -> list[ThoughtNode]: ...
+
+
+class AggregateOperator(Protocol):
+    def __call__(self, best: Sequence[ThoughtNode]) -> ThoughtNode: ...
+
+
+class Generate:
+    """Expands every frontier node into `width` LLM-written children (one batch per level)."""
+    def __init__(self, prompts: Sequence[str] = BRANCH_PROMPTS, preamble: str = "You are a strategic planner. "):
+        self.prompts = tuple(prompts)
+        self.preamble = preamble
+
+    def __call__(self, frontier: Sequence[ThoughtNode], width: int, run: PromptRunner) -> list[ThoughtNode]:
+        templates = [self.prompts[i % len(self.prompts)] for i in range(width)]
+        pending = [n for seed in frontier for n in generator(seed, templates)]
+        outputs = run([self.preamble + n.content for n in pending])
+        children = []
+        for node, out in zip(pending, outputs):
+            if out is not None:
+                node.content = out
+                children.append(node)
+        return children
+
+
+class Aggregate:
+    """Merges the selected thoughts into a single synthesis node."""
+    def __call__(self, best: Sequence[ThoughtNode]) -> ThoughtNode:
+        return aggregator(best)
@@ -1,17 +1,23 @@
 from __future__ import annotations
-from typing import Any
+from typing import Any, Iterable
 from metacognition.graph_of_thoughts.node import ThoughtNode
+from metacognition.graph_of_thoughts.store import LABEL_CHARS, ThoughtStore
 
-def export_got_to_json(nodes: list[ThoughtNode]) -> dict[str, Any]:
-    return {
-        "nodes": [
-            {
-                "id": n.node_id,
-                "parent": n.parent_id,
-                "label": (n.content[:80] + ("..." if len(n.content) > 80 else "")),
-                "score": n.score,
-                "content": n.content,
-            }
-            for n in nodes
-        ]
-    }
+def export_got_to_json(graph: ThoughtStore | Iterable[ThoughtNode], edges: bool = False) -> dict[str, Any]:
+    """Nodes as {"id", "parent", "label", "score", "content"} for the 3D force graph."""
+    if isinstance(graph, ThoughtStore):
+        return graph.export(edges=edges)
+    nodes = [
+        {
+            "id": n.node_id,
+            "parent": n.parent_id,
+            "label": (n.content[:LABEL_CHARS] + ("..." if len(n.content) > LABEL_CHARS else "")),
+            "score": n.score,
+            "content": n.content,
+        }
+        for n in graph
+    ]
+    out: dict[str, Any] = {"nodes": nodes}
+    if edges:
+        out["edges"] = [{"source": n["parent"], "target": n["id"]} for n in nodes if n["parent"]]
+    return out
@@ -0,0 +1,136 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+import os
+import re
+import threading
+
+from core_inference.model_loader import estimate_tokens
+
+_WS_RE = re.compile(r"\s+")
+
+
+@dataclass
+class Evidence:
+    kind: str       # "vector" | "graph" | "community"
+    key: str        # dedupe key
+    text: str
+    score: float    # higher is better, in (0, 1]
+    source: str = ""
+
+
+class EvidenceChannel:
+    """Hands retrieval results to a planner running in a parallel branch."""
+    def __init__(self):
+        self._ready = threading.Event()
+        self._retrieved: Optional[dict[str, Any]] = None
+
+    def publish(self, retrieved: dict[str, Any]) -> None:
+        self._retrieved = retrieved
+        self._ready.set()
+
+    def get(self, timeout: float = 0.0) -> Optional[dict[str, Any]]:
+        """The retrieved evidence, or None if it hasn't landed within `timeout` seconds."""
+        return self._retrieved if self._ready.wait(timeout) else None
+
+
+def _norm(text: str) -> str:
+    return _WS_RE.sub(" ", text).strip().lower()
+
+
+def _clip(text: str, max_chars: int) -> str:
+    text = _WS_RE.sub(" ", text).strip()
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(" ", 0, max_chars)
+    return text[:cut if cut > max_chars // 2 else max_chars] + " ..."
+
+
+def collect_evidence(retrieved: dict[str, Any], max_chars: int = 800) -> list[Evidence]:
+    """
+    Deduplicated vector and graph hits, best first. Vector distances become
+    1 / (1 + distance); graph relations score 1 / (1 + hop), so direct relations
+    of linked entities rank with good vector matches and farther hops below.
+    When retrieval attached a fused (RRF) ranking, its scores, scaled to the
+    best hit, are used instead. Community summaries of entities in the query
+    score like direct relations (0.5); the largest-community fallback for
+    queries without known entities scores like a second hop.
+    """
+    best: dict[str, Evidence] = {}
+    fused = {(f["kind"], f["index"]): f["score"] for f in retrieved.get("fused") or []}
+    top = max(fused.values(), default=0.0) or 1.0
+
+    def keep(ev: Evidence) -> None:
+        cur = best.get(ev.key)
+        if cur is None or ev.score > cur.score:
+            best[ev.key] = ev
+
+    for i, h in enumerate(retrieved.get("vector_hits") or []):
+        text = h.get("text") or ""
+        if not text.strip():
+            continue
+        meta = h.get("meta") or {}
+        score = 1.0 / (1.0 + max(float(h.get("score", 0.0)), 0.0))
+        score = fused.get(("vector", i), score * top) / top if fused else score
+        keep(Evidence("vector", "v:" + _norm(text), _clip(text, max_chars), score, str(meta.get("source", ""))))
+
+    for i, g in enumerate(retrieved.get("graph_hits") or []):
+        if "error" in g or not g.get("subject"):
+            continue
+        s, p, o = g["subject"], g.get("predicate", "related_to"), g.get("object", "")
+        # Relations are expanded undirected, so the same edge can come back from both ends.
+        key = "g:" + "|".join(sorted((_norm(s), _norm(o)))) + "|" + _norm(p)
+        score = 1.0 / (1.0 + int(g.get("hop", 1)))
+        score = fused.get(("graph", i), score * top) / top if fused else score
+        keep(Evidence("graph", key, f"{s} -[{p}]-> {o}", score))
+
+    for c in retrieved.get("communities") or []:
+        score = 0.5 if c.get("matched") else 1.0 / 3.0
+        keep(Evidence("community", f"c:{c['community']}", _clip(c["summary"], max_chars), score))
+
+    return sorted(best.values(), key=lambda e: e.score, reverse=True)
+
+
+def assemble_context(retrieved: dict[str, Any], budget_tokens: int,
+                     count_tokens: Optional[Callable[[str], int]] = None,
+                     max_chars: Optional[int] = None) -> tuple[str, dict[str, Any]]:
+    """
+    Packs the highest-ranked evidence into `budget_tokens` as compact `[V1]` /
+    `[G1]` / `[C1]` lines and returns the context block plus a trace of what was kept.
+    Tokens are estimated per line by default; pass the model tokenizer as
+    `count_tokens` for exact packing.
+    """
+    count = count_tokens or estimate_tokens
+    max_chars = max_chars or int(os.getenv("SIA_EVIDENCE_MAX_CHARS", "800"))
+    evidence = collect_evidence(retrieved, max_chars)
+
+    lines_by_kind: dict[str, list[str]] = {"vector": [], "graph": [], "community": []}
+    kept: list[dict[str, Any]] = []
+    used = 0
+    for ev in evidence:
+        lines = lines_by_kind[ev.kind]
+        tag = f"{ev.kind[0].upper()}{len(lines) + 1}"
+        line = f"[{tag}] {ev.text}" + (f" (source: {ev.source})" if ev.source else "")
+        cost = count(line) + 1
+        if used + cost > budget_tokens:
+            continue
+        used += cost
+        lines.append(line)
+        kept.append({"id": tag, "kind": ev.kind, "score": round(ev.score, 4), "source": ev.source})
+
+    sections = [
+        f"## {title}\n" + "\n".join(lines_by_kind[kind])
+        for kind, title in (("vector", "Retrieved Memory"), ("graph", "Knowledge Graph"),
+                            ("community", "Graph Communities"))
+        if lines_by_kind[kind]
+    ]
+    trace = {
+        "kept": kept,
+        "dropped": len(evidence) - len(kept),
+        "tokens": used,
+        "budget": budget_tokens,
+    }
+    errors = [g["error"] for g in retrieved.get("graph_hits") or [] if "error" in g]
+    if errors:
+        trace["errors"] = errors
+    return "\n\n".join(sections), trace
@@ -1,5 +1,9 @@
 from __future__ import annotations
+from core_inference.context_manager import load_context_budget
 from core_inference.model_loader import load_inference_client, InferenceRequest
+from orchestration.context_assembly import assemble_context
+
+MIN_RESPONSE_TOKENS = 64
 
 SYSTEM_PROMPT = """You are SIA (Strategic Insider Assistant).
 Rules:
@@ -9,28 +13,86 @@ Rules:
 - Prefer structured outputs: bullets, checklists, and concise decision points.
 """
 
-def respond_node(state):
-    client = load_inference_client()
-    retrieved = state.get("retrieved", {})
-    plan = state.get("plan", "")
-
+def _prompt(query: str, history: str, evidence: str, plan: str) -> str:
     context_parts = []
-    if retrieved:
-        context_parts.append("## Retrieved Memory\n" + str(retrieved))
+    if history:
+        context_parts.append("## Conversation So Far\n" + history)
+    if evidence:
+        context_parts.append(evidence)
     if plan:
         context_parts.append("## GoT Plan\n" + plan)
-
     ctx = "\n\n".join(context_parts).strip()
-
-    prompt = f"""{SYSTEM_PROMPT}
+    return f"""{SYSTEM_PROMPT}
 
 User query:
-{state['user_query']}
+{query}
 
 {ctx}
 
 Now produce the best answer."""
 
-    text = client.complete(InferenceRequest(prompt=prompt, max_tokens=700, temperature=0.2))
-    state["response"] = text.strip()
-    return state
+def _drop_prefix(text: str, n_chars: int) -> str:
+    """`text` without its first `n_chars` characters, cut at the next line break."""
+    if n_chars >= len(text):
+        return ""
+    cut = text.find("\n", n_chars)
+    return text[cut + 1:] if cut != -1 else ""
+
+def respond_node(state):
+    """
+    Answers from the query, history, evidence and plan. When they leave less
+    than MIN_RESPONSE_TOKENS of the context window for the answer, the oldest
+    history goes first, then evidence, then the end of the plan; if the query
+    alone is too long, an error response is returned instead of calling the LLM.
+    """
+    client = load_inference_client()
+    client.register_prefix(SYSTEM_PROMPT)
+    retrieved = state.get("retrieved", {})
+    query = state["user_query"]
+    history = state.get("history") or ""
+    plan = state.get("plan", "")
+
+    budget = load_context_budget()
+    trace = {}
+
+    evidence = ""
+    evidence_budget = budget.evidence
+    if retrieved:
+        evidence, evidence_trace = assemble_context(retrieved, evidence_budget)
+        trace["evidence"] = evidence_trace
+        evidence_budget = evidence_trace["tokens"]
+
+    # Keep prompt + generation inside the model's context window.
+    trimmed = []
+    while True:
+        prompt = _prompt(query, history, evidence, plan)
+        prompt_tokens = client.count_tokens(prompt)
+        max_tokens = min(budget.output, budget.context - prompt_tokens)
+        if max_tokens >= MIN_RESPONSE_TOKENS:
+            break
+        need = MIN_RESPONSE_TOKENS - max_tokens
+        # ~4 characters per token, with some slack so one pass usually suffices.
+        if history:
+            history = _drop_prefix(history, need * 4 + 64)
+            trimmed.append("history")
+        elif evidence:
+            evidence_budget = max(evidence_budget - need - 16, 0)
+            evidence, evidence_trace = assemble_context(retrieved, evidence_budget) if evidence_budget else ("", {})
+            trace["evidence"] = evidence_trace
+            trimmed.append("evidence")
+        elif plan:
+            plan = plan[:max(len(plan) - need * 4 - 64, 0)]
+            trimmed.append("plan")
+        else:
+            trace["prompt_tokens"] = prompt_tokens
+            trace["error"] = "context_overflow"
+            msg = (f"The question is too long: it uses {prompt_tokens} of {budget.context} context tokens "
+                   f"and leaves no room for an answer. Please shorten it.")
+            print(msg)
+            return {"response": msg, "trace": trace}
+    if trimmed:
+        trace["trimmed"] = list(dict.fromkeys(trimmed))
+    trace["prompt_tokens"] = prompt_tokens
+
+    text = client.complete(InferenceRequest(prompt=prompt, max_tokens=max_tokens, temperature=0.2, stream=True))
+    return {"response": text.strip(), "trace": trace}
@@ -1,43 +1,156 @@
 from __future__ import annotations
+import contextvars
 import os
-import numpy as np
-import hashlib
-from memory_store.memgpt_lite.memory_kernel import LanceMemory
-from memory_store.graph_rag.neo4j_connector import Neo4jConnector, Neo4jConfig
-
-def embed_deterministic(text: str, dim: int = 384) -> np.ndarray:
-    h = hashlib.sha256(text.encode("utf-8")).digest()
-    rng = np.random.default_rng(int.from_bytes(h[:8], "little"))
-    v = rng.standard_normal(dim).astype(np.float32)
-    v /= max(float(np.linalg.norm(v)), 1e-6)
-    return v
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any
 
-def retrieve_node(state):
-    data_dir = os.getenv("SIA_DATA_DIR", "./data")
-    lancedb_path = os.getenv("LANCEDB_PATH", os.path.join(data_dir, "lancedb"))
-    mem = LanceMemory(lancedb_path)
+from core_inference.embeddings import embed_deterministic, load_embedder
+from l0_alignment.drift_detection.monitor import get_drift_monitor
+from memory_store.memgpt_lite.memory_kernel import get_memory
+from memory_store.graph_rag.community_index import get_community_index
+from memory_store.graph_rag.neo4j_connector import get_connector
 
-    q = state["user_query"]
-    q_emb = embed_deterministic(q)
-    hits = mem.search(q_emb, k=5)
+__all__ = ["embed_deterministic", "reciprocal_rank_fusion", "retrieve_node"]
+
+_EXECUTORS: dict[str, ThreadPoolExecutor] = {}
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def _executor(source: str) -> ThreadPoolExecutor:
+    """
+    Long-lived pool for one retrieval source, so requests don't pay thread
+    start-up. Each source has its own pool (SIA_VECTOR_WORKERS,
+    SIA_GRAPH_WORKERS, both defaulting to SIA_RETRIEVAL_WORKERS), so calls
+    hung on one store cannot take the workers another store needs.
+    """
+    pool = _EXECUTORS.get(source)
+    if pool is None:
+        with _EXECUTOR_LOCK:
+            pool = _EXECUTORS.get(source)
+            if pool is None:
+                default = os.getenv("SIA_RETRIEVAL_WORKERS", "8")
+                pool = _EXECUTORS[source] = ThreadPoolExecutor(
+                    max_workers=int(os.getenv(f"SIA_{source.upper()}_WORKERS", default)),
+                    thread_name_prefix=f"sia-retrieve-{source}",
+                )
+    return pool
+
+
+def _vector_search(q: str, k: int) -> list[dict[str, Any]]:
+    q_emb = load_embedder().embed_one(q)
+    monitor = get_drift_monitor()
+    if monitor is not None:
+        monitor.observe("query", q_emb)
+    hits = get_memory().search(q_emb, k=k)
+    return [{"text": h.text, "score": h.score, "meta": h.meta} for h in hits]
 
-    cfg = Neo4jConfig(
-        uri=os.getenv("NEO4J_URI", "bolt://localhost:7687"),
-        user=os.getenv("NEO4J_USER", "neo4j"),
-        password=os.getenv("NEO4J_PASSWORD", "please_change_me"),
+
+def _graph_search(q: str) -> list[dict[str, Any]]:
+    return get_connector().neighborhood(
+        q,
+        limit=20,
+        hops=int(os.getenv("SIA_GRAPH_HOPS", "1")),
+        fanout=int(os.getenv("SIA_GRAPH_FANOUT", "10")),
     )
-    graph_hits = []
-    try:
-        conn = Neo4jConnector(cfg)
-        conn.ensure_schema()
-        graph_hits = conn.neighborhood(q, limit=20)
-        conn.close()
-    except Exception as e:
-        graph_hits = [{"error": str(e)}]
-
-    state["retrieved"] = {
-        "vector_hits": [{"text": h.text, "score": h.score, "meta": h.meta} for h in hits],
-        "graph_hits": graph_hits,
+
+
+def reciprocal_rank_fusion(vector_hits: list[dict], graph_hits: list[dict], k: int = 60) -> list[dict[str, Any]]:
+    """
+    Fuses the two result lists with RRF (sum of 1 / (k + rank)). Besides each
+    store's own ranking, hits are ranked by cross-store agreement: chunks by how
+    many graph entities they mention, relations by whether their entities occur
+    in the retrieved chunks. Returns [{"kind", "index", "score"}], best first.
+    """
+    graph = [g for g in graph_hits if "error" not in g]
+    texts = [(h.get("text") or "").lower() for h in vector_hits]
+    entities = {str(e).lower() for g in graph for e in (g.get("subject"), g.get("object")) if e}
+
+    def agreement_v(i: int) -> int:
+        return sum(1 for e in entities if e in texts[i])
+
+    def agreement_g(g: dict) -> int:
+        return sum(1 for e in (g.get("subject"), g.get("object")) if e and any(str(e).lower() in t for t in texts))
+
+    scores: dict[tuple[str, int], float] = {}
+
+    def add(kind: str, ranked: list[int]) -> None:
+        for rank, i in enumerate(ranked):
+            scores[(kind, i)] = scores.get((kind, i), 0.0) + 1.0 / (k + rank + 1)
+
+    v_idx = list(range(len(vector_hits)))
+    g_idx = [i for i, g in enumerate(graph_hits) if "error" not in g]
+    add("vector", sorted(v_idx, key=lambda i: float(vector_hits[i].get("score", 0.0))))
+    add("graph", sorted(g_idx, key=lambda i: int(graph_hits[i].get("hop", 1))))
+    add("vector", sorted((i for i in v_idx if agreement_v(i)), key=agreement_v, reverse=True))
+    add("graph", sorted((i for i in g_idx if agreement_g(graph_hits[i])),
+                        key=lambda i: agreement_g(graph_hits[i]), reverse=True))
+    fused = [{"kind": kind, "index": i, "score": s} for (kind, i), s in scores.items()]
+    return sorted(fused, key=lambda f: f["score"], reverse=True)
+
+
+def retrieve_node(state):
+    """
+    Queries LanceDB and Neo4j concurrently. Each source has its own timeout
+    (SIA_VECTOR_TIMEOUT_S, SIA_GRAPH_TIMEOUT_S); a source that fails or times out
+    contributes an error entry instead of results, so a slow or down graph never
+    holds up the vector hits. SIA_HYBRID_RERANK=1 adds an RRF fusion of both lists.
+    Community summaries come from the in-memory community index while the
+    stores are queried.
+    """
+    q = state["user_query"]
+    start = time.monotonic()
+    # Sources run in copies of this context so their spans nest under the node's span.
+    futures = {
+        "vector": _executor("vector").submit(contextvars.copy_context().run, _vector_search, q, 5),
+        "graph": _executor("graph").submit(contextvars.copy_context().run, _graph_search, q),
+    }
+    timings: dict[str, float] = {}
+
+    def record(name: str):
+        def done(_fut) -> None:
+            timings[name] = round((time.monotonic() - start) * 1000.0, 1)
+        return done
+
+    for name, fut in futures.items():
+        fut.add_done_callback(record(name))
+    communities: list[dict[str, Any]] = []
+    errors: dict[str, str] = {}
+    index = get_community_index()
+    if index is not None:
+        try:
+            communities = index.context(q, limit=int(os.getenv("SIA_COMMUNITY_LIMIT", "3")))
+        except Exception as e:
+            errors["communities"] = str(e)
+    timeouts = {
+        "vector": float(os.getenv("SIA_VECTOR_TIMEOUT_S", "5")),
+        "graph": float(os.getenv("SIA_GRAPH_TIMEOUT_S", "3")),
+    }
+    results: dict[str, list[dict[str, Any]]] = {}
+    for name, fut in futures.items():
+        try:
+            results[name] = fut.result(timeout=max(start + timeouts[name] - time.monotonic(), 0.0))
+        except FutureTimeout:
+            # The worker keeps running in the background; its result is discarded.
+            errors[name] = f"{name} retrieval timed out after {timeouts[name]}s"
+        except Exception as e:
+            errors[name] = str(e)
+
+    vector_hits = results.get("vector", [])
+    graph_hits = results.get("graph") if "graph" not in errors else [{"error": errors["graph"]}]
+    retrieved = {"vector_hits": vector_hits, "graph_hits": graph_hits, "communities": communities}
+    if os.getenv("SIA_HYBRID_RERANK", "0") == "1":
+        retrieved["fused"] = reciprocal_rank_fusion(vector_hits, graph_hits)
+    channel = state.get("evidence_channel")
+    if channel is not None:
+        # A planner running in the parallel branch picks this up at its next level.
+        channel.publish(retrieved)
+
+    trace = {
+        "retrieval_counts": {"vector": len(vector_hits), "graph": len(graph_hits), "communities": len(communities)},
+        "retrieval_ms": dict(timings),
     }
-    state.setdefault("trace", {})["retrieval_counts"] = {"vector": len(hits), "graph": len(graph_hits)}
-    return state
+    if errors:
+        trace["retrieval_errors"] = errors
+    return {"retrieved": retrieved, "trace": trace}
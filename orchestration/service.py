@@ -0,0 +1,286 @@
+from __future__ import annotations
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Optional
+
+from pydantic import BaseModel
+
+from core_inference.model_loader import token_sink
+from l0_alignment.rule_store import get_policy
+from orchestration.respond import respond_node
+from orchestration.retrieval import retrieve_node
+from orchestration.state_graph import build_graph
+from orchestration.supervisor_agent import plan_node, supervisor_node
+from sia.tracing import TRACER, span
+
+_GRAPH = None
+_GRAPH_LOCK = threading.Lock()
+
+
+def get_graph():
+    """The SIA StateGraph, compiled once per process."""
+    global _GRAPH
+    if _GRAPH is None:
+        with _GRAPH_LOCK:
+            if _GRAPH is None:
+                _GRAPH = build_graph(
+                    supervisor_node=supervisor_node,
+                    retrieve_node=retrieve_node,
+                    plan_node=plan_node,
+                    respond_node=respond_node,
+                )
+    return _GRAPH
+
+
+class QueryRequest(BaseModel):
+    query: str
+    history: str = ""
+
+
+class ServiceBusy(Exception):
+    """Raised when the request queue is full."""
+
+
+class ServiceMetrics:
+    """Queue depth, throughput and latency percentiles over the last `window` requests."""
+    def __init__(self, window: int = 1024):
+        self.in_flight = 0
+        self.queued = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.latency_ms: deque[float] = deque(maxlen=window)
+        self.queue_wait_ms: deque[float] = deque(maxlen=window)
+        self.first_token_ms: deque[float] = deque(maxlen=window)
+        self.node_ms: dict[str, deque[float]] = {}
+        self.window = window
+
+    def observe_node(self, node: str, ms: float) -> None:
+        self.node_ms.setdefault(node, deque(maxlen=self.window)).append(ms)
+
+    @staticmethod
+    def _percentiles(values) -> dict[str, float]:
+        if not values:
+            return {}
+        s = sorted(values)
+
+        def pick(q: float) -> float:
+            return round(s[min(len(s) - 1, int(q * len(s)))], 1)
+
+        return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": round(s[-1], 1)}
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "latency_ms": self._percentiles(self.latency_ms),
+            "queue_wait_ms": self._percentiles(self.queue_wait_ms),
+            "first_token_ms": self._percentiles(self.first_token_ms),
+            "node_ms": {n: self._percentiles(v) for n, v in self.node_ms.items()},
+        }
+
+
+class SIAService:
+    """
+    Long-running front end for the compiled graph. Requests run through
+    `astream` (sync nodes execute on the event loop's thread pool) with at most
+    `max_concurrency` graphs in flight; up to `max_queue` more wait for a slot and
+    anything beyond that is rejected with ServiceBusy (see `has_capacity`). Each request gets its own
+    token sink and output guard, so tokens and node events stream per client.
+    """
+    def __init__(self, max_concurrency: Optional[int] = None, max_queue: Optional[int] = None):
+        self.max_concurrency = max_concurrency or int(os.getenv("SIA_MAX_CONCURRENCY", "16"))
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv("SIA_MAX_QUEUE", "64"))
+        self.graph = get_graph()
+        self.metrics = ServiceMetrics()
+        self._sem: Optional[asyncio.Semaphore] = None
+
+    def install_executor(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Sizes the loop's default executor (used for sync graph nodes) to the concurrency limit."""
+        loop.set_default_executor(ThreadPoolExecutor(
+            max_workers=self.max_concurrency * 2, thread_name_prefix="sia-node",
+        ))
+
+    def has_capacity(self) -> bool:
+        """True when a new request can run now or wait in the queue."""
+        return self.metrics.in_flight + self.metrics.queued < self.max_concurrency + self.max_queue
+
+    async def stream(self, query: str, history: str = "") -> AsyncIterator[dict[str, Any]]:
+        """
+        Yields events for one request: {"type": "node", "node", "ms"} as each
+        graph node finishes, {"type": "token", "text"} as the answer streams, then
+        {"type": "done", "response", "trace"} (or {"type": "error", "error"}).
+        """
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+        policy = get_policy()
+        d = policy.check_input(query)
+        if not d.allowed:
+            yield {"type": "done", "response": f"REJECTED by L0 Temple: {d.reason}", "trace": {"l0": d.reason}}
+            return
+        if not self.has_capacity():
+            self.metrics.rejected += 1
+            raise ServiceBusy(f"request queue is full ({self.max_queue} waiting)")
+        # Reserve the place in the same step as the check (no await in between), so
+        # concurrent requests cannot all pass the check before any is counted. It
+        # counts as queued until the task holds a semaphore slot.
+        self.metrics.queued += 1
+        waiting = True
+
+        def leave_queue() -> None:
+            nonlocal waiting
+            if waiting:
+                waiting = False
+                self.metrics.queued -= 1
+
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+        started = time.monotonic()
+        abandoned = threading.Event()
+
+        def emit(ev: dict[str, Any]) -> None:
+            # Every event goes through the loop's callback queue, so tokens sent from
+            # the worker thread and events sent from the loop keep their order.
+            loop.call_soon_threadsafe(events.put_nowait, ev)
+
+        guard = policy.output_stream()
+        forward = guard.stream_to(lambda text: emit({"type": "token", "text": text}))
+
+        def on_token(tok: str) -> bool:
+            # Called from the worker thread running respond_node.
+            if abandoned.is_set():
+                return False
+            if not guard.fed:
+                self.metrics.first_token_ms.append((time.monotonic() - started) * 1000.0)
+            return forward(tok)
+
+        async def run() -> None:
+            final: dict[str, Any] = {}
+            try:
+                async with self._sem:
+                    leave_queue()
+                    self.metrics.queue_wait_ms.append((time.monotonic() - started) * 1000.0)
+                    self.metrics.in_flight += 1
+                    try:
+                        last = time.monotonic()
+                        with token_sink(on_token), span("request", service=True):
+                            inputs = {"user_query": d.sanitized, "history": history, "trace": {}}
+                            async for mode, chunk in self.graph.astream(inputs, stream_mode=["updates", "values"]):
+                                if mode == "values":
+                                    final = chunk
+                                    continue
+                                now = time.monotonic()
+                                for node in chunk:
+                                    ms = (now - last) * 1000.0
+                                    self.metrics.observe_node(node, ms)
+                                    emit({"type": "node", "node": node, "ms": round(ms, 1)})
+                                last = now
+                    finally:
+                        self.metrics.in_flight -= 1
+                out_dec = guard.close() if guard.fed else policy.check_output(final.get("response", ""))
+                response = final.get("response", "")
+                if not out_dec.allowed:
+                    response = f"REJECTED by L0 Temple (output): {out_dec.reason}"
+                self.metrics.completed += 1
+                emit({"type": "done", "response": response, "trace": final.get("trace", {})})
+            except Exception as e:
+                self.metrics.failed += 1
+                emit({"type": "error", "error": str(e)})
+            finally:
+                self.metrics.latency_ms.append((time.monotonic() - started) * 1000.0)
+
+        task = asyncio.create_task(run())
+        # Also frees the reservation if the task is cancelled before it ever runs.
+        task.add_done_callback(lambda _task: leave_queue())
+        try:
+            while True:
+                ev = await events.get()
+                yield ev
+                if ev["type"] in ("done", "error"):
+                    break
+        finally:
+            if not task.done():
+                # Client went away: stop generation at the next token and free the slot.
+                abandoned.set()
+                task.cancel()
+
+    async def run(self, query: str, history: str = "") -> dict[str, Any]:
+        """Runs one request to completion and returns {"response", "trace"}."""
+        async for ev in self.stream(query, history):
+            if ev["type"] == "done":
+                return {"response": ev["response"], "trace": ev["trace"]}
+            if ev["type"] == "error":
+                raise RuntimeError(ev["error"])
+        raise RuntimeError("graph finished without a response")
+
+
+def create_app(service: Optional[SIAService] = None):
+    """
+    FastAPI app exposing the service (install the `serve` extra):
+    POST /v1/query (JSON), POST /v1/query/stream (server-sent events),
+    GET /metrics and GET /healthz.
+    """
+    from contextlib import asynccontextmanager
+
+    from fastapi import FastAPI, HTTPException
+    from fastapi.responses import PlainTextResponse, StreamingResponse
+
+    svc = service or SIAService()
+
+    @asynccontextmanager
+    async def lifespan(_app):
+        svc.install_executor(asyncio.get_running_loop())
+        yield
+
+    app = FastAPI(title="SIA", lifespan=lifespan)
+
+    @app.post("/v1/query")
+    async def query(req: QueryRequest):
+        try:
+            return await svc.run(req.query, req.history)
+        except ServiceBusy as e:
+            raise HTTPException(status_code=503, detail=str(e)) from e
+
+    @app.post("/v1/query/stream")
+    async def query_stream(req: QueryRequest):
+        # Early 503 before the stream opens; stream() still reserves the slot atomically
+        # and reports a full queue found there as an error event.
+        if not svc.has_capacity():
+            svc.metrics.rejected += 1
+            raise HTTPException(status_code=503, detail="request queue is full")
+
+        async def sse() -> AsyncIterator[str]:
+            try:
+                async for ev in svc.stream(req.query, req.history):
+                    yield f"event: {ev['type']}\ndata: {json.dumps(ev, ensure_ascii=False, default=str)}\n\n"
+            except ServiceBusy as e:
+                yield f"event: error\ndata: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
+
+        return StreamingResponse(sse(), media_type="text/event-stream")
+
+    @app.get("/metrics")
+    async def metrics():
+        return svc.metrics.snapshot()
+
+    @app.get("/metrics/prometheus", response_class=PlainTextResponse)
+    async def metrics_prometheus():
+        return TRACER.prometheus_text()
+
+    @app.get("/traces")
+    async def traces():
+        """Buffered spans as OTLP/JSON (SIA_TRACING=1)."""
+        return TRACER.export_otlp_json()
+
+    @app.get("/healthz")
+    async def healthz():
+        return {"ok": True}
+
+    return app
@@ -1,25 +1,39 @@
 from __future__ import annotations
-from typing import TypedDict, Any
+from typing import Annotated, Any, TypedDict
 from langgraph.graph import StateGraph, END
+from sia.tracing import traced_node
+
+def merge_trace(current: dict[str, Any] | None, update: dict[str, Any] | None) -> dict[str, Any]:
+    """Reducer for `trace`: parallel branches each contribute their own keys."""
+    return {**(current or {}), **(update or {})}
 
 class SIAState(TypedDict, total=False):
     user_query: str
+    history: str
     mode: str
     retrieved: dict
     plan: str
     response: str
-    trace: dict[str, Any]
+    evidence_channel: Any  # hands retrieval results to a planner running alongside (mode "both")
+    trace: Annotated[dict[str, Any], merge_trace]
 
 def build_graph(supervisor_node, retrieve_node, plan_node, respond_node):
+    """
+    supervisor -> retrieve | plan | (retrieve + plan in parallel) -> respond.
+    Nodes return partial updates, so the two branches of mode "both" run in the
+    same step without conflicting writes and `respond` runs once both are done.
+    """
     g = StateGraph(SIAState)
-    g.add_node("supervisor", supervisor_node)
-    g.add_node("retrieve", retrieve_node)
-    g.add_node("plan", plan_node)
-    g.add_node("respond", respond_node)
+    g.add_node("supervisor", traced_node("supervisor", supervisor_node))
+    g.add_node("retrieve", traced_node("retrieve", retrieve_node))
+    g.add_node("plan", traced_node("plan", plan_node))
+    g.add_node("respond", traced_node("respond", respond_node))
     g.set_entry_point("supervisor")
 
     def route(state: SIAState):
         m = state.get("mode", "direct")
+        if m == "both":
+            return ["retrieve", "plan"]
         if m == "retrieve":
             return "retrieve"
         if m == "plan":
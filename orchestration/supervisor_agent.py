@@ -1,21 +1,57 @@
 from __future__ import annotations
+import os
 from metacognition.graph_of_thoughts.planner import GraphOfThoughtsPlanner
 from metacognition.visualization.graph_export import export_got_to_json
+from orchestration.context_assembly import EvidenceChannel, assemble_context
+
+PLAN_KEYWORDS = ["plan", "strategy", "roadmap", "wargame", "decision tree"]
+RETRIEVE_KEYWORDS = ["who", "what", "when", "contract", "clause", "email", "document", "history"]
 
 def supervisor_node(state):
+    """
+    Picks the route. Queries that need both evidence and a plan get mode "both"
+    (retrieval and GoT planning run as parallel branches) unless
+    SIA_PARALLEL_BRANCHES=0, in which case retrieval wins as before.
+    """
     q = state["user_query"].lower()
+    wants_plan = any(k in q for k in PLAN_KEYWORDS)
+    wants_evidence = any(k in q for k in RETRIEVE_KEYWORDS)
     mode = "direct"
-    if any(k in q for k in ["plan", "strategy", "roadmap", "wargame", "decision tree"]):
+    if wants_plan:
         mode = "plan"
-    if any(k in q for k in ["who", "what", "when", "contract", "clause", "email", "document", "history"]):
+    if wants_evidence:
         mode = "retrieve"
-    state["mode"] = mode
-    state.setdefault("trace", {})["supervisor_mode"] = mode
-    return state
+    if wants_plan and wants_evidence and os.getenv("SIA_PARALLEL_BRANCHES", "1") != "0":
+        mode = "both"
+    update = {"mode": mode, "trace": {"supervisor_mode": mode}}
+    if mode == "both":
+        update["evidence_channel"] = EvidenceChannel()
+    return update
 
 def plan_node(state):
-    planner = GraphOfThoughtsPlanner()
-    res = planner.plan(state["user_query"], depth=2, width=3)
-    state["plan"] = res.final.content
-    state.setdefault("trace", {})["got_graph"] = export_got_to_json(res.explored)
-    return state
+    """
+    Runs the GoT planner. Alongside retrieval (mode "both") it starts on the
+    query right away and folds the retrieved evidence into its prompts from the
+    first level after the evidence lands. Once SIA_GOT_ENOUGH branches of a
+    level score at least SIA_GOT_MIN_SCORE, the rest of that level is cancelled
+    (0 disables the early stop).
+    """
+    enough = int(os.getenv("SIA_GOT_ENOUGH", "2"))
+    planner = GraphOfThoughtsPlanner(
+        enough=enough or None,
+        min_score=float(os.getenv("SIA_GOT_MIN_SCORE", "1.0")),
+    )
+    channel = state.get("evidence_channel")
+    evidence = None
+    if channel is not None:
+        budget = int(os.getenv("SIA_GOT_EVIDENCE_TOKENS", "512"))
+
+        def evidence():
+            retrieved = channel.get()
+            return assemble_context(retrieved, budget)[0] if retrieved else None
+
+    res = planner.plan(state["user_query"], depth=2, width=3, evidence=evidence)
+    trace = {"got_graph": export_got_to_json(res.store)}
+    if channel is not None:
+        trace["plan_evidence_level"] = res.trace.get("evidence_level")
+    return {"plan": res.final.content, "trace": trace}
@@ -1,23 +1,38 @@
 from __future__ import annotations
+import os
 from dotenv import load_dotenv
 load_dotenv()
 
-from l0_alignment.policy import L0Policy
+from l0_alignment.rule_store import get_policy
+from core_inference.model_loader import token_sink
+from sia.tracing import TRACER, enabled as tracing_enabled, span
 from orchestration.state_graph import build_graph
 from orchestration.supervisor_agent import supervisor_node, plan_node
 from orchestration.retrieval import retrieve_node
 from orchestration.respond import respond_node
 
 def main():
-    policy = L0Policy()
+    policy = get_policy()
     q = input("SIA> ").strip()
     d = policy.check_input(q)
     if not d.allowed:
         print(f"REJECTED: {d.reason}")
         return
     graph = build_graph(supervisor_node, retrieve_node, plan_node, respond_node)
-    out = graph.invoke({"user_query": d.sanitized, "trace": {}})
-    print(out.get("response", ""))
+    guard = policy.output_stream()
+    on_token = guard.stream_to(lambda text: print(text, end="", flush=True))
+
+    with token_sink(on_token), span("request"):
+        out = graph.invoke({"user_query": d.sanitized, "trace": {}})
+    out_dec = guard.close() if guard.fed else policy.check_output(out.get("response", ""))
+    if guard.fed:
+        print()
+    elif out_dec.allowed:
+        print(out.get("response", ""))
+    if not out_dec.allowed:
+        print(f"REJECTED (output): {out_dec.reason}")
+    if tracing_enabled() and os.getenv("SIA_TRACE_FILE"):
+        TRACER.write_otlp_json(os.getenv("SIA_TRACE_FILE"))
 
 if __name__ == "__main__":
     main()
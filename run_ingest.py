@@ -0,0 +1,48 @@
+from __future__ import annotations
+import argparse
+import json
+import os
+from dotenv import load_dotenv
+load_dotenv()
+
+from memory_store.ingestion.pipeline import IngestConfig, IngestPipeline
+
+def main():
+    ap = argparse.ArgumentParser(description="Bulk-ingest directories / JSONL files into SIA memory.")
+    ap.add_argument("paths", nargs="+", help="Directories (.txt/.md/.rst/.jsonl) or files to ingest")
+    ap.add_argument("--text-field", default="text", help="JSONL field holding the document text")
+    ap.add_argument("--chunk-size", type=int, default=1200)
+    ap.add_argument("--chunk-overlap", type=int, default=200)
+    ap.add_argument("--write-batch", type=int, default=4096, help="Chunks per LanceDB append")
+    ap.add_argument("--no-graph", action="store_true", help="Skip triplet extraction and Neo4j writes")
+    ap.add_argument("--extract-workers", type=int, default=2, help="Triplet extraction processes (1 = in-process)")
+    ap.add_argument("--graph-batch", type=int, default=2000)
+    ap.add_argument("--graph-workers", type=int, default=2)
+    ap.add_argument("--queue-size", type=int, default=1024)
+    ap.add_argument("--checkpoint", default=os.path.join(os.getenv("SIA_DATA_DIR", "./data"), "ingest_checkpoint.json"))
+    ap.add_argument("--save-interval", type=float, default=60.0,
+                    help="Seconds between checkpoint and community index saves")
+    ap.add_argument("--restart", action="store_true", help="Ignore the checkpoint and ingest everything again")
+    args = ap.parse_args()
+
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    cfg = IngestConfig(
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        write_batch=args.write_batch,
+        graph=not args.no_graph,
+        extract_workers=args.extract_workers,
+        graph_batch=args.graph_batch,
+        graph_workers=args.graph_workers,
+        queue_size=args.queue_size,
+        jsonl_text_field=args.text_field,
+        checkpoint_path=args.checkpoint,
+        save_interval_s=args.save_interval,
+    )
+    stats = IngestPipeline(cfg).run(args.paths)
+    print(json.dumps(stats.as_dict(), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+from __future__ import annotations
+import argparse
+import os
+from dotenv import load_dotenv
+load_dotenv()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Serve SIA over HTTP (requires the `serve` extra).")
+    ap.add_argument("--host", default=os.getenv("SIA_HOST", "127.0.0.1"))
+    ap.add_argument("--port", type=int, default=int(os.getenv("SIA_PORT", "8000")))
+    ap.add_argument("--max-concurrency", type=int, default=None, help="graphs in flight (SIA_MAX_CONCURRENCY)")
+    ap.add_argument("--max-queue", type=int, default=None, help="requests waiting for a slot (SIA_MAX_QUEUE)")
+    args = ap.parse_args()
+
+    import uvicorn
+    from orchestration.service import SIAService, create_app
+
+    app = create_app(SIAService(max_concurrency=args.max_concurrency, max_queue=args.max_queue))
+    # One process, one event loop: concurrency comes from the service's slot pool.
+    uvicorn.run(app, host=args.host, port=args.port, workers=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+from __future__ import annotations
+import contextvars
+import functools
+import json
+import os
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, Optional
+
+# Span attributes summed into Prometheus counters (sia_<attr>_total{span=...}).
+COUNTED_ATTRIBUTES = (
+    "llm.prompt_tokens", "llm.completion_tokens", "llm.cached_tokens",
+    "cache.hits", "cache.misses", "rows",
+)
+LATENCY_BUCKETS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_ENABLED = os.getenv("SIA_TRACING", "0").lower() in ("1", "true", "t")
+
+
+def enabled() -> bool:
+    return _ENABLED
+
+
+def set_enabled(on: bool) -> None:
+    global _ENABLED
+    _ENABLED = on
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start_ns: int
+    end_ns: int = 0
+    attributes: dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def add(self, key: str, value: float) -> None:
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+    @property
+    def duration_s(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e9
+
+
+class _NoopSpan:
+    """Stand-in yielded while tracing is disabled; every call is a no-op."""
+    __slots__ = ()
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def add(self, key: str, value: float) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+_CURRENT: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("sia_span", default=None)
+
+
+class Tracer:
+    """
+    Keeps the last `buffer` finished spans for export and aggregates every span
+    into per-name latency histograms and attribute counters for Prometheus.
+    """
+    def __init__(self, buffer: int = 4096):
+        self.spans: deque[Span] = deque(maxlen=buffer)
+        self._lock = threading.Lock()
+        self._count: dict[str, int] = {}
+        self._errors: dict[str, int] = {}
+        self._sum_s: dict[str, float] = {}
+        self._buckets: dict[str, list[int]] = {}
+        self._counters: dict[tuple[str, str], float] = {}
+
+    def record(self, span: Span) -> None:
+        d = span.duration_s
+        with self._lock:
+            self.spans.append(span)
+            n = span.name
+            self._count[n] = self._count.get(n, 0) + 1
+            self._sum_s[n] = self._sum_s.get(n, 0.0) + d
+            if span.error:
+                self._errors[n] = self._errors.get(n, 0) + 1
+            buckets = self._buckets.setdefault(n, [0] * len(LATENCY_BUCKETS_S))
+            for i, le in enumerate(LATENCY_BUCKETS_S):
+                if d <= le:
+                    buckets[i] += 1
+            for key in COUNTED_ATTRIBUTES:
+                v = span.attributes.get(key)
+                if isinstance(v, (int, float)) and not isinstance(v, bool):
+                    self._counters[(n, key)] = self._counters.get((n, key), 0.0) + v
+
+    def prometheus_text(self) -> str:
+        """Prometheus exposition format of the aggregated spans."""
+        lines = [
+            "# HELP sia_span_duration_seconds Wall time of traced operations.",
+            "# TYPE sia_span_duration_seconds histogram",
+        ]
+        with self._lock:
+            for n in sorted(self._count):
+                for le, c in zip(LATENCY_BUCKETS_S, self._buckets[n]):
+                    lines.append(f'sia_span_duration_seconds_bucket{{span="{n}",le="{le}"}} {c}')
+                lines.append(f'sia_span_duration_seconds_bucket{{span="{n}",le="+Inf"}} {self._count[n]}')
+                lines.append(f'sia_span_duration_seconds_sum{{span="{n}"}} {self._sum_s[n]:.6f}')
+                lines.append(f'sia_span_duration_seconds_count{{span="{n}"}} {self._count[n]}')
+            lines.append("# TYPE sia_span_errors_total counter")
+            for n, c in sorted(self._errors.items()):
+                lines.append(f'sia_span_errors_total{{span="{n}"}} {c}')
+            for key in COUNTED_ATTRIBUTES:
+                metric = "sia_" + key.replace(".", "_") + "_total"
+                rows = [(n, v) for (n, k), v in sorted(self._counters.items()) if k == key]
+                if rows:
+                    lines.append(f"# TYPE {metric} counter")
+                    lines.extend(f'{metric}{{span="{n}"}} {v:g}' for n, v in rows)
+        return "\n".join(lines) + "\n"
+
+    def export_otlp_json(self, clear: bool = False) -> dict[str, Any]:
+        """Buffered spans as an OTLP/JSON `ExportTraceServiceRequest` body."""
+        with self._lock:
+            spans = list(self.spans)
+            if clear:
+                self.spans.clear()
+        return {"resourceSpans": [{
+            "resource": {"attributes": [_otlp_attr("service.name", os.getenv("SIA_SERVICE_NAME", "sia"))]},
+            "scopeSpans": [{"scope": {"name": "sia.tracing"}, "spans": [_otlp_span(s) for s in spans]}],
+        }]}
+
+    def write_otlp_json(self, path: str) -> None:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(self.export_otlp_json(clear=True)) + "\n")
+
+
+def _otlp_attr(key: str, value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        v = {"boolValue": value}
+    elif isinstance(value, int):
+        v = {"intValue": str(value)}
+    elif isinstance(value, float):
+        v = {"doubleValue": value}
+    else:
+        v = {"stringValue": str(value)}
+    return {"key": key, "value": v}
+
+
+def _otlp_span(s: Span) -> dict[str, Any]:
+    out = {
+        "traceId": s.trace_id,
+        "spanId": s.span_id,
+        "name": s.name,
+        "kind": 1,
+        "startTimeUnixNano": str(s.start_ns),
+        "endTimeUnixNano": str(s.end_ns),
+        "attributes": [_otlp_attr(k, v) for k, v in s.attributes.items()],
+        "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+    }
+    if s.parent_id:
+        out["parentSpanId"] = s.parent_id
+    return out
+
+
+TRACER = Tracer(int(os.getenv("SIA_TRACE_BUFFER", "4096")))
+
+
+@contextmanager
+def span(name: str, activate: bool = True, **attributes: Any) -> Iterator[Any]:
+    """
+    Times the block as a child of the current span. With `activate=False` the
+    span does not become current (needed inside generators, whose context is
+    shared with the consumer). Only `Exception`s mark the span as failed; a
+    closed generator or cancelled task sets the `cancelled` attribute instead.
+    Yields NOOP_SPAN when tracing is disabled.
+    """
+    if not _ENABLED:
+        yield NOOP_SPAN
+        return
+    parent = _CURRENT.get()
+    s = Span(
+        name=name,
+        trace_id=parent.trace_id if parent else secrets.token_hex(16),
+        span_id=secrets.token_hex(8),
+        parent_id=parent.span_id if parent else None,
+        start_ns=time.time_ns(),
+        attributes=dict(attributes),
+    )
+    tok = _CURRENT.set(s) if activate else None
+    try:
+        yield s
+    except Exception as e:
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    except BaseException as e:
+        # GeneratorExit (consumer stopped early), CancelledError, interrupts:
+        # the operation was abandoned, not failed.
+        s.set("cancelled", type(e).__name__)
+        raise
+    finally:
+        if tok is not None:
+            _CURRENT.reset(tok)
+        s.end_ns = time.time_ns()
+        TRACER.record(s)
+
+
+def current_span() -> Any:
+    s = _CURRENT.get() if _ENABLED else None
+    return s if s is not None else NOOP_SPAN
+
+
+def traced(name: str) -> Callable[[Callable], Callable]:
+    """Decorator form of `span`; costs one flag check per call when tracing is off."""
+    def deco(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _ENABLED:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def traced_node(name: str, fn: Callable) -> Callable:
+    """Wraps a LangGraph node so each run is a `node.<name>` span."""
+    return traced(f"node.{name}")(fn)
+
+
+def record_llm_timings(s: Any, payload: dict[str, Any]) -> None:
+    """Copies llama.cpp's per-request `timings` (and token counters) onto span `s`."""
+    t = payload.get("timings") or {}
+    if "prompt_n" in t:
+        s.set("llm.prompt_tokens", int(t["prompt_n"]))
+        s.set("llm.prompt_ms", float(t.get("prompt_ms", 0.0)))
+    if "predicted_n" in t:
+        s.set("llm.completion_tokens", int(t["predicted_n"]))
+        s.set("llm.predicted_ms", float(t.get("predicted_ms", 0.0)))
+    if "cache_n" in t:
+        s.set("llm.cached_tokens", int(t["cache_n"]))
+    elif "tokens_cached" in payload:
+        s.set("llm.cached_tokens", int(payload["tokens_cached"]))
@@ -0,0 +1,94 @@
+import json
+import random
+
+import pytest
+
+from memory_store.ingestion.pipeline import (
+    Checkpoint, _range_add, _range_contains, _range_remove, iter_documents,
+)
+
+
+def _expand(ranges):
+    return {x for lo, hi in ranges for x in range(lo, hi + 1)}
+
+
+def test_ranges_match_a_set():
+    rng = random.Random(7)
+    ranges, model = [], set()
+    for _ in range(2000):
+        x = rng.randint(1, 60)
+        if rng.random() < 0.6:
+            _range_add(ranges, x)
+            model.add(x)
+        else:
+            _range_remove(ranges, x)
+            model.discard(x)
+        assert _expand(ranges) == model
+        # Sorted, disjoint and maximal: neighbouring ranges never touch.
+        assert all(a[1] + 1 < b[0] for a, b in zip(ranges, ranges[1:]))
+        assert all(lo <= hi for lo, hi in ranges)
+    assert all(_range_contains(ranges, x) == (x in model) for x in range(0, 62))
+
+
+@pytest.mark.parametrize("adds, expected", [
+    ([1, 3, 2], [[1, 3]]),
+    ([5, 1, 3], [[1, 1], [3, 3], [5, 5]]),
+    ([4, 4, 5], [[4, 5]]),
+])
+def test_range_add_merges(adds, expected):
+    ranges = []
+    for x in adds:
+        _range_add(ranges, x)
+    assert ranges == expected
+
+
+def test_range_remove_splits():
+    ranges = [[1, 5]]
+    _range_remove(ranges, 3)
+    assert ranges == [[1, 2], [4, 5]]
+    _range_remove(ranges, 9)
+    assert ranges == [[1, 2], [4, 5]]
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "docs.jsonl"
+    path.write_text("".join(json.dumps({"text": f"doc {i}"}) + "\n" for i in range(1, 6)))
+    return str(path)
+
+
+def test_checkpoint_round_trip_and_graph_retries(tmp_path, source):
+    ck_path = str(tmp_path / "ck.json")
+    ck = Checkpoint(ck_path)
+    ck.commit(source, 5, done=True)
+    ck.mark_graph(source, 2, ok=False)
+    ck.mark_graph(source, 3, ok=False)
+    ck.mark_graph(source, 4, ok=False)
+    ck.mark_graph(source, 3, ok=True)
+    ck.save()
+
+    ck = Checkpoint(ck_path)
+    assert ck.resume_position(source) == -1
+    assert ck.graph_failed(source) == [[2, 2], [4, 4]]
+
+    docs = list(iter_documents([source], ck))
+    assert [(d.position, d.text, d.graph_only) for d in docs] == [
+        (2, "doc 2", True), (4, "doc 4", True),
+    ]
+    # A run without the graph stage neither retries nor forgets the failed documents.
+    assert list(iter_documents([source], ck, graph_retries=False)) == []
+    assert ck.graph_failed(source) == [[2, 2], [4, 4]]
+
+
+def test_commit_keeps_failures_until_the_file_changes(tmp_path, source):
+    ck = Checkpoint(None)
+    ck.commit(source, 2, done=False)
+    ck.mark_graph(source, 1, ok=False)
+    ck.commit(source, 5, done=True)
+    assert ck.graph_failed(source) == [[1, 1]]
+
+    with open(source, "a") as f:
+        f.write(json.dumps({"text": "doc 6"}) + "\n")
+    assert ck.resume_position(source) is None
+    assert ck.graph_failed(source) == []
+    assert [d.position for d in iter_documents([source], ck)] == [1, 2, 3, 4, 5, 6, -1]
@@ -0,0 +1,92 @@
+import threading
+import time
+
+import pytest
+
+from metacognition.graph_of_thoughts import planner
+from metacognition.graph_of_thoughts.planner import GoTPlanner
+from metacognition.graph_of_thoughts.scoring import HeuristicScorer
+from metacognition.graph_of_thoughts.search import SearchBudget
+
+GOOD = "Stage the rollout because the risk is contained; therefore add a mitigation step."
+WEAK = "ok"
+
+
+class _FakeLLM:
+    """Counts LLM calls. Branches 0 and 1 answer well at once; the others stall until cancelled."""
+    def __init__(self):
+        self.client = self
+        self.streams = 0
+        self.completions = 0
+        self._lock = threading.Lock()
+
+    def register_prefix(self, prefix):
+        pass
+
+    def stream(self, req):
+        with self._lock:
+            self.streams += 1
+        if req.extra["seed"] < 2:
+            yield GOOD
+            return
+        # Slow branch: gives up as soon as it is cancelled.
+        if req.cancel.wait(2.0):
+            return
+        yield WEAK
+
+    def get_completion(self, prompt, **kwargs):
+        with self._lock:
+            self.completions += 1
+        return "final recommendation"
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    fake = _FakeLLM()
+    monkeypatch.setattr(planner, "LLM_CLIENT", fake)
+    return fake
+
+
+def _planner(**kwargs):
+    return GoTPlanner(scorer=HeuristicScorer(relevance_weight=0.0), max_concurrency=8, **kwargs)
+
+
+def test_call_budget_stops_the_search(llm):
+    budget = SearchBudget(max_llm_calls=4, max_tokens=100_000, max_seconds=30)
+    res = _planner(budget=budget).plan("Plan the rollout", depth=3, width=2, beam=2)
+    search = res.trace["search"]
+    # One call is held back for the synthesis: 3 branches for the search, then it stops.
+    assert search["llm_calls"] == 3
+    assert search["stop_reason"] == "llm_calls"
+    assert llm.streams == 3 and llm.completions == 1
+    assert res.final.content == "final recommendation"
+
+
+def test_token_budget_stops_the_search(llm):
+    tokens = planner.BRANCH_MAX_TOKENS * 2 + planner.SYNTHESIS_MAX_TOKENS
+    budget = SearchBudget(max_llm_calls=100, max_tokens=tokens, max_seconds=30)
+    res = _planner(budget=budget).plan("Plan the rollout", depth=2, width=3, beam=2)
+    assert res.trace["branches"][0] == {
+        "submitted": 3, "admitted": 2, "completed": 2, "cancelled": 0,
+    }
+    assert res.trace["search"]["stop_reason"] == "tokens"
+    assert llm.streams == 2 and llm.completions == 1
+
+
+def test_enough_good_branches_cancel_the_rest(llm):
+    budget = SearchBudget(max_llm_calls=100, max_tokens=100_000, max_seconds=30)
+    started = time.monotonic()
+    got = _planner(budget=budget, enough=2, min_score=1.0)
+    res = got.plan("Plan the rollout", depth=1, width=4, beam=2)
+    assert time.monotonic() - started < 1.5
+    assert res.trace["branches"] == [
+        {"submitted": 4, "admitted": 4, "completed": 2, "cancelled": 2},
+    ]
+    assert [n.content for n in res.explored if n.level == 1] == [GOOD, GOOD]
+
+
+def test_no_call_budget_skips_synthesis(llm):
+    budget = SearchBudget(max_llm_calls=0, max_tokens=100_000, max_seconds=30)
+    res = _planner(budget=budget).plan("Plan the rollout")
+    assert llm.streams == 0 and llm.completions == 0
+    assert res.trace["search"]["stop_reason"] == "llm_calls"
@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+from l0_alignment.matcher import StreamingScanner, sanitize
+from l0_alignment.policy import L0Policy
+
+TEXTS = [
+    "A calm and clean answer with nothing to flag.",
+    "First gather the evidence, then run the migration overnight.",
+    "Never share the API keys or any password with anyone.",
+    "Line one\n\n\tline two \x00 with\x07 control chars and a private key at the end",
+    "harm",
+    "The shell" + " " * 300 + "is far away from here, then destroy.",
+    "word " * 200 + "attack",
+    "   leading and trailing whitespace   ",
+]
+
+
+def _chunks(text, rng):
+    out, i = [], 0
+    while i < len(text):
+        n = rng.randint(1, 12)
+        out.append(text[i:i + n])
+        i += n
+    return out
+
+
+@pytest.fixture(scope="module")
+def policy():
+    return L0Policy()
+
+
+@pytest.mark.parametrize("text", TEXTS)
+@pytest.mark.parametrize("seed", range(5))
+def test_streaming_scan_matches_one_shot_scan(policy, text, seed):
+    scanner = StreamingScanner(policy.ruleset, scope="output")
+    found = []
+    for chunk in _chunks(text, random.Random(seed)):
+        found += scanner.feed(chunk)
+    found += scanner.finish()
+    assert found == policy.ruleset.scan(sanitize(text), scope="output")
+
+
+@pytest.mark.parametrize("text", TEXTS)
+@pytest.mark.parametrize("seed", range(5))
+def test_guard_agrees_with_check_output(policy, text, seed):
+    expected = policy.check_output(text)
+    guard = policy.output_stream()
+    shown = []
+    on_token = guard.stream_to(shown.append)
+    for chunk in _chunks(text, random.Random(seed)):
+        if not on_token(chunk):
+            break
+    decision = guard.close()
+    assert decision.allowed == expected.allowed
+    released = "".join(shown)
+    if expected.allowed:
+        assert released == text
+    else:
+        # Nothing from the first blocked match onwards ever reaches the sink.
+        first = min(m.start for m in expected.matches)
+        assert len(sanitize(released)) <= first
+        assert expected.sanitized.startswith(sanitize(released))
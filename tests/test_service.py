@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from orchestration import service
+from orchestration.service import ServiceBusy, SIAService
+
+
+class _SlowGraph:
+    """Stands in for the compiled graph: one node update, then the final state."""
+    async def astream(self, inputs, stream_mode):
+        await asyncio.sleep(0.05)
+        yield "updates", {"respond": {}}
+        yield "values", {"response": "ok", "trace": {}}
+
+
+@pytest.fixture
+def make_service(monkeypatch):
+    monkeypatch.setattr(service, "get_graph", _SlowGraph)
+
+    def make(max_concurrency, max_queue):
+        return SIAService(max_concurrency=max_concurrency, max_queue=max_queue)
+    return make
+
+
+async def _burst(svc, n):
+    async def one():
+        try:
+            return (await svc.run("What is the status of the project?"))["response"]
+        except ServiceBusy:
+            return "busy"
+    return await asyncio.gather(*(one() for _ in range(n)))
+
+
+@pytest.mark.parametrize("slots, queue, burst, rejected", [
+    (4, 0, 1, 0),   # idle service without a queue still runs a request
+    (8, 2, 6, 0),   # burst fits in the free slots
+    (2, 1, 6, 3),   # 2 running + 1 waiting, the rest rejected
+])
+def test_burst_admission(make_service, slots, queue, burst, rejected):
+    svc = make_service(slots, queue)
+    results = asyncio.run(_burst(svc, burst))
+    assert results.count("busy") == rejected
+    assert results.count("ok") == burst - rejected
+    assert svc.metrics.rejected == rejected
+    assert svc.metrics.queued == 0 and svc.metrics.in_flight == 0
+
+
+def test_has_capacity_counts_running_and_waiting(make_service):
+    svc = make_service(1, 1)
+    assert svc.has_capacity()
+    svc.metrics.in_flight = 1
+    assert svc.has_capacity()
+    svc.metrics.queued = 1
+    assert not svc.has_capacity()
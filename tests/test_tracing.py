@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from sia import tracing
+
+
+@pytest.fixture
+def tracer(monkeypatch):
+    t = tracing.Tracer()
+    monkeypatch.setattr(tracing, "TRACER", t)
+    monkeypatch.setattr(tracing, "_ENABLED", True)
+    return t
+
+
+def _gen():
+    with tracing.span("gen", activate=False):
+        yield 1
+        yield 2
+
+
+def test_closed_generator_is_cancelled_not_error(tracer):
+    g = _gen()
+    next(g)
+    g.close()
+    (s,) = tracer.spans
+    assert s.error is None
+    assert s.attributes["cancelled"] == "GeneratorExit"
+    assert "sia_span_errors_total{" not in tracer.prometheus_text()
+
+
+def test_cancelled_task_is_not_error(tracer):
+    async def work():
+        with tracing.span("task"):
+            await asyncio.sleep(10)
+
+    async def main():
+        t = asyncio.create_task(work())
+        await asyncio.sleep(0)
+        t.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await t
+
+    asyncio.run(main())
+    (s,) = tracer.spans
+    assert s.error is None
+    assert s.attributes["cancelled"] == "CancelledError"
+
+
+def test_exception_marks_error(tracer):
+    with pytest.raises(ValueError):
+        with tracing.span("boom"):
+            raise ValueError("bad")
+    (s,) = tracer.spans
+    assert s.error == "ValueError: bad"
+    assert "cancelled" not in s.attributes
+    assert 'sia_span_errors_total{span="boom"} 1' in tracer.prometheus_text()